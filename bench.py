@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Офлайн-бенчмарки горячих путей: чтение/рендер, .ics, ассеты, хранилище, тайм-зоны.
+
+    python bench.py                         # быстрый прогон, 10k и 100k чатов
+    python bench.py --chats 10000,100000,1000000 --out bench_HEAD.json
+    python bench.py --compare bench_old.json bench_new.json
+
+Результат — JSON: ops/sec, p50/p99 (мкс) по каждому замеру; два файла сравниваются --compare.
+"""
+import os, sys, json, time, random, shutil, asyncio, argparse, platform, tempfile, subprocess
+from datetime import datetime, timedelta
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+import logging
+logging.disable(logging.WARNING)
+
+import misfortune
+from misfortune import read_howl, render_reading, ics_for_year, read_howl_batch, MISFORTUNES
+from storage import JsonStorage, SqliteStorage, WriteBehindStorage
+
+SEED = 20250916
+ZONES = ["+3", "+5", "-4", "+5:30", "Europe/Moscow", "Asia/Almaty", "Asia/Atyrau", "America/New_York"]
+
+# ====== Замер ======
+def measure(fn, args_iter=None, budget: float = 1.0, max_n: int = 200_000, min_n: int = 5) -> dict:
+    """Зовём fn(*args) пока не выйдет budget секунд (но не меньше min_n раз); латентность каждого вызова."""
+    samples = []
+    t_end = time.perf_counter() + budget
+    pc = time.perf_counter_ns
+    while len(samples) < max_n and (len(samples) < min_n or time.perf_counter() < t_end):
+        args = next(args_iter) if args_iter is not None else ()
+        t0 = pc()
+        fn(*args)
+        samples.append(pc() - t0)
+    samples.sort()
+    total = sum(samples) / 1e9
+    q = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))] / 1e3
+    return {"n": len(samples), "ops_per_sec": round(len(samples) / total, 1) if total else None,
+            "p50_us": round(q(0.50), 2), "p99_us": round(q(0.99), 2)}
+
+def _moments(rng: random.Random):
+    base = datetime(2020, 1, 1)
+    while True:
+        yield (base + timedelta(minutes=rng.randrange(10 * 365 * 24 * 60)), rng.randrange(97))
+
+# ====== Синтетические данные ======
+def make_dataset(d: str, n_chats: int, seed: int = SEED):
+    """howls.json (5 воев на чат) и tz.json (у каждого третьего чата) на n_chats чатов."""
+    rng = random.Random(seed)
+    hist, tzs = {}, {}
+    base = datetime(2025, 1, 1)
+    for i in range(n_chats):
+        chat_id = rng.randrange(10**8, 10**10) * (-1 if i % 5 == 0 else 1)
+        items = []
+        for _ in range(5):
+            dt = base + timedelta(minutes=rng.randrange(365 * 24 * 60))
+            items.append({"ts": dt.isoformat(timespec="minutes"), "doom": rng.choice(MISFORTUNES)["code"],
+                          "lvl": rng.randint(1, 5)})
+        hist[str(chat_id)] = items
+        if i % 3 == 0:
+            tzs[str(chat_id)] = rng.choice(ZONES)
+    for name, db in (("howls.json", hist), ("tz.json", tzs)):
+        with open(os.path.join(d, name), "w", encoding="utf-8") as f:
+            json.dump(db, f, ensure_ascii=False, indent=2)
+    return [int(k) for k in hist]
+
+# ====== Наборы ======
+def bench_reading(res: dict, budget: float):
+    rng = random.Random(SEED)
+    res["read_howl"] = measure(read_howl, _moments(rng), budget)
+    readings = ((read_howl(dt, s),) for dt, s in _moments(rng))
+    res["render_reading"] = measure(render_reading, readings, budget)
+    misfortune.enable_reading_table()
+    try:
+        res["read_howl[table]"] = measure(read_howl, _moments(rng), budget)
+        readings = ((read_howl(dt, s),) for dt, s in _moments(rng))
+        res["render_reading[table]"] = measure(render_reading, readings, budget)
+    finally:
+        misfortune.disable_reading_table()
+    year = (datetime(2025, 1, 1), datetime(2026, 1, 1), timedelta(hours=1))
+    res["read_howl_batch[8760h]"] = measure(lambda: read_howl_batch(year, 7), budget=budget, max_n=200)
+    try:
+        from misfortune import read_howl_batch_np
+        import numpy  # noqa: F401
+        res["read_howl_batch_np[8760h]"] = measure(lambda: read_howl_batch_np(year, 7), budget=budget, max_n=2000)
+    except ImportError:
+        pass
+    res["ics_for_year"] = measure(lambda: ics_for_year(2025, 7), budget=budget, max_n=200)
+
+def bench_assets(res: dict, budget: float):
+    import bot
+    codes = [m["code"] for m in MISFORTUNES] + ["missing_code"]
+    it = ((c,) for c in iter(lambda: random.choice(codes), None))
+    bot._assets().reload()
+    res["pick_doom_image"] = measure(bot.pick_doom_image, it, budget)
+    bot.PACK = bot._open_pack()
+    if bot.PACK is not None:
+        res["doom_image[pack]"] = measure(bot.doom_image, it, budget)
+
+def bench_storage(res: dict, budget: float, chat_counts):
+    import bot
+    for n in chat_counts:
+        d = tempfile.mkdtemp(prefix=f"howl_bench_{n}_")
+        try:
+            chats = make_dataset(d, n)
+            rng = random.Random(SEED)
+            pick = lambda: (rng.choice(chats),)
+            entry = {"ts": "2025-09-16T12:00", "doom": "fire", "lvl": 3}
+            # JSON целиком на каждую запись — медленно на больших n, ограничиваем число прогонов
+            js = JsonStorage(os.path.join(d, "howls.json"), os.path.join(d, "tz.json"))
+            cap = 200 if n <= 100_000 else 5
+            res[f"json.history[{n}]"] = measure(js.history, iter(pick, None), budget, max_n=cap)
+            res[f"json.append_history[{n}]"] = measure(lambda c: js.append_history(c, entry),
+                                                       iter(pick, None), budget, max_n=cap)
+            sq = SqliteStorage(os.path.join(d, "howls.db"))
+            t0 = time.perf_counter()
+            sq.migrate_from_json(js.data_file, js.tz_file)
+            res[f"sqlite.migrate[{n}]"] = {"n": 1, "seconds": round(time.perf_counter() - t0, 3)}
+            res[f"sqlite.history[{n}]"] = measure(sq.history, iter(pick, None), budget)
+            res[f"sqlite.append_history[{n}]"] = measure(lambda c: sq.append_history(c, entry),
+                                                         iter(pick, None), budget, max_n=20_000)
+            wb = WriteBehindStorage(sq, interval=3600, max_dirty=10**9)
+            res[f"write_behind.append_history[{n}]"] = measure(lambda c: wb.append_history(c, entry),
+                                                               iter(pick, None), budget)
+            res[f"write_behind.history[{n}]"] = measure(wb.history, iter(pick, None), budget)
+            ring = wb._hist
+            res[f"history_ring.bytes[{n}]"] = {"n": len(ring), "arena": len(ring._buf),
+                                               "dumps": len(ring.dumps()),
+                                               "json": len(json.dumps(ring.to_json(), ensure_ascii=False))}
+            dirty = wb.dirty
+            t0 = time.perf_counter()
+            asyncio.run(wb.flush())
+            res[f"write_behind.flush[{n}]"] = {"n": 1, "dirty": dirty, "seconds": round(time.perf_counter() - t0, 3)}
+            # бот целиком: _record / _get_user_tzinfo поверх SQLite
+            bot.STORE = sq
+            bot._TZ_BY_CHAT.clear(); bot._TZ_BY_NAME.clear()
+            now = datetime(2025, 9, 16, 12, 0)
+            res[f"bot._record[sqlite,{n}]"] = measure(lambda c: bot._record(c, now, "fire", 3),
+                                                      iter(pick, None), budget, max_n=20_000)
+            res[f"bot._get_user_tzinfo[cold,{n}]"] = measure(
+                lambda c: (bot._TZ_BY_CHAT.pop(c, None), bot._get_user_tzinfo(c)), iter(pick, None), budget)
+            res[f"bot._get_user_tzinfo[warm,{n}]"] = measure(bot._get_user_tzinfo, iter(pick, None), budget)
+            bot.STORE = None
+            sq.close()
+        finally:
+            shutil.rmtree(d, ignore_errors=True)
+
+# ====== Запуск / сравнение ======
+def _meta() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        rev = ""
+    return {"commit": rev, "python": platform.python_version(), "machine": platform.machine(),
+            "when": datetime.now().isoformat(timespec="seconds")}
+
+def compare(old_path: str, new_path: str):
+    with open(old_path, encoding="utf-8") as f: old = json.load(f)
+    with open(new_path, encoding="utf-8") as f: new = json.load(f)
+    print(f"{'case':48} {'old ops/s':>12} {'new ops/s':>12} {'x':>7} {'old p99':>10} {'new p99':>10}")
+    for name in sorted(set(old["results"]) | set(new["results"])):
+        a, b = old["results"].get(name, {}), new["results"].get(name, {})
+        oa, ob = a.get("ops_per_sec"), b.get("ops_per_sec")
+        ratio = f"{ob / oa:7.2f}" if oa and ob else "      -"
+        print(f"{name:48} {oa or '-':>12} {ob or '-':>12} {ratio} {a.get('p99_us', '-'):>10} {b.get('p99_us', '-'):>10}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chats", default="10000,100000", help="размеры синтетических наборов через запятую")
+    ap.add_argument("--budget", type=float, default=1.0, help="секунд на один замер")
+    ap.add_argument("--only", choices=["reading", "assets", "storage"], action="append")
+    ap.add_argument("--out", default="bench.json")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = ap.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+    out = os.path.abspath(args.out)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))  # assets/ ищем относительно репозитория
+    random.seed(SEED)
+    res = {}
+    groups = args.only or ["reading", "assets", "storage"]
+    if "reading" in groups:
+        bench_reading(res, args.budget)
+    if "assets" in groups:
+        bench_assets(res, args.budget)
+    if "storage" in groups:
+        bench_storage(res, args.budget, [int(x) for x in args.chats.split(",") if x])
+    for name, r in res.items():
+        print(f"{name:48} " + "  ".join(f"{k}={v}" for k, v in r.items()))
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"meta": _meta(), "results": res}, f, ensure_ascii=False, indent=2)
+    print(f"saved {out}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,33 @@
 # -*- coding: utf-8 -*-
-import os, json, logging, glob, zipfile
-from pathlib import Path
-from datetime import datetime, timezone, timedelta
+import time
+_T0 = time.perf_counter()  # отсюда считаем холодный старт
+import os, sys, logging, hashlib, asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta, tzinfo
 from zoneinfo import ZoneInfo
 
 from telegram import (
-    Update, InlineKeyboardMarkup, InlineKeyboardButton, ForceReply, BotCommand
+    Update, InlineKeyboardMarkup, InlineKeyboardButton, ForceReply, BotCommand,
+    InlineQueryResultArticle, InlineQueryResultCachedPhoto, InputTextMessageContent
 )
-from telegram.constants import ParseMode
+from telegram.constants import ChatType, ParseMode
+from telegram.error import RetryAfter, Forbidden
 from telegram.ext import (
     Application, CommandHandler, ContextTypes, Defaults,
-    CallbackQueryHandler, MessageHandler, filters
+    CallbackQueryHandler, MessageHandler, TypeHandler, InlineQueryHandler, filters, BaseUpdateProcessor
 )
 
+from media import MediaCache, AssetIndex, MediaManifest, AssetPack
+from storage import open_storage, WriteBehindStorage
+# web (tornado-сервер, ICS), outbox и broadcast грузятся там, где нужны: в build_application()/main() и на отправке
+from stats import HowlStats, format_tally, slot_keys, tally_from_slots, DAYS_KEEP
+from moments import parse_moment
+from metrics import REGISTRY, STORAGE_SECONDS, ASSET_SECONDS, MEDIA_PATH, StartupTimer, instrument
+import snapshot
+import misfortune
+
 # ---- твоя логика гаданий ----
-from misfortune import read_howl, render_reading
+from misfortune import read_howl, render_reading, ics_for_year, BRANCHES, render_forecast_days, render_forecast_hours
 try:
     from misfortune import MISFORTUNES
 except Exception:
@@ -24,58 +37,122 @@ try:
 except Exception:
     ensure_icons = None
     icon_filename = None
+try:
+    from misfortune import enable_reading_table, ReadingTable
+except Exception:
+    enable_reading_table = ReadingTable = None
+
+STARTUP = StartupTimer(_T0)
+STARTUP.add("import", time.perf_counter() - _T0)
 
 # ===== Настройки (дефолт для тех, кто не задал свою TZ) =====
 TIMEZONE_OFFSET_HOURS = 3
+TZ_CACHE_SIZE = int(os.getenv("TZ_CACHE_SIZE", "50000"))  # сколько чатов держим в LRU тайм-зон
 ASSETS_DIR = os.getenv("ASSETS_DIR", "assets")
+WEBHOOK_BASE = os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL")
+ICS_YEARS = int(os.getenv("ICS_YEARS", "2"))              # сколько лет отдаёт /ics/<token>.ics
+ICS_CACHE_SIZE = int(os.getenv("ICS_CACHE_SIZE", "32"))   # сколько готовых фидов держим в памяти
+SUBSCRIBE_DEFAULT_HOUR = 9                                  # /subscribe без аргумента
+FORECAST_MAX_DAYS = 30                                      # /forecast N: больше не влезет в одно сообщение
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "4096"))  # готовых ответов inline (соль, тайм-зона, час)
+AWAIT_TTL = float(os.getenv("AWAIT_TTL", "600"))  # сколько секунд после «Ввести момент» ждём дату от пользователя
+AWAIT_MAX = 100_000                                # больше ожидающих не держим — самые старые забываем
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "16"))
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))  # 1 — по одному апдейту, как раньше
+# общая очередь исходящих: лимиты Telegram, повторы; 0 — слать напрямую, как раньше
+OUTBOX = os.getenv("OUTBOX", "1") == "1"
+OUTBOX_MAX = int(os.getenv("OUTBOX_MAX", "1000"))           # сколько запросов может ждать, дальше — отказ
+OUTBOX_COALESCE = os.getenv("OUTBOX_COALESCE", "1") == "1"  # из повторных «Гадать сейчас» в очереди уйдёт последний
+OUTBOX_STALE = float(os.getenv("OUTBOX_STALE", "30"))       # «Гадать сейчас», прождавшее дольше, не отправляем
+LIMITER = None  # OutboundLimiter; создаётся в build_application() при OUTBOX
+# несколько процессов за одним вебхуком (нужен STORAGE=sqlite): апдейты делятся по update_id, рассылает лидер
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+LEASE_TTL = 90.0  # секунд; лидер продлевает аренду каждую минуту
+# таблица всех чтений: "1" — собрать в памяти, путь — грузить/сохранять снапшот
+READING_TABLE = os.getenv("HOWL_TABLE", "")
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
 DATA_FILE = "howls.json"   # история 5 последних на чат
 TZ_FILE   = "tz.json"      # персональные тайм-зоны
+STORAGE   = os.getenv("STORAGE", "json")  # "json", "ring[:howls.ring]" или "sqlite[:howls.db]"
+# отложенная запись состояния: сброс раз в N секунд или при M грязных чатах; 0 — писать сразу
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "5"))
+STATE_FLUSH_DIRTY    = int(os.getenv("STATE_FLUSH_DIRTY", "200"))
+MEDIA_CACHE_FILE = os.getenv("MEDIA_CACHE_FILE", "media_cache.json")  # file_id уже загруженных картинок
+MEDIA_SAVE_INTERVAL = float(os.getenv("MEDIA_SAVE_INTERVAL", "30"))  # как часто дописывать новые file_id в файл
+# сжатые картинки от media_build.py; вариант "photo" (меньший из jpeg/png), "jpeg", "png" или "webp"
+MEDIA_MANIFEST = os.getenv("MEDIA_MANIFEST", "assets_built/manifest.json")
+MEDIA_VARIANT  = os.getenv("MEDIA_VARIANT", "photo")
+# все картинки, welcome и иконки одним файлом (тоже media_build.py), читается через mmap; пусто — не брать
+MEDIA_PACK     = os.getenv("MEDIA_PACK", "assets_built/assets.pack")
+# карточки чтений (нужен Pillow): HOWL_CARDS=1; сколько файлов держать и сколько процессов рисуют
+HOWL_CARDS = os.getenv("HOWL_CARDS", "") == "1"
+CARD_DIR = os.getenv("CARD_DIR", "cards")
+CARD_FILES = int(os.getenv("CARD_FILES", "5000"))
+CARD_WORKERS = int(os.getenv("CARD_WORKERS", "2"))
+# прогретые кэши одним файлом (индекс ассетов, манифест, хэши картинок, иконки, таблица); "" — выключено
+SNAPSHOT_FILE = os.getenv("HOWL_SNAPSHOT", "warm.snap")
+# счётчики для /stats: файл и как часто его переписывать (сек); общую статистику видят HOWL_ADMINS (id через запятую)
+STATS_FILE = os.getenv("HOWL_STATS", "stats.snap")
+STATS_SAVE_INTERVAL = float(os.getenv("STATS_SAVE_INTERVAL", "300"))
+ADMINS = {int(x) for x in os.getenv("HOWL_ADMINS", "").replace(" ", "").split(",") if x}
+
+MEDIA = MediaCache(MEDIA_CACHE_FILE)
+ASSETS: AssetIndex | None = None  # строится лениво, в main() — заново после ensure_assets_dir()
+MANIFEST: MediaManifest | None = None
+PACK: AssetPack | None = None  # открывается в main()/prepare(); что есть в паке, с диска не читаем
+CARDS = None  # CardCache; включается в prepare() при HOWL_CARDS=1 (cards тянет multiprocessing)
+ICONS: dict[str, tuple[bytes, str]] = {}  # py ветви -> (PNG, sha1); заполняет _warm_icons() при старте
+STATS = HowlStats()  # prepare() подменяет сохранённой
+SHARED_STATE = False  # WEB_WORKERS > 1: счётчики и file_id в общей базе, а не в памяти воркера
 
 # ====== Хранение истории ======
-def _load_data():
-    if not os.path.exists(DATA_FILE):
-        return {}
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+STORE = None  # открывается лениво: JSON по умолчанию, SQLite по STORAGE=sqlite
 
-def _save_data(db):
-    tmp = DATA_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, DATA_FILE)
+def _store():
+    global STORE
+    if STORE is None:
+        STORE = open_storage(STORAGE, DATA_FILE, TZ_FILE)
+        if STATE_FLUSH_INTERVAL > 0:
+            STORE = WriteBehindStorage(STORE, STATE_FLUSH_INTERVAL, STATE_FLUSH_DIRTY)
+    return STORE
 
 def _record(chat_id: int, dt: datetime, doom_code: str, level: int):
-    db = _load_data()
-    key = str(chat_id)
-    db.setdefault(key, []).append({"ts": dt.isoformat(timespec="minutes"), "doom": doom_code, "lvl": level})
-    db[key] = db[key][-5:]
-    _save_data(db)
+    with STORAGE_SECONDS.time(op="append_history"):
+        _store().append_history(chat_id, {"ts": dt.isoformat(timespec="minutes"), "doom": doom_code, "lvl": level})
+    today = datetime.now(timezone.utc).date()
+    if SHARED_STATE:
+        with STORAGE_SECONDS.time(op="add_stats"):
+            _store().add_stats(chat_id, slot_keys(doom_code, level, dt.hour), today.toordinal(), DAYS_KEEP)
+    else:
+        STATS.record(chat_id, doom_code, level, dt.hour, today)
+
+async def _save_stats():
+    """Снять счётчики (в event loop — пока их никто не меняет) и записать файл в потоке."""
+    parts = {"stats": STATS.dumps()}
+    STATS.changed = False
+    await asyncio.to_thread(snapshot.save, STATS_FILE, parts)
+
+async def _media_saver():
+    while True:
+        await asyncio.sleep(MEDIA_SAVE_INTERVAL)
+        await MEDIA.save()
+
+async def _stats_saver():
+    while True:
+        await asyncio.sleep(STATS_SAVE_INTERVAL)
+        if STATS.changed:
+            try:
+                await _save_stats()
+            except Exception as e:
+                STATS.changed = True
+                logging.warning("stats not saved: %s", e)
 
 def _salt(chat_id: int) -> int:
     return abs(chat_id) % 97
 
 # ====== Персональные тайм-зоны ======
-def _load_tz_db():
-    if not os.path.exists(TZ_FILE):
-        return {}
-    try:
-        with open(TZ_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
-def _save_tz_db(db):
-    tmp = TZ_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, TZ_FILE)
-
 def _parse_tz(s: str):
     s = s.strip()
     if s.startswith(("+", "-")):
@@ -89,21 +166,49 @@ def _parse_tz(s: str):
         return timezone(sign * timedelta(hours=hh, minutes=mm))
     return ZoneInfo(s)
 
+# разобранные tzinfo: один объект на строку зоны (None — строка битая, уже сообщили в лог);
+# только растёт, get/setdefault атомарны — его читает и поток сборки рассылки
+_TZ_BY_NAME: dict[str, tzinfo | None] = {}
+# chat_id -> tzinfo для дефолтного fallback, ограниченный LRU
+_TZ_BY_CHAT: OrderedDict[int, tzinfo] = OrderedDict()
+_DEFAULT_TZ = timezone(timedelta(hours=TIMEZONE_OFFSET_HOURS))
+
+def _tz_from_string(raw: str) -> tzinfo | None:
+    tz = _TZ_BY_NAME.get(raw, ...)
+    if tz is not ...:
+        return tz
+    try:
+        tz = _parse_tz(raw)
+    except Exception as e:
+        logging.warning("bad stored time zone %r, using default: %s", raw, e)
+        tz = None
+    return _TZ_BY_NAME.setdefault(raw, tz)
+
+def _zone(raw: str | None) -> tzinfo:
+    """tzinfo по сохранённой строке; нет или битая — TIMEZONE_OFFSET_HOURS. LRU по чатам не трогает."""
+    return (raw and _tz_from_string(raw)) or _DEFAULT_TZ
+
 def _set_user_tz(chat_id: int, tz_input: str) -> str:
-    db = _load_tz_db()
-    db[str(chat_id)] = tz_input.strip()
-    _save_tz_db(db)
+    with STORAGE_SECONDS.time(op="set_tz"):
+        _store().set_tz(chat_id, tz_input.strip())
+    _TZ_BY_CHAT.pop(chat_id, None)
     return tz_input.strip()
 
 def _get_user_tzinfo(chat_id: int, fallback_hours: int = TIMEZONE_OFFSET_HOURS):
-    db = _load_tz_db()
-    raw = db.get(str(chat_id))
-    if not raw:
-        return timezone(timedelta(hours=fallback_hours))
-    try:
-        return _parse_tz(raw)
-    except Exception:
-        return timezone(timedelta(hours=fallback_hours))
+    if fallback_hours != TIMEZONE_OFFSET_HOURS:
+        raw = _store().get_tz(chat_id)
+        return (raw and _tz_from_string(raw)) or timezone(timedelta(hours=fallback_hours))
+    tz = _TZ_BY_CHAT.get(chat_id)
+    if tz is not None:
+        _TZ_BY_CHAT.move_to_end(chat_id)
+        return tz
+    with STORAGE_SECONDS.time(op="get_tz"):
+        raw = _store().get_tz(chat_id)
+    tz = _zone(raw)
+    _TZ_BY_CHAT[chat_id] = tz
+    if len(_TZ_BY_CHAT) > TZ_CACHE_SIZE:
+        _TZ_BY_CHAT.popitem(last=False)
+    return tz
 
 # ====== Работа с ассетами ======
 def ensure_assets_dir():
@@ -111,6 +216,7 @@ def ensure_assets_dir():
     d = ASSETS_DIR
     if os.path.isdir(d):
         return
+    import zipfile  # нужен только при первом развёртывании из архива
     zips = [p for p in os.listdir(".") if p.lower().endswith(".zip")]
     for z in zips:
         try:
@@ -132,61 +238,134 @@ def ensure_assets_dir():
     if not os.path.isdir(d):
         logging.warning("assets dir not found: %s", d)
 
+def _assets() -> AssetIndex:
+    global ASSETS
+    if ASSETS is None:
+        ASSETS = AssetIndex(ASSETS_DIR)
+    return ASSETS
+
+def _manifest() -> MediaManifest:
+    global MANIFEST
+    if MANIFEST is None:
+        MANIFEST = MediaManifest(MEDIA_MANIFEST, MEDIA_VARIANT)
+    return MANIFEST
+
+def _open_pack(state: dict | None = None) -> AssetPack | None:
+    if not MEDIA_PACK or not os.path.exists(MEDIA_PACK):
+        return None
+    try:
+        pack = AssetPack(MEDIA_PACK, state)
+    except (OSError, ValueError) as e:
+        logging.warning("asset pack %s unreadable: %s", MEDIA_PACK, e)
+        return None
+    if pack.variant != MEDIA_VARIANT:
+        logging.warning("asset pack %s holds %s, not %s: not used", MEDIA_PACK, pack.variant, MEDIA_VARIANT)
+        return None
+    return pack
+
+def _pack_complete() -> bool:
+    """В паке есть картинки всех несчастий — каталог assets/ (и распаковка zip) не нужен."""
+    return PACK is not None and bool(MISFORTUNES) and not PACK.missing([m["code"] for m in MISFORTUNES])
+
+def doom_image(code: str):
+    """(путь или имя в паке, данные, sha1): из пака — срез memoryview, иначе файл (данные и sha1 — None)."""
+    if PACK is not None:
+        with ASSET_SECONDS.time():
+            hit = PACK.get(code)
+        if hit:
+            return hit
+    return pick_doom_image(code), None, None
+
+def _branch_icon(py: str):
+    """(имя, данные, sha1) иконки ветви: из пака или дорисованная в ICONS; None — нет."""
+    icon = PACK.get(f"icon:{py}") if PACK is not None else None
+    if icon is None and py in ICONS:
+        icon = (icon_filename(py),) + ICONS[py]
+    return icon
+
 def pick_doom_image(code: str) -> str | None:
-    """Ищем assets/<code>.(png|jpg|jpeg|webp), а также <code>_*.ext, <code>-*.ext, любой регистр."""
-    base = code.lower()
-    d = ASSETS_DIR
-    if not os.path.isdir(d):
-        logging.warning("assets dir not found: %s", d)
+    """Сначала сжатая картинка из манифеста; иначе assets/<code>.(png|jpg|jpeg|webp),
+    а также <code>_*.ext, <code>-*.ext, любой регистр — по индексу."""
+    with ASSET_SECONDS.time():
+        p = _manifest().get(code)
+    if p:
+        return p
+    idx = _assets()
+    if not idx.exists:
+        logging.warning("assets dir not found: %s", ASSETS_DIR)
         return None
-    exts = ["png", "jpg", "jpeg", "webp"]
-    patterns = []
-    for ext in exts:
-        patterns += [
-            os.path.join(d, f"{base}.{ext}"),
-            os.path.join(d, f"{base}_*.{ext}"),
-            os.path.join(d, f"{base}-*.{ext}"),
-            os.path.join(d, f"{base}.{ext.upper()}"),
-            os.path.join(d, f"{base}_*.{ext.upper()}"),
-            os.path.join(d, f"{base}-*.{ext.upper()}"),
-        ]
-    found = []
-    for pat in patterns:
-        found += glob.glob(pat)
-    if found:
-        found.sort()
-        logging.info("picked doom image for %s: %s", code, found[0])
-        return found[0]
-    for p in sorted(Path(d).iterdir()):
-        if p.is_file():
-            stem = p.stem.lower()
-            if stem == base or stem.startswith(base + "_") or stem.startswith(base + "-"):
-                logging.info("fallback picked doom image for %s: %s", code, p)
-                return str(p)
-    logging.warning("no doom image for code=%s", code)
-    return None
-
-async def send_with_media(message, text_html: str, doom_code: str, branch_py: str):
+    with ASSET_SECONDS.time():
+        p = idx.get(code)
+    if not p:
+        logging.warning("no doom image for code=%s", code)
+    return p
+
+async def send_with_media(message, text_html: str, doom_code: str, branch_py: str, strict: bool = False,
+                          reading=None):
+    """strict=True: RetryAfter/Forbidden не глотаем (рассылка сама повторит или отпишет чат).
+    OutboxDropped (запрос сняла очередь исходящих) — тоже наружу: запасные варианты уже не нужны."""
+    from outbox import OutboxDropped
+    p, data, digest = doom_image(doom_code)
+    # 0) карточка чтения поверх арта (Pillow в пуле процессов читает файл: имя из пака — путь в assets_built/)
+    if CARDS is not None and reading is not None:
+        try:
+            card = await CARDS.get(reading, p)
+            await MEDIA.reply_photo(message, card, caption=text_html, parse_mode=ParseMode.HTML)
+            MEDIA_PATH.inc(path="card")
+            return
+        except Exception as e:
+            if isinstance(e, OutboxDropped) or strict and isinstance(e, (RetryAfter, Forbidden)):
+                raise
+            logging.warning("failed to send reading card: %s", e)
     # 1) арт категории
-    p = pick_doom_image(doom_code)
-    if p and os.path.exists(p):
+    if p:
         try:
-            await message.reply_photo(photo=open(p, "rb"), caption=text_html, parse_mode=ParseMode.HTML)
+            await MEDIA.reply_photo(message, p, data=data, digest=digest, caption=text_html, parse_mode=ParseMode.HTML)
+            MEDIA_PATH.inc(path="art")
             return
         except Exception as e:
+            if isinstance(e, OutboxDropped) or strict and isinstance(e, (RetryAfter, Forbidden)):
+                raise
             logging.warning("failed to send category art %s: %s", p, e)
-    # 2) иконка ветви (если поддерживается твоим misfortune.py)
-    if ensure_icons and icon_filename:
+    # 2) иконка ветви (если поддерживается твоим misfortune.py) — уже в памяти
+    icon = _branch_icon(branch_py)
+    if icon:
         try:
-            ensure_icons()
-            ipath = icon_filename(branch_py)
-            if os.path.exists(ipath):
-                await message.reply_photo(photo=open(ipath, "rb"), caption=text_html, parse_mode=ParseMode.HTML)
-                return
+            await MEDIA.reply_photo(message, icon[0], data=icon[1], digest=icon[2],
+                                    caption=text_html, parse_mode=ParseMode.HTML)
+            MEDIA_PATH.inc(path="icon")
+            return
         except Exception as e:
+            if isinstance(e, OutboxDropped) or strict and isinstance(e, (RetryAfter, Forbidden)):
+                raise
             logging.warning("failed to send branch icon: %s", e)
     # 3) текст
     await message.reply_text(text_html, parse_mode=ParseMode.HTML)
+    MEDIA_PATH.inc(path="text")
+
+def _load_icons() -> dict:
+    """Дорисовать недостающие иконки и прочитать все в память. Блокирующее — звать в потоке."""
+    ensure_icons()
+    out = {}
+    for _, py, _ in BRANCHES:
+        p = icon_filename(py)
+        if os.path.exists(p):
+            with open(p, "rb") as f:
+                data = f.read()
+            out[py] = (data, hashlib.sha1(data).hexdigest())
+    return out
+
+def _icons_packed() -> bool:
+    return PACK is not None and not PACK.missing([f"icon:{py}" for _, py, _ in BRANCHES])
+
+async def _warm_icons():
+    if not (ensure_icons and icon_filename) or _icons_packed():
+        return
+    try:
+        ICONS.update(await asyncio.to_thread(_load_icons))
+    except Exception as e:
+        logging.warning("branch icons not loaded: %s", e)
+    logging.info("branch icons: %d in memory", len(ICONS))
 
 # ====== Команды ======
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -211,10 +390,11 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("⚙️ Тайм-зона (помощь)", callback_data="help_tz")],
     ])
 
-    welcome = "welcome.png"
-    if os.path.exists(welcome):
-        await update.message.reply_photo(
-            photo=open(welcome, "rb"),
+    packed = PACK.get("welcome") if PACK is not None else None
+    welcome, data, digest = packed or (_manifest().get("welcome") or "welcome.png", None, None)
+    if data is not None or os.path.exists(welcome):
+        await MEDIA.reply_photo(
+            update.message, welcome, data=data, digest=digest,
             caption=caption,
             reply_markup=kb,
             parse_mode=ParseMode.HTML
@@ -229,9 +409,13 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (
         "<b>Доступные команды</b>\n\n"
         "🔮 <b>/howl</b> [YYYY-MM-DD HH:MM] — гадать по моменту (если без аргументов — «сейчас»)\n"
+        "📆 <b>/week</b> — несчастья на неделю вперёд, <b>/forecast</b> [N] — на ближайшие сутки по часам или на N дней\n"
         "🧾 <b>/last</b> — последние 5 воев\n"
+        "📊 <b>/stats</b> — какие несчастья, уровни и часы выпадали в этом чате\n"
         "⚙️ <b>/settz</b> [+N | Region/City] — установить тайм-зону\n"
         "📍 <b>/tz</b> — показать текущую тайм-зону и локальное время\n"
+        "🔔 <b>/subscribe</b> [ЧЧ] — несчастье каждый день в этот час, <b>/unsubscribe</b> — отписка\n"
+        "📅 <b>/ics</b> [YYYY] — календарь несчастий (.ics) и ссылка на подписку\n"
         "🛠️ <b>/diag</b> — диагностика ассетов\n"
     )
 
@@ -260,6 +444,8 @@ async def cmd_settz(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         _ = _parse_tz(arg)  # проверяем
         saved = _set_user_tz(update.effective_chat.id, arg)
+        if BROADCAST:
+            BROADCAST.update(update.effective_chat.id)
         await update.message.reply_text(f"Тайм-зона сохранена: <code>{saved}</code>", parse_mode=ParseMode.HTML)
     except Exception as e:
         await update.message.reply_text(f"Не понял тайм-зону: <code>{arg}</code>\nОшибка: {e}", parse_mode=ParseMode.HTML)
@@ -274,55 +460,160 @@ async def cmd_tz(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_last(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    items = _load_data().get(str(chat_id), [])
+    with STORAGE_SECONDS.time(op="history"):
+        items = _store().history(chat_id)
     if not items:
         await update.message.reply_text("Пока пусто. Нажми «Гадать сейчас» или пришли момент.")
         return
     lines = [f"#{len(items)-i}. {it['ts']} — {it['doom']} (ур. {it['lvl']})" for i, it in enumerate(reversed(items))]
     await update.message.reply_text("<b>Пять последних воев</b>\n" + "\n".join(lines), parse_mode=ParseMode.HTML)
 
+async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    today = datetime.now(timezone.utc).date()
+    if context.args and context.args[0] == "all":
+        if update.effective_user is None or update.effective_user.id not in ADMINS:
+            await update.message.reply_text("Общая статистика — только для админов бота.")
+            return
+        if SHARED_STATE:
+            t, chats = tally_from_slots(*(_store().stats(0) or ({}, {}))), _store().stats_chats()
+        else:
+            t, chats = STATS.all, len(STATS)
+        text = format_tally(t, "Статистика бота", today) + f"\nЧатов со статистикой: {chats}"
+    else:
+        if SHARED_STATE:
+            saved = _store().stats(update.effective_chat.id)
+            t = tally_from_slots(*saved) if saved else None
+        else:
+            t = STATS.chat(update.effective_chat.id)
+        if t is None:
+            await update.message.reply_text("Пока пусто. Нажми «Гадать сейчас» или пришли момент.")
+            return
+        text = format_tally(t, "Статистика чата", today)
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+
 async def cmd_howl(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     salt = _salt(chat_id)
     user_tz = _get_user_tzinfo(chat_id)
 
     if context.args:
-        try:
-            if len(context.args) == 1:
-                dt = datetime.strptime(context.args[0], "%Y-%m-%d")
-            else:
-                dt = datetime.strptime(context.args[0] + " " + context.args[1], "%Y-%m-%d %H:%M")
-        except Exception:
-            await update.message.reply_text("Формат: /howl YYYY-MM-DD [HH:MM]")
+        dt = parse_moment(" ".join(context.args), datetime.now(tz=user_tz).replace(tzinfo=None))
+        if dt is None:
+            await update.message.reply_text(f"Формат: /howl YYYY-MM-DD [HH:MM]\n{MOMENT_EXAMPLES}")
             return
     else:
         dt = update.message.date.astimezone(user_tz).replace(tzinfo=None)
 
     r = read_howl(dt, salt=salt)
-    await send_with_media(update.message, render_reading(r), r.doom["code"], r.branch_tuple[1])
+    await send_with_media(update.message, render_reading(r), r.doom["code"], r.branch_tuple[1], reading=r)
     _record(chat_id, dt, r.doom["code"], r.doom_level)
 
+async def cmd_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    today = datetime.now(tz=_get_user_tzinfo(chat_id)).date()
+    await update.message.reply_text(render_forecast_days(today, 7, _salt(chat_id)), parse_mode=ParseMode.HTML)
+
+async def cmd_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/forecast — ближайшие сутки по двухчасовым ветвям, /forecast N — N дней."""
+    chat_id = update.effective_chat.id
+    now = datetime.now(tz=_get_user_tzinfo(chat_id)).replace(tzinfo=None)
+    if not context.args:
+        await update.message.reply_text(render_forecast_hours(now, _salt(chat_id)), parse_mode=ParseMode.HTML)
+        return
+    try:
+        days = int(context.args[0])
+        if not 1 <= days <= FORECAST_MAX_DAYS:
+            raise ValueError(days)
+    except ValueError:
+        await update.message.reply_text(f"Формат: /forecast [N] — N дней, 1–{FORECAST_MAX_DAYS}; без N — ближайшие сутки")
+        return
+    await update.message.reply_text(render_forecast_days(now.date(), days, _salt(chat_id)), parse_mode=ParseMode.HTML)
+
 async def cmd_diag(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lines = [f"<b>Проверка ассетов</b> (каталог: <code>{ASSETS_DIR}</code>)"]
-    if not os.path.isdir(ASSETS_DIR):
+    man = _manifest()
+    lines.append(f"Сжатых картинок ({man.variant}): {len(man)}"
+                 + (f", устарели: {', '.join(man.stale)}" if man.stale else ""))
+    if PACK is not None:
+        lines.append(f"Пак <code>{MEDIA_PACK}</code>: {len(PACK)} картинок, {PACK.size // 1024} КБ"
+                     + ("" if _pack_complete() else " (не все несчастья — остальные из каталога)")
+                     + (f", устарели: {', '.join(PACK.stale)}" if PACK.stale else ""))
+    idx = _assets()
+    if not idx.exists and not _pack_complete():
         await update.message.reply_text("\n".join(lines + ["Каталог не найден. Положи картинки в папку assets/ в корне."]),
                                         parse_mode=ParseMode.HTML)
         return
     if MISFORTUNES:
-        miss = []; ok = 0
-        for m in MISFORTUNES:
-            code = m.get("code", "").lower().strip()
-            p = pick_doom_image(code)
-            if p and os.path.exists(p): ok += 1
-            else: miss.append(code)
-        lines.append(f"Найдено картинок: <b>{ok}</b> / {len(MISFORTUNES)}")
+        miss = [c for c in idx.missing([m.get("code", "").lower().strip() for m in MISFORTUNES])
+                if PACK is None or c not in PACK]
+        lines.append(f"Найдено картинок: <b>{len(MISFORTUNES) - len(miss)}</b> / {len(MISFORTUNES)}")
         if miss:
             lines.append("Нет файлов для: " + ", ".join(miss))
     else:
-        files = sorted([p.name for p in Path(ASSETS_DIR).glob("*") if p.is_file()])[:12]
+        files = idx.names()[:12]
         lines.append("Примеры файлов: " + (", ".join(files) if files else "пусто"))
+    st = MEDIA.stats()
+    lines.append(f"Кэш file_id: {st['entries']} шт., попаданий {st['hits']}, загрузок {st['misses']}")
+    lines.append(f"Старт: {STARTUP.report()}")
+    if CARDS is not None:
+        cs = CARDS.stats()
+        lines.append(f"Карточки: {cs['files']} файлов, попаданий {cs['hits']}, нарисовано {cs['renders']}")
     await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
 
+FEEDS = None  # IcsFeeds; создаётся в build_application(), когда известен токен
+
+def _chat_profile(chat_id: int):
+    """(соль, tzinfo, строка тайм-зоны или None) — всё, от чего зависит чтение чата."""
+    return _salt(chat_id), _get_user_tzinfo(chat_id), _store().get_tz(chat_id)
+
+async def cmd_ics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    try:
+        year = int(context.args[0]) if context.args else datetime.now(tz=_get_user_tzinfo(chat_id)).year
+    except ValueError:
+        await update.message.reply_text("Формат: /ics [YYYY]")
+        return
+    caption = f"Календарь несчастий на {year}"
+    if FEEDS and WEBHOOK_BASE:
+        url = f"{WEBHOOK_BASE.rstrip('/')}/ics/{FEEDS.token(chat_id)}.ics"
+        caption += f"\nПодписка (обновляется сама): <code>{url}</code>"
+    await update.message.reply_document(
+        document=ics_for_year(year, _salt(chat_id)).encode("utf-8"),
+        filename=f"howl_{year}.ics",
+        caption=caption,
+        parse_mode=ParseMode.HTML,
+    )
+
+# ====== Ежедневная рассылка ======
+BROADCAST = None  # DailyBroadcast; создаётся в build_application()
+
+def _drop_subscriber(chat_id: int):
+    _store().set_subscription(chat_id, None)
+    if BROADCAST:
+        BROADCAST.update(chat_id, None)
+
+async def cmd_subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        hour = int(context.args[0].split(":")[0]) if context.args else SUBSCRIBE_DEFAULT_HOUR
+        if not 0 <= hour <= 23:
+            raise ValueError(hour)
+    except ValueError:
+        await update.message.reply_text("Формат: /subscribe [ЧЧ] — час по вашей тайм-зоне, 0–23")
+        return
+    chat_id = update.effective_chat.id
+    _store().set_subscription(chat_id, hour)
+    if BROADCAST:
+        BROADCAST.update(chat_id, hour)
+    await update.message.reply_text(
+        f"Буду присылать несчастье каждый день в <b>{hour:02d}:00</b> ({_get_user_tzinfo(chat_id)}).\n"
+        "Тайм-зона — <code>/settz</code>, отписка — <code>/unsubscribe</code>.",
+        parse_mode=ParseMode.HTML
+    )
+
+async def cmd_unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _drop_subscriber(update.effective_chat.id)
+    await update.message.reply_text("Ежедневная рассылка отключена.")
+
 # ====== Inline-обработчики ======
 async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -335,11 +626,18 @@ async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
         salt = _salt(chat_id)
         dt = datetime.now(tz=user_tz).replace(tzinfo=None)
         r = read_howl(dt, salt=salt)
-        await send_with_media(q.message, render_reading(r), r.doom["code"], r.branch_tuple[1])
+        from outbox import OutboxDropped, send_policy
+        try:
+            # повторные нажатия, пока первое ждёт в очереди, — отправится только последнее
+            with send_policy(("howl_now", chat_id) if OUTBOX_COALESCE else None, OUTBOX_STALE):
+                await send_with_media(q.message, render_reading(r), r.doom["code"], r.branch_tuple[1], reading=r)
+        except OutboxDropped:
+            return
         _record(chat_id, dt, r.doom["code"], r.doom_level)
 
     elif data == "howl_ask":
-        prompt = "Пришлите момент в формате: <code>YYYY-MM-DD HH:MM</code> (местное время)"
+        _await_moment(update.effective_chat.id, q.from_user.id)
+        prompt = f"{PROMPT_PREFIX} в формате: <code>YYYY-MM-DD HH:MM</code> (местное время)\n{MOMENT_EXAMPLES}"
         await q.message.reply_text(prompt, reply_markup=ForceReply(selective=True), parse_mode=ParseMode.HTML)
 
     elif data == "howl_last":
@@ -354,68 +652,405 @@ async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode=ParseMode.HTML
         )
 
-# ловим ответ на ForceReply (дата/время)
+# ====== Ввод момента после «Ввести момент» ======
+PROMPT_PREFIX = "Пришлите момент"
+MOMENT_EXAMPLES = "Можно и так: 01.10.2025 14:30, 14:30, завтра в 9:00, через 2 часа, 15 минут назад"
+# (chat_id, user_id) -> monotonic-срок; TTL у всех один, так что порядок вставки — порядок истечения
+_AWAITING: OrderedDict[tuple, float] = OrderedDict()
+
+def _await_moment(chat_id: int, user_id: int):
+    now = time.monotonic()
+    while _AWAITING and next(iter(_AWAITING.values())) <= now:
+        _AWAITING.popitem(last=False)
+    _AWAITING[(chat_id, user_id)] = now + AWAIT_TTL
+    _AWAITING.move_to_end((chat_id, user_id))
+    if len(_AWAITING) > AWAIT_MAX:
+        _AWAITING.popitem(last=False)
+
+def _is_prompt_reply(message) -> bool:
+    # именно нашему боту: в группе у другого бота может найтись сообщение с тем же началом
+    r = message.reply_to_message
+    return (r is not None and r.from_user is not None and r.from_user.id == message.get_bot().id
+            and (r.text or "").startswith(PROMPT_PREFIX))
+
+class AwaitingMoment(filters.MessageFilter):
+    """Ответы на наш запрос (после рестарта или из другого воркера состояния нет, а ответ есть) и,
+    только в личке, любой текст от того, от кого ждём момент. В группах обычная переписка до хендлера не доходит."""
+
+    def filter(self, message) -> bool:
+        if _is_prompt_reply(message):
+            return True
+        user = message.from_user
+        if user is None or message.chat.type != ChatType.PRIVATE:
+            return False
+        key = (message.chat.id, user.id)
+        deadline = _AWAITING.get(key)
+        if deadline is None:
+            return False
+        if deadline > time.monotonic():
+            return True
+        del _AWAITING[key]
+        return False
+
+AWAITING_MOMENT = AwaitingMoment(name="awaiting_moment")
+
 async def on_reply_datetime(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.message or not update.message.reply_to_message:
-        return
-    if "Пришлите момент в формате" not in (update.message.reply_to_message.text or ""):
+    if not update.message:
         return
     chat_id = update.effective_chat.id
-    salt = _salt(chat_id)
-    txt = (update.message.text or "").strip()
-    try:
-        if " " in txt:
-            dt = datetime.strptime(txt, "%Y-%m-%d %H:%M")
-        else:
-            dt = datetime.strptime(txt, "%Y-%m-%d")
-    except Exception:
-        await update.message.reply_text("Не понял формат. Пример: <code>2025-10-01 14:30</code>", parse_mode=ParseMode.HTML)
+    user_tz = _get_user_tzinfo(chat_id)
+    dt = parse_moment(update.message.text or "", datetime.now(tz=user_tz).replace(tzinfo=None))
+    if dt is None:
+        await update.message.reply_text(f"Не понял. Пример: <code>2025-10-01 14:30</code>\n{MOMENT_EXAMPLES}",
+                                        parse_mode=ParseMode.HTML)
         return
-    r = read_howl(dt, salt=salt)
-    await send_with_media(update.message, render_reading(r), r.doom["code"], r.branch_tuple[1])
+    if update.effective_user:
+        _AWAITING.pop((chat_id, update.effective_user.id), None)
+    r = read_howl(dt, salt=_salt(chat_id))
+    await send_with_media(update.message, render_reading(r), r.doom["code"], r.branch_tuple[1], reading=r)
     _record(chat_id, dt, r.doom["code"], r.doom_level)
 
+# ====== Inline-режим (@бот в любом чате) ======
+# ответ зависит только от соли, тайм-зоны и часа: собираем один раз на корзину, дальше — поиск в LRU
+_INLINE: OrderedDict = OrderedDict()
+PHOTO_CAPTION_MAX = 1024
+
+def _inline_result(rid: str, title: str, r):
+    text = render_reading(r)
+    desc = f"{r.doom['emoji']} {'☠' * r.doom_level} {r.doom['name']}"
+    p, _, digest = doom_image(r.doom["code"])
+    try:
+        fid = MEDIA.get(p, digest) if p else None  # картинка уже была отправлена — можно отдать её file_id
+    except OSError:
+        fid = None
+    if fid and len(text) <= PHOTO_CAPTION_MAX:
+        return InlineQueryResultCachedPhoto(rid, fid, title=title, description=desc,
+                                            caption=text, parse_mode=ParseMode.HTML)
+    return InlineQueryResultArticle(rid, title, InputTextMessageContent(text, parse_mode=ParseMode.HTML),
+                                    description=desc)
+
+def _inline_results(salt: int, tz: tzinfo, hour: datetime) -> list:
+    key = (salt, tz, hour)
+    res = _INLINE.get(key)
+    if res is not None:
+        _INLINE.move_to_end(key)
+        return res
+    day = hour.replace(hour=0)
+    res = [_inline_result(f"{kind}:{salt}:{dt:%Y%m%d%H}", title, read_howl(dt, salt))
+           for kind, title, dt in (("now", "Сейчас", hour), ("today", "Сегодня", day),
+                                   ("tomorrow", "Завтра", day + timedelta(days=1)))]
+    _INLINE[key] = res
+    if len(_INLINE) > INLINE_CACHE_SIZE:
+        _INLINE.popitem(last=False)
+    return res
+
+async def on_inline(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Чтения на этот час, сегодня и завтра — по соли и тайм-зоне личного чата пользователя."""
+    q = update.inline_query
+    uid = q.from_user.id
+    tz = _get_user_tzinfo(uid)
+    now = datetime.now(tz=tz).replace(tzinfo=None)
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    # пусть Telegram сам отвечает на повторы — до конца часа, дальше корзина другая
+    left = int((hour + timedelta(hours=1) - now).total_seconds())
+    await q.answer(_inline_results(_salt(uid), tz, hour), cache_time=max(left, 1), is_personal=True)
+
+# ====== Параллельная обработка апдейтов ======
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Разные чаты — параллельно (до max_running), внутри одного чата — строго по очереди:
+    _record и ForceReply (howl_ask → on_reply_datetime) не обгоняют друг друга.
+    Ждущие своей очереди апдейты не занимают слоты исполнения, только слоты приёма (max_pending).
+    Кнопки из unordered (callback_data) идут мимо очереди чата: иначе повторное нажатие не дойдёт
+    до очереди исходящих, пока ждёт первое, и склеивать там будет нечего."""
+
+    def __init__(self, max_running: int, max_pending: int | None = None, unordered=()):
+        super().__init__(max(max_pending or max_running * 8, max_running))
+        self._running = asyncio.BoundedSemaphore(max_running)
+        self._chats = {}  # key -> [Lock, сколько апдейтов чата в работе/ожидании]
+        self._unordered = frozenset(unordered)
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None or (self._unordered and isinstance(update, Update) and update.callback_query
+                           and update.callback_query.data in self._unordered):
+            async with self._running:
+                await coroutine
+            return
+        slot = self._chats.get(key)
+        if slot is None:
+            slot = self._chats[key] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0], self._running:
+                await coroutine
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                del self._chats[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
 # ====== main ======
+_BACKGROUND: set = set()
+
+def _background(coro):
+    task = asyncio.get_running_loop().create_task(coro)
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+
+async def _warm_up(app: Application):
+    """Всё, что первому ответу не нужно: меню команд, иконки ветвей, снапшот кэшей."""
+    try:
+        await _set_bot_commands(app)
+    except Exception as e:
+        logging.warning("bot commands not set: %s", e)
+    if not ICONS:
+        await _warm_icons()
+    if SNAPSHOT_FILE:
+        try:
+            await asyncio.to_thread(_save_snapshot)
+        except Exception as e:
+            logging.warning("snapshot not saved: %s", e)
+
+async def _post_init(app: Application):
+    if isinstance(_store(), WriteBehindStorage):
+        STORE.start()
+    if BROADCAST:
+        BROADCAST.start()
+    if STATS_FILE and STATS_SAVE_INTERVAL > 0:
+        _background(_stats_saver())
+    if MEDIA_SAVE_INTERVAL > 0 and MEDIA.shared is None:
+        _background(_media_saver())
+    _background(_warm_up(app))
+    STARTUP.add("to_ready", STARTUP.since_start())
+
+async def _post_stop(app: Application):
+    for t in list(_BACKGROUND):
+        t.cancel()
+    if BROADCAST:
+        await BROADCAST.stop()
+    if isinstance(STORE, WriteBehindStorage):
+        await STORE.stop()
+    if STATS_FILE and STATS.changed:
+        try:
+            await _save_stats()
+        except Exception as e:
+            logging.warning("stats not saved: %s", e)
+    await MEDIA.save()
+    if CARDS is not None:
+        CARDS.close()
+
 async def _set_bot_commands(app: Application):
     await app.bot.set_my_commands([
         BotCommand("howl", "Гадать сейчас / по моменту"),
+        BotCommand("week", "Несчастья на неделю"),
+        BotCommand("forecast", "Ближайшие сутки / N дней"),
         BotCommand("last", "Пять последних воев"),
+        BotCommand("stats", "Статистика чата"),
         BotCommand("settz", "Установить тайм-зону"),
         BotCommand("tz", "Показать текущую тайм-зону"),
+        BotCommand("subscribe", "Несчастье каждый день"),
+        BotCommand("ics", "Календарь несчастий"),
         BotCommand("help", "Помощь / меню"),
         BotCommand("diag", "Диагностика ассетов"),
     ])
 
+# ====== Несколько воркеров ======
+def _worker_id() -> str:
+    import socket
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _enable_shared_state():
+    """Состояние делят несколько процессов: только SQLite и без кэшей, которые не видят чужих записей."""
+    global STATE_FLUSH_INTERVAL, TZ_CACHE_SIZE, SHARED_STATE, STATS_FILE
+    if not STORAGE.startswith("sqlite"):
+        raise SystemExit("WEB_WORKERS > 1 требует STORAGE=sqlite[:путь]")
+    STATE_FLUSH_INTERVAL = 0  # write-behind перезаписал бы историю, добавленную другим воркером
+    TZ_CACHE_SIZE = 0         # /settz мог прийти в другой воркер
+    SHARED_STATE, STATS_FILE = True, ""  # иначе /stats видел бы только долю своего воркера
+
+def _broadcast_leader() -> bool:
+    return _store().acquire_lease("broadcast", _worker_id(), LEASE_TTL)
+
+# ====== Холодный старт ======
+def _save_snapshot(table=None):
+    parts = {"assets": _assets().state(), "manifest": _manifest().state(), "media": MEDIA.digests(),
+             "icons": dict(ICONS)}
+    if PACK is not None:
+        parts["pack"] = PACK.state()
+    table = table or misfortune._TABLE
+    if table is not None:
+        parts["table"] = table.dumps()
+    snapshot.save(SNAPSHOT_FILE, parts)
+
+async def _first_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Группа 1: срабатывает после основного хендлера. Пишем отчёт о старте один раз."""
+    if "to_first_reply" not in STARTUP.phases:
+        STARTUP.add("to_first_reply", STARTUP.since_start())
+        logging.info("startup: %s", STARTUP.report())
+
+# ====== Метрики (/metrics на вебхук-сервере) ======
+_CB_LABELS = {"howl_now", "howl_ask", "howl_last", "help_tz"}
+
+def _cb_label(update: Update) -> str:
+    data = update.callback_query.data
+    return data if data in _CB_LABELS else "other"
+
+def _register_gauges():
+    REGISTRY.gauge("howl_media_cache_hits", "Отправки по сохранённому file_id", fn=lambda: MEDIA.hits)
+    REGISTRY.gauge("howl_media_cache_misses", "Отправки с загрузкой файла", fn=lambda: MEDIA.misses)
+    REGISTRY.gauge("howl_state_dirty_chats", "Чаты, ждущие сброса на диск",
+                   fn=lambda: STORE.dirty if isinstance(STORE, WriteBehindStorage) else 0)
+    REGISTRY.gauge("howl_outbox_depth", "Исходящие запросы, ждущие лимитов или повтора",
+                   fn=lambda: LIMITER.depth if LIMITER else 0)
+
+def build_application(token: str, base_url: str | None = None) -> Application:
+    """Application со всеми хендлерами; base_url — другой Bot API (например, локальная заглушка для нагрузки)."""
+    global FEEDS, BROADCAST, LIMITER
+    from web import IcsFeeds
+    from outbox import FanOut, OutboundLimiter, GLOBAL_RATE
+    from broadcast import DailyBroadcast, ChatTarget
+    secret = os.getenv("ICS_SECRET") or hashlib.sha256(b"ics:" + token.encode()).hexdigest()
+    FEEDS = IcsFeeds(secret.encode(), _chat_profile, ICS_CACHE_SIZE, ICS_YEARS)
+
+    builder = Application.builder().token(token).defaults(Defaults(parse_mode=ParseMode.HTML))
+    if base_url:
+        builder = builder.base_url(base_url.rstrip("/") + "/bot").base_file_url(base_url.rstrip("/") + "/file/bot")
+    if CONCURRENT_UPDATES > 1:
+        # «Гадать сейчас» ничего не ждёт от прошлых апдейтов чата — пусть повторы доходят до склейки в очереди
+        unordered = {"howl_now"} if OUTBOX and OUTBOX_COALESCE else ()
+        builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES, unordered=unordered))
+    if OUTBOX:
+        LIMITER = OutboundLimiter(max_pending=OUTBOX_MAX)
+        builder = builder.rate_limiter(LIMITER)
+    app = builder.build()
+
+    async def _broadcast_send(chat_id, text_html, doom_code, branch_py, reading=None):
+        await send_with_media(ChatTarget(app.bot, chat_id), text_html, doom_code, branch_py, strict=True,
+                              reading=reading)
+    BROADCAST = DailyBroadcast(_store(), _salt, _zone, _broadcast_send,
+                               FanOut(None if OUTBOX else GLOBAL_RATE, BROADCAST_CONCURRENCY,
+                                      on_forbidden=_drop_subscriber),
+                               leader=_broadcast_leader if WEB_WORKERS > 1 else None)
+    app.post_init = _post_init
+    app.post_stop = _post_stop
+
+    _register_gauges()
+    _h = lambda fn, label=None: instrument(fn.__name__, label)(fn)
+    app.add_handler(CommandHandler("start", _h(cmd_start)))
+    app.add_handler(CommandHandler("help",  _h(cmd_help)))
+    app.add_handler(CommandHandler("howl",  _h(cmd_howl)))
+    app.add_handler(CommandHandler("week",  _h(cmd_week)))
+    app.add_handler(CommandHandler("forecast", _h(cmd_forecast)))
+    app.add_handler(CommandHandler("last",  _h(cmd_last)))
+    app.add_handler(CommandHandler("stats", _h(cmd_stats)))
+    app.add_handler(CommandHandler("settz", _h(cmd_settz)))
+    app.add_handler(CommandHandler("tz",    _h(cmd_tz)))
+    app.add_handler(CommandHandler("diag",  _h(cmd_diag)))
+    app.add_handler(CommandHandler("ics",   _h(cmd_ics)))
+    app.add_handler(CommandHandler("subscribe",   _h(cmd_subscribe)))
+    app.add_handler(CommandHandler("unsubscribe", _h(cmd_unsubscribe)))
+    app.add_handler(CallbackQueryHandler(_h(on_cb, _cb_label)))
+    app.add_handler(InlineQueryHandler(_h(on_inline)))
+    app.add_handler(MessageHandler(AWAITING_MOMENT & filters.TEXT & ~filters.COMMAND & ~filters.UpdateType.EDITED_MESSAGE,
+                                   _h(on_reply_datetime)))
+    app.add_handler(TypeHandler(Update, _first_reply), group=1)
+    return app
+
+def prepare():
+    """Всё, что надо сделать до первого апдейта: ассеты, хранилище, таблица чтений, карточки.
+    Что есть в снапшоте и не устарело — берём оттуда."""
+    global ASSETS, MANIFEST, CARDS, STATS, PACK
+    with STARTUP.phase("snapshot"):
+        snap = snapshot.load(SNAPSHOT_FILE) if SNAPSHOT_FILE else {}
+    with STARTUP.phase("assets"):
+        if PACK is None:
+            PACK = _open_pack(snap.get("pack"))
+        if not _pack_complete():
+            ensure_assets_dir()  # попробуем распаковать assets.zip, если папки нет
+            ASSETS = AssetIndex(ASSETS_DIR, state=snap.get("assets"))
+            MANIFEST = MediaManifest(MEDIA_MANIFEST, MEDIA_VARIANT, state=snap.get("manifest"))
+        MEDIA.restore_digests(snap.get("media"))
+        ICONS.update(snap.get("icons") or {})
+    with STARTUP.phase("store"):
+        _store()
+        if SHARED_STATE:
+            MEDIA.share(_store())
+    if STATS_FILE:
+        with STARTUP.phase("stats"):
+            saved = snapshot.load(STATS_FILE).get("stats")
+            if saved:
+                try:
+                    STATS = HowlStats.loads(saved)
+                except Exception as e:
+                    logging.warning("stats %s unreadable, starting empty: %s", STATS_FILE, e)
+    if READING_TABLE and enable_reading_table:
+        with STARTUP.phase("table"):
+            table = ReadingTable.loads(snap["table"]) if snap.get("table") else None
+            enable_reading_table(None if READING_TABLE == "1" else READING_TABLE, table)
+        logging.info("reading table enabled (%s)", READING_TABLE)
+    if HOWL_CARDS and CARDS is None:
+        from cards import CardCache, cards_available
+        if cards_available():
+            CARDS = CardCache(CARD_DIR, CARD_FILES, workers=CARD_WORKERS, on_evict=MEDIA.forget)
+            logging.info("reading cards enabled: %d cached in %s", CARDS.stats()["files"], CARD_DIR)
+    if snap:
+        logging.info("snapshot %s: %s", SNAPSHOT_FILE, ", ".join(sorted(snap)))
+
+def warm():
+    """python bot.py --warm: собрать снапшот заранее (например, в build-шаге деплоя) и выйти."""
+    prepare()
+    if not ICONS and ensure_icons and icon_filename and not _icons_packed():
+        ICONS.update(_load_icons())
+    MEDIA.prime(_manifest().paths() + [os.path.join(ASSETS_DIR, n) for n in _assets().names()] + ["welcome.png"])
+    # таблицу кладём всегда, а включится она только при HOWL_TABLE
+    _save_snapshot(misfortune._TABLE or (ReadingTable() if ReadingTable else None))
+    logging.info("snapshot saved to %s (%s)", SNAPSHOT_FILE, STARTUP.report())
+
 def main():
-    ensure_assets_dir()  # попробуем распаковать assets.zip, если папки нет
+    global PACK
+    if sys.argv[1:] == ["--warm"]:
+        return warm()
     token = os.getenv("TELEGRAM_TOKEN")
     if not token:
         raise SystemExit("Установите TELEGRAM_TOKEN")
-
-    app = Application.builder().token(token).defaults(Defaults(parse_mode=ParseMode.HTML)).build()
-    app.post_init = _set_bot_commands
-
-    app.add_handler(CommandHandler("start", cmd_start))
-    app.add_handler(CommandHandler("help",  cmd_help))
-    app.add_handler(CommandHandler("howl",  cmd_howl))
-    app.add_handler(CommandHandler("last",  cmd_last))
-    app.add_handler(CommandHandler("settz", cmd_settz))
-    app.add_handler(CommandHandler("tz",    cmd_tz))
-    app.add_handler(CommandHandler("diag",  cmd_diag))
-    app.add_handler(CallbackQueryHandler(on_cb))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_reply_datetime))
-
-    webhook_base = os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL")
     port = int(os.getenv("PORT", "8080"))
-    if webhook_base:
-        webhook_url = webhook_base.rstrip("/") + "/" + token
+    sockets, task_id = None, 0
+    if WEBHOOK_BASE and WEB_WORKERS > 1:
+        import tornado.netutil, tornado.process
+        _enable_shared_state()
+        PACK = _open_pack()  # до fork: воркеры делят одно отображение файла
+        if not _pack_complete():
+            ensure_assets_dir()
+        open_storage(STORAGE, DATA_FILE, TZ_FILE).close()  # схема и перенос JSON — один раз, до fork
+        sockets = tornado.netutil.bind_sockets(port, "0.0.0.0")
+        task_id = tornado.process.fork_processes(WEB_WORKERS)  # родитель дальше не идёт, перезапускает упавших
+        logging.info("worker %d started (pid %d)", task_id, os.getpid())
+    prepare()
+    with STARTUP.phase("build"):
+        app = build_application(token, os.getenv("TELEGRAM_API_URL"))
+
+    if WEBHOOK_BASE:
+        webhook_url = WEBHOOK_BASE.rstrip("/") + "/" + token
         logging.info("Starting webhook at %s", webhook_url)
-        app.run_webhook(
-            listen="0.0.0.0",
-            port=port,
-            url_path=token,
-            webhook_url=webhook_url,
-        )
+        claim = _store().claim_update if WEB_WORKERS > 1 else None
+        from web import make_web_app, run_webhook
+        run_webhook(app, make_web_app(app, url_path=token, feeds=FEEDS, claim=claim),
+                    listen="0.0.0.0", port=port, webhook_url=webhook_url,
+                    sockets=sockets, set_webhook=task_id == 0)
     else:
         logging.info("Starting long polling")
         app.run_polling()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Ежедневная рассылка: подписчики сгруппированы по (тайм-зона, соль, час) — текст рендерим раз на группу."""
+import asyncio, logging
+from datetime import datetime, timezone, timedelta
+
+from misfortune import read_howl, render_reading
+from outbox import FanOut
+
+class ChatTarget:
+    """Притворяется сообщением для send_with_media: reply_* уходят в чат через bot.send_*."""
+
+    def __init__(self, bot, chat_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+
+    async def reply_photo(self, photo, **kwargs):
+        return await self.bot.send_photo(chat_id=self.chat_id, photo=photo, **kwargs)
+
+    async def reply_text(self, text, **kwargs):
+        return await self.bot.send_message(chat_id=self.chat_id, text=text, **kwargs)
+
+class DailyBroadcast:
+    """Раз в минуту смотрит, в каких тайм-зонах наступил чей-то час, и рассылает через FanOut."""
+
+    def __init__(self, store, salt, zone, send, fanout: FanOut, leader=None):
+        self.store = store
+        self.salt = salt            # chat_id -> соль чтения
+        self.zone = zone            # строка тайм-зоны | None -> tzinfo; зовётся и из потока сборки
+        self.send = send            # async (chat_id, text_html, doom_code, branch_py, reading) -> None
+        self.fanout = fanout
+        self.leader = leader        # () -> bool: при нескольких воркерах рассылает только лидер
+        self._slots = None          # tzinfo -> {hour: {salt: [chat_id, ...]}}
+        self._where = {}            # chat_id -> (tzinfo, hour, salt): где чат лежит в _slots
+        self._version = None        # store.subs_version() на момент сборки групп
+        self._changed = None        # chat_id -> hour (None — отписан, ... — час прежний), пока идёт сборка
+        self._task = None
+        self._inflight = set()
+        self.last_tick = None
+
+    def invalidate(self):
+        """Поменялось всё разом — пересоберём группы на следующем тике."""
+        self._slots = None
+
+    def update(self, chat_id: int, hour=...):
+        """Подписался (hour), отписался (None) или сменил тайм-зону (час прежний): правим одну группу."""
+        if self._changed is not None:
+            self._changed[chat_id] = hour  # идёт полная сборка — применим после неё
+        if self._slots is None:
+            return
+        old = self._where.pop(chat_id, None)
+        if old is not None:
+            tz, h, salt = old
+            chats = self._slots[tz][h][salt]
+            chats.remove(chat_id)
+            if not chats:
+                del self._slots[tz][h][salt]
+                if not self._slots[tz][h]:
+                    del self._slots[tz][h]
+                    if not self._slots[tz]:
+                        del self._slots[tz]
+        if hour is ...:
+            hour = old[1] if old is not None else None
+        if hour is not None:
+            self._add(self._slots, self._where, chat_id, hour, self.store.get_tz(chat_id))
+
+    def _add(self, slots: dict, where: dict, chat_id: int, hour: int, tzid: str | None):
+        salt, tz = self.salt(chat_id), self.zone(tzid)
+        slots.setdefault(tz, {}).setdefault(hour, {}).setdefault(salt, []).append(chat_id)
+        where[chat_id] = (tz, hour, salt)
+
+    def _build(self):
+        """Все подписчики заново — звать в потоке, не в event loop. Тайм-зоны берём из того же
+        чтения store.subscribers(): кэши бота, которые правит event loop, отсюда не трогаем."""
+        slots, where = {}, {}
+        for chat_id, (hour, tzid) in self.store.subscribers().items():
+            self._add(slots, where, chat_id, hour, tzid)
+        return slots, where
+
+    def _install(self, built):
+        self._slots, self._where = built
+        logging.info("broadcast: %d subscribers in %d time zones", len(self._where), len(self._slots))
+
+    async def refresh(self):
+        """Пересобрать группы в потоке, если их сбросили или подписки и тайм-зоны правил другой воркер."""
+        version = self.store.subs_version()
+        if self._slots is not None and version == self._version:
+            return
+        self._version, self._changed = version, {}
+        try:
+            built = await asyncio.to_thread(self._build)
+        finally:
+            changed, self._changed = self._changed, None
+        self._install(built)
+        for chat_id, hour in changed.items():
+            self.update(chat_id, hour)
+
+    def due(self, now_utc: datetime):
+        """[(местный момент, соль, [chat_id]), ...] для групп, у которых сейчас ровно их час."""
+        if self._slots is None:  # refresh() ещё не было (тик снаружи _run)
+            self._version = self.store.subs_version()
+            self._install(self._build())
+        out = []
+        for tz, hours in self._slots.items():
+            local = now_utc.astimezone(tz)
+            if local.minute != 0 or local.hour not in hours:
+                continue
+            moment = local.replace(tzinfo=None, second=0, microsecond=0)
+            for salt, chats in hours[local.hour].items():
+                out.append((moment, salt, chats))
+        return out
+
+    def tick(self, now_utc: datetime) -> int:
+        jobs = []
+        for moment, salt, chats in self.due(now_utc):
+            r = read_howl(moment, salt=salt)
+            text = render_reading(r)
+            code, py = r.doom["code"], r.branch_tuple[1]
+            for chat_id in chats:
+                # всё про группу — в умолчания: задачи выполнит send_all уже после цикла
+                jobs.append((chat_id, lambda c=chat_id, t=text, k=code, p=py, r=r: self.send(c, t, k, p, r)))
+        if jobs:
+            task = asyncio.get_running_loop().create_task(self.fanout.send_all(jobs))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+        return len(jobs)
+
+    async def _run(self):
+        minute = timedelta(minutes=1)
+        last = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        while True:
+            now = datetime.now(timezone.utc)
+            await asyncio.sleep(60 - now.second - now.microsecond / 1e6)
+            now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+            cur = max(last + minute, now - 10 * minute)  # после зависания догоняем не больше 10 минут
+            if self.leader is not None and not self._is_leader():
+                cur = now + minute  # минуты, пропущенные не-лидером, не догоняем
+            elif cur <= now:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logging.exception("broadcast refresh failed: %s", e)
+            while cur <= now:
+                try:
+                    n = self.tick(cur)
+                    if n:
+                        logging.info("broadcast %s: %d messages queued", cur.isoformat(timespec="minutes"), n)
+                except Exception as e:
+                    logging.exception("broadcast tick failed: %s", e)
+                cur += minute
+            last = now
+            self.last_tick = now
+
+    def _is_leader(self) -> bool:
+        try:
+            return self.leader()
+        except Exception as e:
+            logging.warning("broadcast leader check failed: %s", e)
+            return False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for t in list(self._inflight):
+            t.cancel()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Карточки чтений: арт несчастья + уровень ☠, знак дня/часа и элемент поверх. Рисует Pillow в пуле процессов.
+
+Ключ карточки — (код несчастья, уровень, ветвь дня, ветвь часа). Элемент дня ключом тоже задан:
+ствол той же чётности, что ветвь, а уровень даёт его остаток по 5.
+"""
+import os, asyncio, hashlib, logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+CARD_VERSION = 1                 # поменять при смене вёрстки — старые файлы перестанут совпадать
+CARD_SIZE = (1024, 576)
+
+def card_key(r) -> tuple:
+    return (r.doom["code"], r.doom_level, r.branch_tuple[1], r.hour_branch_tuple[1])
+
+# ——— рисование (в отдельном процессе; только простые аргументы)
+@lru_cache(maxsize=None)
+def _font(size: int, bold: bool = False):
+    from PIL import ImageFont
+    names = ["DejaVuSans-Bold.ttf", "arial.ttf"] if bold else ["DejaVuSans.ttf", "arial.ttf"]
+    for path in names + [f"/usr/share/fonts/truetype/dejavu/{names[0]}",
+                         "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"]:
+        try:
+            return ImageFont.truetype(path, size)
+        except Exception:
+            pass
+    return ImageFont.load_default()
+
+def render_card(art: str | None, level: int, day: tuple, hour: tuple, element: str) -> bytes:
+    """JPEG карточки. day/hour — (ханьцзы, пиньинь, по-русски) из BRANCHES."""
+    import io
+    from PIL import Image, ImageDraw
+    W, H = CARD_SIZE
+    img = Image.new("RGB", CARD_SIZE, (20, 20, 24))
+    if art and os.path.exists(art):
+        with Image.open(art) as a:
+            a = a.convert("RGBA")
+            scale = max(W / a.width, H / a.height)
+            a = a.resize((round(a.width * scale), round(a.height * scale)), Image.LANCZOS)
+            left, top = (a.width - W) // 2, (a.height - H) // 2
+            a = a.crop((left, top, left + W, top + H))
+            img.paste(a, mask=a.getchannel("A"))
+    over = Image.new("RGBA", CARD_SIZE, (0, 0, 0, 0))
+    d = ImageDraw.Draw(over)
+    d.rectangle((0, H - 150, W, H), fill=(12, 12, 16, 215))
+    # уровень: горящие и погасшие черепа
+    for i in range(5):
+        d.text((40 + i * 58, H - 140), "☠", font=_font(48), fill=(235, 70, 60) if i < level else (90, 90, 96))
+    d.text((W - 40, H - 132), element, anchor="ra", font=_font(40, bold=True), fill=(240, 240, 240))
+    sign = f"день {day[1].upper()} · {day[2]}    час {hour[1].upper()} · {hour[2]}"
+    d.text((40, H - 30), sign, anchor="ls", font=_font(30), fill=(200, 200, 200))
+    img = Image.alpha_composite(img.convert("RGBA"), over).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85, optimize=True)
+    return buf.getvalue()
+
+def write_card(path: str, *args) -> int:
+    """render_card + атомарная запись файла — тоже в процессе пула, чтобы не трогать диск из event loop."""
+    data = render_card(*args)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+def art_tag(path: str) -> str:
+    """Короткий хэш содержимого арта — в имя файла карточки: сменился арт — старые карточки не подходят."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()[:8]
+    except OSError:
+        return "none"
+
+# ——— кэш
+class CardCache:
+    """Готовые карточки — файлы в dir (не больше max_files, вытесняем давно не нужные);
+    в памяти — LRU-индекс ключ -> путь, чтобы горячие карточки не стоили даже stat.
+    Байты в памяти не держим: после первой загрузки карточка уходит по file_id."""
+
+    def __init__(self, d: str = "cards", max_files: int = 5000, mem_items: int = 1024,
+                 workers: int = 2, on_evict=None):
+        self.dir = d
+        self.max_files = max_files
+        self.mem_items = mem_items
+        self.workers = workers
+        self.on_evict = on_evict     # path -> None: например, забыть его file_id
+        self.hits = 0
+        self.renders = 0
+        self._mem = OrderedDict()    # key -> path
+        self._disk = OrderedDict()   # имя файла -> None, от старых к свежим
+        self._art_tags = {}          # путь к арту -> короткий хэш содержимого
+        self._pending = {}           # имя файла -> Future, чтобы один ключ не рисовать дважды
+        self._pool = None
+        os.makedirs(d, exist_ok=True)
+        files = [e for e in os.scandir(d) if e.is_file() and e.name.endswith(".jpg")]
+        for e in sorted(files, key=lambda e: e.stat().st_mtime_ns):
+            self._disk[e.name] = None
+
+    async def _art_tag(self, art: str | None) -> str:
+        """Хэш арта — раз на путь и в потоке: читать файл целиком в event loop нельзя."""
+        if not art:
+            return "none"
+        tag = self._art_tags.get(art)
+        if tag is None:
+            tag = self._art_tags[art] = await asyncio.to_thread(art_tag, art)
+        return tag
+
+    @staticmethod
+    def _name(key: tuple, tag: str) -> str:
+        code, level, day, hour = key
+        return f"{code}_{level}_{day}_{hour}_{tag}v{CARD_VERSION}.jpg"
+
+    def _remember(self, mkey, name: str, path: str):
+        self._mem[mkey] = path
+        if len(self._mem) > self.mem_items:
+            self._mem.popitem(last=False)
+        self._disk[name] = None
+        self._disk.move_to_end(name)
+        while len(self._disk) > self.max_files:
+            old, _ = self._disk.popitem(last=False)
+            p = os.path.join(self.dir, old)
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+            for k in [k for k, v in self._mem.items() if v == p]:
+                del self._mem[k]
+            if self.on_evict:
+                self.on_evict(p)
+
+    async def get(self, r, art: str | None) -> str:
+        """Путь к карточке чтения r; рисуем в пуле процессов, если её ещё нет."""
+        key = card_key(r)
+        mkey = key + (art,)
+        path = self._mem.get(mkey)
+        if path is not None:
+            self._mem.move_to_end(mkey)
+            self._disk.move_to_end(os.path.basename(path))
+            self.hits += 1
+            return path
+        name = self._name(key, await self._art_tag(art))
+        path = os.path.join(self.dir, name)
+        if name in self._disk and os.path.exists(path):
+            self.hits += 1
+            self._remember(mkey, name, path)
+            return path
+        fut = self._pending.get(name)
+        if fut is None:
+            fut = asyncio.ensure_future(self._render(r, art, path))
+            self._pending[name] = fut
+            fut.add_done_callback(lambda _: self._pending.pop(name, None))
+        await asyncio.shield(fut)
+        self._remember(mkey, name, path)
+        return path
+
+    async def _render(self, r, art, path: str):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        await asyncio.get_running_loop().run_in_executor(
+            self._pool, write_card, path, art, r.doom_level,
+            tuple(r.branch_tuple), tuple(r.hour_branch_tuple), f"{r.element} ({r.yin_yang})")
+        self.renders += 1
+
+    def stats(self) -> dict:
+        return {"files": len(self._disk), "hits": self.hits, "renders": self.renders}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+def cards_available() -> bool:
+    try:
+        import PIL  # noqa: F401
+        return True
+    except ImportError:
+        logging.warning("HOWL_CARDS needs Pillow; cards disabled")
+        return False
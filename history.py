@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Компактная история воев: на чат — кольцо из keep записей фиксированного размера в общем bytearray.
+
+Запись — (минуты от 1970-01-01, индекс несчастья, уровень), 6 байт; слот чата — 2 байта заголовка
+(сколько записей, куда писать следующую) + keep записей. Наружу — тот же вид, что и раньше:
+[{"ts": "YYYY-MM-DDTHH:MM", "doom": code, "lvl": n}, ...] от старых к новым.
+
+    python history.py export howls.ring howls.json   # бинарный файл -> JSON (как у JsonStorage)
+    python history.py import howls.json howls.ring
+"""
+import os, sys, json, struct
+from array import array
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from misfortune import MISFORTUNES
+
+REC = struct.Struct("<iBB")
+EPOCH = datetime(1970, 1, 1)
+CODES = [m["code"] for m in MISFORTUNES]
+_CODE_INDEX = {c: i for i, c in enumerate(CODES)}
+
+_EPOCH_DAY = EPOCH.toordinal()
+
+@lru_cache(maxsize=1024)  # в одну минуту пишут многие чаты
+def _minutes(ts: str):
+    """"YYYY-MM-DDTHH:MM" -> минуты от EPOCH; всё прочее (секунды, зона, мусор) — None."""
+    if len(ts) != 16 or ts[4] != "-" or ts[7] != "-" or ts[10] != "T" or ts[13] != ":":
+        return None
+    digits = ts[:4] + ts[5:7] + ts[8:10] + ts[11:13] + ts[14:]
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    h, m = int(ts[11:13]), int(ts[14:])
+    if h > 23 or m > 59:
+        return None
+    try:
+        day = date(int(ts[:4]), int(ts[5:7]), int(ts[8:10])).toordinal()
+    except ValueError:
+        return None
+    return (day - _EPOCH_DAY) * 1440 + h * 60 + m
+
+def encode(entry: dict):
+    """(минуты, индекс, уровень) или None, если запись в кольцо не влезает (неизвестный код, чужой ts)."""
+    try:
+        minutes = _minutes(entry["ts"])
+        doom = _CODE_INDEX[entry["doom"]]
+        lvl = entry["lvl"]
+    except (KeyError, TypeError):
+        return None
+    if minutes is None or type(lvl) is not int or not 0 <= lvl < 256 or not -2**31 <= minutes < 2**31:
+        return None
+    return minutes, doom, lvl
+
+@lru_cache(maxsize=4096)
+def _ts(minutes: int) -> str:
+    return (EPOCH + timedelta(minutes=minutes)).isoformat(timespec="minutes")
+
+def decode(minutes: int, doom: int, lvl: int) -> dict:
+    return {"ts": _ts(minutes), "doom": CODES[doom], "lvl": lvl}
+
+class HistoryRing:
+    MAGIC = b"HOWLRNG1"
+
+    def __init__(self, keep: int = 5):
+        self.keep = keep
+        self.slot_size = 2 + keep * REC.size
+        self._slot = {}     # chat_id -> номер слота в _buf
+        self._free = []     # освобождённые (обнулённые) слоты — отдаём новым чатам раньше, чем растить _buf
+        self._buf = bytearray()
+        self._loose = {}    # chat_id -> список dict: записи, которые не кодируются (старые коды и т.п.)
+
+    def __len__(self) -> int:
+        return len(self._slot) + len(self._loose)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._slot or chat_id in self._loose
+
+    def chats(self):
+        yield from self._slot
+        yield from self._loose
+
+    def _offset(self, chat_id: int) -> int:
+        slot = self._slot.get(chat_id)
+        if slot is None:
+            if self._free:
+                slot = self._slot[chat_id] = self._free.pop()
+            else:
+                slot = self._slot[chat_id] = len(self._buf) // self.slot_size
+                self._buf.extend(bytes(self.slot_size))
+        return slot * self.slot_size
+
+    def _records(self, off: int, buf=None) -> list:
+        buf = self._buf if buf is None else buf
+        count, head = buf[off], buf[off + 1]
+        start = (head - count) % self.keep
+        return [REC.unpack_from(buf, off + 2 + ((start + i) % self.keep) * REC.size) for i in range(count)]
+
+    def append(self, chat_id: int, entry: dict):
+        if chat_id in self._loose:
+            self._loose[chat_id] = (self._loose[chat_id] + [entry])[-self.keep:]
+            return
+        rec = encode(entry)
+        if rec is None:
+            self._loose[chat_id] = (self.history(chat_id) + [entry])[-self.keep:]
+            self._drop_slot(chat_id)
+            return
+        off = self._offset(chat_id)
+        count, head = self._buf[off], self._buf[off + 1]
+        REC.pack_into(self._buf, off + 2 + head * REC.size, *rec)
+        self._buf[off] = min(count + 1, self.keep)
+        self._buf[off + 1] = (head + 1) % self.keep
+
+    def history(self, chat_id: int) -> list:
+        if chat_id in self._loose:
+            return list(self._loose[chat_id])
+        slot = self._slot.get(chat_id)
+        if slot is None:
+            return []
+        return [decode(*r) for r in self._records(slot * self.slot_size)]
+
+    def set(self, chat_id: int, items: list):
+        """Заменить историю чата целиком (загрузка из бэкенда)."""
+        items = list(items)[-self.keep:]
+        recs = [encode(it) for it in items]
+        if any(r is None for r in recs):
+            self._loose[chat_id] = items
+            self._drop_slot(chat_id)
+            return
+        self._loose.pop(chat_id, None)
+        off = self._offset(chat_id)
+        self._buf[off], self._buf[off + 1] = len(recs), len(recs) % self.keep
+        for i, r in enumerate(recs):
+            REC.pack_into(self._buf, off + 2 + i * REC.size, *r)
+
+    def _drop_slot(self, chat_id: int):
+        # буфер не переупаковываем: слот обнуляется и ждёт следующего нового чата
+        slot = self._slot.pop(chat_id, None)
+        if slot is not None:
+            off = slot * self.slot_size
+            self._buf[off:off + self.slot_size] = bytes(self.slot_size)
+            self._free.append(slot)
+
+    # ——— бинарный формат и JSON
+    def dumps(self) -> bytes:
+        """MAGIC, keep, число чатов, коды несчастий; chat_id (int64) и слоты по порядку; JSON «рыхлых» чатов."""
+        ids = array("q", self._slot)
+        slots = bytearray()
+        for chat_id in ids:
+            off = self._slot[chat_id] * self.slot_size
+            slots += self._buf[off:off + self.slot_size]
+        codes = json.dumps(CODES).encode()
+        loose = json.dumps({str(k): v for k, v in self._loose.items()}, ensure_ascii=False).encode()
+        head = self.MAGIC + struct.pack("<HIII", self.keep, len(ids), len(codes), len(loose))
+        return head + codes + ids.tobytes() + bytes(slots) + loose
+
+    @classmethod
+    def loads(cls, data: bytes) -> "HistoryRing":
+        if data[:len(cls.MAGIC)] != cls.MAGIC:
+            raise ValueError("not a history ring")
+        pos = len(cls.MAGIC)
+        keep, n, n_codes, n_loose = struct.unpack_from("<HIII", data, pos)
+        pos += struct.calcsize("<HIII")
+        codes = json.loads(data[pos:pos + n_codes]); pos += n_codes
+        ring = cls(keep)
+        ids = array("q"); ids.frombytes(data[pos:pos + 8 * n]); pos += 8 * n
+        slots = data[pos:pos + n * ring.slot_size]; pos += n * ring.slot_size
+        loose = json.loads(data[pos:pos + n_loose] or b"{}")
+        if codes == CODES:
+            ring._buf = bytearray(slots)
+            ring._slot = {chat_id: i for i, chat_id in enumerate(ids)}
+        else:
+            # список несчастий поменялся — перекодируем через коды
+            for i, chat_id in enumerate(ids):
+                ring.set(chat_id, [{"ts": _ts(m), "doom": codes[d], "lvl": l}
+                                   for m, d, l in ring._records(i * ring.slot_size, slots)])
+        for k, v in loose.items():
+            ring._loose[int(k)] = v
+        return ring
+
+    def to_json(self) -> dict:
+        return {str(chat_id): self.history(chat_id) for chat_id in self.chats()}
+
+    @classmethod
+    def from_json(cls, db: dict, keep: int = 5) -> "HistoryRing":
+        ring = cls(keep)
+        for key, items in db.items():
+            ring.set(int(key), items)
+        return ring
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 3 or argv[0] not in ("export", "import"):
+        raise SystemExit(__doc__)
+    cmd, src, dst = argv
+    if cmd == "export":
+        with open(src, "rb") as f:
+            db = HistoryRing.loads(f.read()).to_json()
+        with open(dst, "w", encoding="utf-8") as f:
+            json.dump(db, f, ensure_ascii=False, indent=2)
+    else:
+        with open(src, "r", encoding="utf-8") as f:
+            data = HistoryRing.from_json(json.load(f)).dumps()
+        tmp = dst + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, dst)
+
+if __name__ == "__main__":
+    main()
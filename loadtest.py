@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""Нагрузочный прогон целиком: бот (build_application + наш вебхук-сервер) против локальной заглушки Bot API.
+
+    python loadtest.py --rate 200 --duration 20 --chats 2000
+    python loadtest.py --mix howl=50,howl_now=30,reply=10,last=5,start=5 --api-latency-ms 40
+    python loadtest.py --serve-api 8081      # только заглушка; бота запускать с TELEGRAM_API_URL=http://127.0.0.1:8081
+
+Апдейты идут POST-ом в вебхук с заданной частотой; задержка — от POST до последнего sendX бота в этот чат.
+Сеть наружу не трогаем: все вызовы Bot API уходят в заглушку, она считает вызовы и байты.
+"""
+import os, sys, json, time, random, shutil, asyncio, hashlib, argparse, tempfile, logging
+from collections import Counter, defaultdict, deque
+
+import tornado.web
+import tornado.httpclient
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "HOWL", "username": "howl_load_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": True}
+PROMPT = "Пришлите момент в формате: YYYY-MM-DD HH:MM (местное время)"
+TERMINAL = {"sendMessage", "sendPhoto", "sendDocument"}  # этим ответом заканчивается обработка апдейта
+
+# ====== Заглушка Bot API ======
+class FakeApiStats:
+    def __init__(self):
+        self.calls = Counter()
+        self.bytes_in = Counter()
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.file_id_sends = 0
+        self.pending = defaultdict(deque)   # chat_id -> время отправки апдейтов, ждущих ответа
+        self.latencies = []
+        self.unmatched = 0
+        self._msg_id = 1000
+
+    def next_message_id(self) -> int:
+        self._msg_id += 1
+        return self._msg_id
+
+    def expect(self, chat_id: int):
+        self.pending[chat_id].append(time.perf_counter())
+
+    def answered(self, chat_id: int):
+        q = self.pending.get(chat_id)
+        if q:
+            self.latencies.append(time.perf_counter() - q.popleft())
+            if not q:
+                del self.pending[chat_id]
+        else:
+            self.unmatched += 1
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self.pending.values())
+
+class FakeApiHandler(tornado.web.RequestHandler):
+    def initialize(self, stats: FakeApiStats, latency: float):
+        self.stats = stats
+        self.latency = latency
+
+    def _arg(self, name, default=None):
+        v = self.get_body_argument(name, None)
+        if v is None and self.request.headers.get("Content-Type", "").startswith("application/json"):
+            v = json.loads(self.request.body or b"{}").get(name)
+        return default if v is None else v
+
+    async def post(self, token: str, method: str):
+        st = self.stats
+        st.calls[method] += 1
+        st.bytes_in[method] += len(self.request.body)
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        result = True
+        if method == "getMe":
+            result = BOT_USER
+        elif method in TERMINAL:
+            chat_id = int(self._arg("chat_id", 0))
+            msg = {"message_id": st.next_message_id(), "date": int(time.time()), "from": BOT_USER,
+                   "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"}}
+            if method == "sendMessage":
+                msg["text"] = self._arg("text", "")
+            else:
+                field = "photo" if method == "sendPhoto" else "document"
+                files = self.request.files.get(field)
+                if files:
+                    st.uploads += 1
+                    st.upload_bytes += len(files[0]["body"])
+                    fid = "F" + hashlib.sha1(files[0]["body"]).hexdigest()[:24]
+                else:
+                    st.file_id_sends += 1
+                    fid = str(self._arg(field, ""))
+                if field == "photo":
+                    msg["photo"] = [{"file_id": fid, "file_unique_id": fid[-12:], "width": 512, "height": 512}]
+                else:
+                    msg["document"] = {"file_id": fid, "file_unique_id": fid[-12:]}
+                msg["caption"] = self._arg("caption", "")
+            result = msg
+            st.answered(chat_id)
+        elif method == "answerInlineQuery":
+            st.answered(int(str(self._arg("inline_query_id", "0")).split(":")[0]))
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({"ok": True, "result": result}))
+
+def make_fake_api(stats: FakeApiStats, latency: float = 0.0) -> tornado.web.Application:
+    return tornado.web.Application([
+        (r"/bot([^/]+)/(\w+)", FakeApiHandler, {"stats": stats, "latency": latency}),
+    ])
+
+# ====== Генератор апдейтов ======
+class UpdateFactory:
+    def __init__(self, chats: list, seed: int = 1):
+        self.chats = chats
+        self.rng = random.Random(seed)
+        self.update_id = 0
+        self.message_id = 0
+
+    def _base(self, chat_id: int):
+        self.update_id += 1
+        self.message_id += 1
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "group"}
+        user = {"id": abs(chat_id), "is_bot": False, "first_name": "load"}
+        return chat, user
+
+    def _message(self, chat_id, text, **extra):
+        chat, user = self._base(chat_id)
+        msg = {"message_id": self.message_id, "date": int(time.time()), "chat": chat, "from": user, "text": text}
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        msg.update(extra)
+        return {"update_id": self.update_id, "message": msg}
+
+    def make(self, kind: str, chat_id: int) -> dict:
+        if kind == "howl":
+            if self.rng.random() < 0.3:
+                return self._message(chat_id, f"/howl 2025-{self.rng.randint(1, 12):02d}-{self.rng.randint(1, 28):02d} "
+                                               f"{self.rng.randint(0, 23):02d}:{self.rng.randint(0, 59):02d}")
+            return self._message(chat_id, "/howl")
+        if kind in ("last", "start", "week", "forecast"):
+            return self._message(chat_id, "/" + kind)
+        if kind == "reply":
+            chat, _ = self._base(chat_id)
+            prompt = {"message_id": self.message_id, "date": int(time.time()), "chat": chat, "from": BOT_USER,
+                      "text": PROMPT}
+            return self._message(chat_id, f"2025-{self.rng.randint(1, 12):02d}-{self.rng.randint(1, 28):02d} "
+                                          f"{self.rng.randint(0, 23):02d}:{self.rng.randint(0, 59):02d}",
+                                 reply_to_message=prompt)
+        if kind == "howl_now":
+            chat, user = self._base(chat_id)
+            bot_msg = {"message_id": self.message_id, "date": int(time.time()), "chat": chat, "from": BOT_USER,
+                       "text": "HOWL"}
+            return {"update_id": self.update_id, "callback_query": {
+                "id": str(self.update_id), "from": user, "chat_instance": str(chat_id),
+                "message": bot_msg, "data": "howl_now"}}
+        if kind == "inline":
+            # ответ на inline приходит без chat_id — ждущий чат берём из id запроса
+            _, user = self._base(chat_id)
+            return {"update_id": self.update_id, "inline_query": {
+                "id": f"{chat_id}:{self.update_id}", "from": user, "query": "", "offset": ""}}
+        raise ValueError(kind)
+
+def parse_mix(s: str) -> dict:
+    mix = {}
+    for part in s.split(","):
+        k, _, v = part.partition("=")
+        mix[k.strip()] = float(v or 1)
+    return mix
+
+def _pct(xs, p):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return round(xs[min(len(xs) - 1, int(p * len(xs)))] * 1000, 2)
+
+# ====== Прогон ======
+async def run(args) -> dict:
+    stats = FakeApiStats()
+    api = make_fake_api(stats, args.api_latency_ms / 1000).listen(args.api_port, "127.0.0.1")
+    api_url = f"http://127.0.0.1:{args.api_port}"
+
+    import bot
+    from web import make_web_app
+    bot.prepare()
+    app = bot.build_application(TOKEN, api_url)
+    hook = make_web_app(app, url_path=TOKEN, feeds=bot.FEEDS).listen(args.webhook_port, "127.0.0.1")
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+    tornado.httpclient.AsyncHTTPClient.configure(None, max_clients=args.max_clients)
+    client = tornado.httpclient.AsyncHTTPClient()
+    hook_url = f"http://127.0.0.1:{args.webhook_port}/{TOKEN}"
+    rng = random.Random(args.seed)
+    chats = [rng.randrange(10**6, 10**9) * (-1 if rng.random() < args.group_share else 1) for _ in range(args.chats)]
+    factory = UpdateFactory(chats, args.seed)
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    sent = Counter()
+    post_errors = 0
+
+    async def post(payload: dict, chat_id: int):
+        nonlocal post_errors
+        stats.expect(chat_id)
+        try:
+            await client.fetch(hook_url, method="POST", body=json.dumps(payload),
+                               headers={"Content-Type": "application/json"})
+        except Exception as e:
+            post_errors += 1
+            logging.warning("webhook POST failed: %s", e)
+
+    tasks = []
+    t0 = time.perf_counter()
+    n_total = int(args.rate * args.duration)
+    for i in range(n_total):
+        target = t0 + i / args.rate
+        delay = target - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind = rng.choices(kinds, weights)[0]
+        chat_id = rng.choice(chats)
+        sent[kind] += 1
+        tasks.append(asyncio.ensure_future(post(factory.make(kind, chat_id), chat_id)))
+    await asyncio.gather(*tasks)
+    send_time = time.perf_counter() - t0
+    deadline = time.perf_counter() + args.drain
+    while stats.waiting and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    wall = time.perf_counter() - t0
+
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    hook.stop()
+    api.stop()
+
+    lat = stats.latencies
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out",)},
+        "updates_sent": dict(sent),
+        "offered_rate": round(n_total / send_time, 1) if send_time else None,
+        "completed": len(lat),
+        "lost": stats.waiting,
+        "post_errors": post_errors,
+        "throughput_per_sec": round(len(lat) / wall, 1) if wall else None,
+        "latency_ms": {"p50": _pct(lat, .50), "p90": _pct(lat, .90), "p99": _pct(lat, .99),
+                       "max": round(max(lat) * 1000, 2) if lat else None},
+        "outbound_calls": dict(stats.calls),
+        "outbound_bytes": dict(stats.bytes_in),
+        "photo_uploads": stats.uploads,
+        "photo_upload_bytes": stats.upload_bytes,
+        "photo_file_id_sends": stats.file_id_sends,
+        "unmatched_replies": stats.unmatched,
+    }
+
+async def serve_api(port: int, latency: float):
+    stats = FakeApiStats()
+    make_fake_api(stats, latency).listen(port, "127.0.0.1")
+    logging.info("fake Bot API on http://127.0.0.1:%d", port)
+    try:
+        while True:
+            await asyncio.sleep(10)
+            logging.info("calls: %s; uploads %d (%d bytes), file_id sends %d",
+                         dict(stats.calls), stats.uploads, stats.upload_bytes, stats.file_id_sends)
+    except asyncio.CancelledError:
+        pass
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rate", type=float, default=100, help="апдейтов в секунду")
+    ap.add_argument("--duration", type=float, default=10, help="секунд генерации")
+    ap.add_argument("--chats", type=int, default=1000)
+    ap.add_argument("--group-share", type=float, default=0.2, help="доля групповых чатов")
+    ap.add_argument("--mix", default="howl=40,howl_now=30,reply=10,last=10,start=10")
+    ap.add_argument("--api-latency-ms", type=float, default=30, help="имитация RTT до Bot API")
+    ap.add_argument("--api-port", type=int, default=18081)
+    ap.add_argument("--webhook-port", type=int, default=18080)
+    ap.add_argument("--max-clients", type=int, default=500)
+    ap.add_argument("--drain", type=float, default=30, help="сколько ждать недоотвеченные апдейты")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--keep-state", action="store_true", help="не удалять временный каталог с состоянием")
+    ap.add_argument("--outbox", action="store_true",
+                    help="с очередью исходящих под лимиты Telegram (по умолчанию выключена: меряем сам процесс)")
+    ap.add_argument("--serve-api", type=int, metavar="PORT", help="только поднять заглушку Bot API")
+    ap.add_argument("--out", default="loadtest.json")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.serve_api:
+        asyncio.run(serve_api(args.serve_api, args.api_latency_ms / 1000))
+        return
+
+    # состояние бота — во временном каталоге, ассеты — из репозитория
+    out = os.path.abspath(args.out)
+    work = tempfile.mkdtemp(prefix="howl_load_")
+    os.environ["ASSETS_DIR"] = os.path.join(REPO, "assets")
+    os.environ.setdefault("MEDIA_PACK", os.path.join(REPO, "assets_built", "assets.pack"))
+    os.environ.setdefault("STORAGE", "sqlite:" + os.path.join(work, "howls.db"))
+    os.environ["MEDIA_CACHE_FILE"] = os.path.join(work, "media_cache.json")
+    os.environ["OUTBOX"] = "1" if args.outbox else "0"
+    os.environ.pop("WEBHOOK_URL", None)
+    os.environ.pop("RENDER_EXTERNAL_URL", None)
+    shutil.copy(os.path.join(REPO, "welcome.png"), work)
+    os.chdir(work)
+    sys.path.insert(0, REPO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        os.chdir(REPO)
+        if not args.keep_state:
+            shutil.rmtree(work, ignore_errors=True)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
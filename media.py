@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""Картинки для ответов: индекс ассетов и кэш Telegram file_id, чтобы не грузить одни и те же PNG заново."""
+import os, json, mmap, struct, asyncio, hashlib, logging, time
+from fnmatch import fnmatchcase
+
+from telegram.error import BadRequest
+
+from metrics import TELEGRAM_SECONDS, UPLOAD_BYTES
+
+# ====== Индекс ассетов ======
+IMAGE_EXTS = ["png", "jpg", "jpeg", "webp"]
+
+def match_asset(code: str, d: str, names) -> str | None:
+    """Те же правила, что были у glob: <code>.ext, <code>_*.ext, <code>-*.ext (ext в нижнем/ВЕРХНЕМ регистре),
+    иначе — первый файл, чьё имя без расширения в любом регистре = code / code_* / code-*."""
+    base = code.lower()
+    found = []
+    for ext in IMAGE_EXTS:
+        for e in (ext, ext.upper()):
+            for pat in (f"{base}.{e}", f"{base}_*.{e}", f"{base}-*.{e}"):
+                found += [os.path.join(d, n) for n in names if fnmatchcase(n, pat)]
+    if found:
+        return sorted(found)[0]
+    for n in sorted(names):
+        stem = os.path.splitext(n)[0].lower()
+        if stem == base or stem.startswith(base + "_") or stem.startswith(base + "-"):
+            return os.path.join(d, n)
+    return None
+
+def file_sha1(p: str) -> str:
+    h = hashlib.sha1()
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class AssetIndex:
+    """code -> путь к картинке. Каталог читаем один раз и перечитываем, только если сменился его mtime."""
+
+    def __init__(self, d: str, check_every: float = 5.0, state: dict | None = None):
+        self.dir = d
+        self.check_every = check_every
+        self._mtime = None
+        self._checked = 0.0
+        self._names = []
+        self._by_code = {}
+        if not self.restore(state):
+            self.reload()
+
+    def state(self) -> dict:
+        """Для снапшота: что лежало в каталоге и при каком его mtime."""
+        return {"dir": self.dir, "mtime": self._mtime, "names": list(self._names)}
+
+    def restore(self, state: dict | None) -> bool:
+        """Принять список файлов из снапшота, если каталог с тех пор не менялся."""
+        if not state or state.get("dir") != self.dir:
+            return False
+        try:
+            if os.stat(self.dir).st_mtime_ns != state["mtime"]:
+                return False
+        except OSError:
+            return False
+        self._mtime, self._names, self._by_code = state["mtime"], list(state["names"]), {}
+        self._checked = time.monotonic()
+        return True
+
+    def reload(self):
+        try:
+            self._mtime = os.stat(self.dir).st_mtime_ns
+            self._names = [e.name for e in os.scandir(self.dir) if e.is_file()]
+        except OSError:
+            self._mtime = None
+            self._names = []
+        self._by_code = {}
+        self._checked = time.monotonic()
+        logging.info("asset index: %d files in %s", len(self._names), self.dir)
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_every:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.dir).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    @property
+    def exists(self) -> bool:
+        self._maybe_refresh()
+        return self._mtime is not None
+
+    def get(self, code: str) -> str | None:
+        self._maybe_refresh()
+        code = code.lower()
+        if code not in self._by_code:
+            self._by_code[code] = match_asset(code, self.dir, self._names)
+        return self._by_code[code]
+
+    def missing(self, codes) -> list:
+        return [c for c in codes if not self.get(c)]
+
+    def names(self) -> list:
+        self._maybe_refresh()
+        return sorted(self._names)
+
+# ====== Собранные картинки (media_build.py) ======
+class MediaManifest:
+    """key -> готовый файл нужного варианта из manifest.json. Если исходник поменялся после сборки,
+    запись не отдаём (старая картинка хуже, чем медленная), и бот берёт исходник из assets/."""
+
+    def __init__(self, path: str, variant: str = "photo", state: dict | None = None):
+        self.path = path
+        self.dir = os.path.dirname(path)
+        self.variant = variant
+        self._files = {}
+        self.stale = []
+        self._sources = []
+        self._sig = None
+        if not self.restore(state):
+            self.load()
+
+    def _signature(self):
+        """(mtime_ns, size) манифеста, готовых файлов и исходников: не поменялись — хэши сверять незачем."""
+        out = []
+        for p in [self.path] + sorted(set(self._files.values())) + sorted(self._sources):
+            try:
+                st = os.stat(p)
+                out.append((p, st.st_mtime_ns, st.st_size))
+            except OSError:
+                out.append((p, None, None))
+        return out
+
+    def state(self) -> dict:
+        return {"path": self.path, "variant": self.variant, "files": dict(self._files),
+                "sources": list(self._sources), "stale": list(self.stale), "sig": self._sig}
+
+    def restore(self, state: dict | None) -> bool:
+        if not state or (state.get("path"), state.get("variant")) != (self.path, self.variant):
+            return False
+        self._files, self._sources, self.stale = dict(state["files"]), list(state["sources"]), list(state["stale"])
+        if self._signature() != state.get("sig"):
+            self._files, self._sources, self.stale = {}, [], []
+            return False
+        self._sig = state["sig"]
+        return True
+
+    def load(self):
+        self._files, self._sources, self.stale = {}, [], []
+        self._sig = None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                m = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning("media manifest %s unreadable: %s", self.path, e)
+            return
+        for key, a in m.get("assets", {}).items():
+            v = a.get("variants", {}).get(self.variant)
+            p = v and os.path.join(self.dir, v["file"])
+            src = a.get("source")
+            if src and os.path.exists(src):
+                self._sources.append(src)
+            try:
+                # исходника нет (assets.zip не распакован) — собранный файл самодостаточен
+                fresh = not src or not os.path.exists(src) or file_sha1(src) == a.get("sha1")
+            except OSError:
+                fresh = False
+            if p and fresh and os.path.exists(p):
+                self._files[key] = p
+            else:
+                self.stale.append(key)
+        self._sig = self._signature()
+        logging.info("media manifest: %d %s files in %s", len(self._files), self.variant, self.dir)
+        if self.stale:
+            logging.warning("media manifest: stale or missing %s, rerun media_build.py", ", ".join(sorted(self.stale)))
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def get(self, key: str) -> str | None:
+        return self._files.get(key.lower())
+
+    def paths(self) -> list:
+        return sorted(set(self._files.values()))
+
+# ====== Пак картинок (media_build.py) ======
+PACK_MAGIC = b"HOWLPAK2"
+PACK_HEAD = struct.Struct("<8sI")  # MAGIC, длина JSON-индекса; дальше индекс и картинки подряд
+
+class AssetPack:
+    """Все картинки одним файлом: открываем один раз через mmap, отдаём срезы memoryview без копий.
+
+    Индекс: ключ (код несчастья, "welcome", "icon:<py>") -> [имя, смещение, длина, sha1, исходник, sha1 исходника].
+    Имя — путь, под которым картинка лежала бы на диске: под ним же в MediaCache её file_id.
+    Как и у MediaManifest: если исходник в assets/ поменялся после сборки, запись не отдаём — бот возьмёт файл."""
+
+    def __init__(self, path: str, state: dict | None = None):
+        self.path = path
+        self.stale = []
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n = PACK_HEAD.unpack_from(self._mm, 0)
+        if magic != PACK_MAGIC:
+            raise ValueError(f"{path}: not an asset pack")
+        index = json.loads(self._mm[PACK_HEAD.size:PACK_HEAD.size + n])
+        self.variant = index.get("variant")
+        self._view = memoryview(self._mm)
+        self._entries = {}
+        self._sources = {}  # ключ -> (исходник, его sha1 на момент сборки)
+        for key, (name, off, size, sha, src, src_sha) in index["entries"].items():
+            if off + size > len(self._mm):
+                raise ValueError(f"{path}: entry {key} out of bounds")
+            self._entries[key] = (name, self._view[off:off + size], sha)
+            if src:
+                self._sources[key] = (src, src_sha)
+        self._check_sources(state)
+        logging.info("asset pack: %d images, %d bytes in %s", len(self._entries), len(self._mm), path)
+        if self.stale:
+            logging.warning("asset pack: sources changed for %s, rerun media_build.py", ", ".join(self.stale))
+
+    def _signature(self):
+        """(mtime_ns, size) пака и исходников: не поменялись — хэши сверять незачем."""
+        out = []
+        for p in [self.path] + sorted({src for src, _ in self._sources.values()}):
+            try:
+                st = os.stat(p)
+                out.append((p, st.st_mtime_ns, st.st_size))
+            except OSError:
+                out.append((p, None, None))
+        return out
+
+    def _check_sources(self, state: dict | None):
+        sig = self._signature()
+        if state and state.get("path") == self.path and state.get("sig") == sig:
+            stale = list(state["stale"])
+        else:
+            stale = []
+            for key, (src, src_sha) in self._sources.items():
+                try:
+                    # исходника нет (assets.zip не распакован) — пак самодостаточен
+                    if os.path.exists(src) and file_sha1(src) != src_sha:
+                        stale.append(key)
+                except OSError:
+                    stale.append(key)
+        self._sig, self.stale = sig, sorted(stale)
+        for key in self.stale:
+            self._entries.pop(key, None)
+
+    def state(self) -> dict:
+        """Для снапшота: какие записи устарели при каких mtime/size."""
+        return {"path": self.path, "sig": self._sig, "stale": list(self.stale)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key.lower() in self._entries
+
+    @property
+    def size(self) -> int:
+        return len(self._mm)
+
+    def get(self, key: str):
+        """(имя, memoryview, sha1) или None."""
+        return self._entries.get(key.lower())
+
+    def missing(self, keys) -> list:
+        return [k for k in keys if k.lower() not in self._entries]
+
+    def keys(self) -> list:
+        return sorted(self._entries)
+
+# ====== Кэш file_id ======
+class MediaCache:
+    """path -> {sha1, file_id}. Хэш пересчитываем только если сменились mtime/size файла.
+    Новые file_id пишутся в файл не сразу, а через save() (фоном и при остановке); при нескольких
+    воркерах — сразу в общую базу (share), иначе каждый перезаписывал бы файл своей копией."""
+
+    def __init__(self, path: str = "media_cache.json"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.uploaded_bytes = 0
+        self.changed = False
+        self.shared = None  # Storage с media_get/put/forget, если file_id общие
+        self._stat = {}   # path -> ((mtime_ns, size), sha1)
+        self._db = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _write(self, db: dict):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(db, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def share(self, store):
+        """Несколько воркеров: file_id берём из общей базы и пишем туда же, файл больше не трогаем."""
+        self.shared = store
+
+    async def save(self):
+        """Записать файл в потоке, если с прошлого раза появились или пропали file_id."""
+        if not self.changed or self.shared is not None:
+            return
+        db, self.changed = dict(self._db), False
+        try:
+            await asyncio.to_thread(self._write, db)
+        except OSError as e:
+            self.changed = True
+            logging.warning("media cache not saved: %s", e)
+
+    def _digest(self, p: str) -> str:
+        st = os.stat(p)
+        sig = (st.st_mtime_ns, st.st_size)
+        cached = self._stat.get(p)
+        if cached and cached[0] == sig:
+            return cached[1]
+        digest = file_sha1(p)
+        self._stat[p] = (sig, digest)
+        return digest
+
+    def get(self, p: str, digest: str | None = None):
+        digest = digest or self._digest(p)
+        it = self._db.get(p)
+        if self.shared is not None and (not it or it.get("sha1") != digest):
+            row = self.shared.media_get(p)  # могли загрузить в другом воркере
+            if row:
+                it = self._db[p] = {"sha1": row[0], "file_id": row[1]}
+        if it and it.get("sha1") == digest:
+            return it.get("file_id")
+        return None
+
+    def put(self, p: str, file_id: str, digest: str | None = None):
+        it = self._db[p] = {"sha1": digest or self._digest(p), "file_id": file_id}
+        if self.shared is not None:
+            try:
+                self.shared.media_put(p, it["sha1"], file_id)
+            except Exception as e:
+                logging.warning("media file_id not shared: %s", e)
+        else:
+            self.changed = True
+
+    def forget(self, p: str):
+        if self._db.pop(p, None) is None and self.shared is None:
+            return
+        if self.shared is not None:
+            try:
+                self.shared.media_forget(p)
+            except Exception as e:
+                logging.warning("media file_id not forgotten: %s", e)
+        else:
+            self.changed = True
+
+    def digests(self) -> dict:
+        """Для снапшота: уже посчитанные sha1 файлов (с mtime/size, так что сами себя проверяют)."""
+        return dict(self._stat)
+
+    def prime(self, paths):
+        """Посчитать sha1 заранее (для снапшота), чтобы первая отправка не читала файл целиком."""
+        for p in paths:
+            try:
+                self._digest(p)
+            except OSError:
+                pass
+
+    def restore_digests(self, stat: dict):
+        for p, v in (stat or {}).items():
+            self._stat.setdefault(p, tuple(v))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._db),
+                "uploaded_bytes": self.uploaded_bytes}
+
+    async def reply_photo(self, message, p: str, data: bytes | memoryview | None = None, digest: str | None = None,
+                          **kwargs):
+        """reply_photo по file_id, если он есть и файл не менялся; иначе загрузка и запоминание id.
+        data/digest — картинка уже в памяти (или срез пака): тогда файл не трогаем вовсе, p — только ключ кэша."""
+        fid = self.get(p, digest)
+        if fid:
+            try:
+                with TELEGRAM_SECONDS.time(mode="file_id"):
+                    msg = await message.reply_photo(photo=fid, **kwargs)
+                self.hits += 1
+                return msg
+            except BadRequest as e:
+                logging.warning("cached file_id rejected for %s: %s", p, e)
+                self.forget(p)
+        self.misses += 1
+        if data is not None:
+            # PTB принимает bytes, а не memoryview: копия — только здесь, при загрузке; по file_id срез не читаем
+            photo = data if isinstance(data, bytes) else bytes(data)
+            with TELEGRAM_SECONDS.time(mode="upload"):
+                msg = await message.reply_photo(photo=photo, **kwargs)
+            size = len(data)
+        else:
+            with open(p, "rb") as f, TELEGRAM_SECONDS.time(mode="upload"):
+                msg = await message.reply_photo(photo=f, **kwargs)
+            size = os.path.getsize(p)
+        self.uploaded_bytes += size
+        UPLOAD_BYTES.inc(size)
+        if msg and msg.photo:
+            self.put(p, msg.photo[-1].file_id, digest)
+        return msg
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Сборка картинок под Telegram: assets/*.png -> assets_built/<hash>.jpg|.png|.webp + manifest.json,
+и пак assets_built/assets.pack — нужный вариант всех картинок, welcome и иконки ветвей одним файлом.
+
+    python media_build.py                   # assets/ и welcome.png -> assets_built/
+    python media_build.py --max-side 960
+    python media_build.py --pack-variant jpeg   # пак под MEDIA_VARIANT=jpeg
+
+Нужен Pillow (только здесь, боту при запуске он не нужен). Одинаковые исходники и одинаковые
+результаты пишутся один раз — имя файла это хэш содержимого. Бот берёт картинки по манифесту,
+а если исходник поменялся после сборки — старым способом из assets/.
+"""
+import os, io, sys, json, hashlib, argparse
+
+from media import IMAGE_EXTS, PACK_HEAD, PACK_MAGIC, match_asset, file_sha1
+
+BUILD_DIR = "assets_built"
+PACK_FILE = "assets.pack"
+BACKGROUND = (20, 20, 24)  # фон под прозрачность — как у иконок ветвей
+VARIANTS = {
+    # Telegram показывает фото не больше 1280 по длинной стороне
+    "jpeg": {"format": "JPEG", "ext": "jpg", "opts": {"quality": 85, "optimize": True, "progressive": True}},
+    "png":  {"format": "PNG", "ext": "png", "opts": {"optimize": True}},
+    "webp": {"format": "WEBP", "ext": "webp", "opts": {"quality": 80, "method": 6}},
+}
+# "photo" — меньший из вариантов, которые sendPhoto точно принимает: плоской графике PNG выгоднее JPEG
+PHOTO_FROM = ("jpeg", "png")
+EXTS = {name: v["ext"] for name, v in VARIANTS.items()}
+
+def _encode(src: str, max_side: int) -> dict:
+    """variant -> (bytes, width, height)."""
+    from PIL import Image
+    with Image.open(src) as im:
+        im.load()
+        if im.mode in ("RGBA", "LA", "P"):
+            im = im.convert("RGBA")
+            bg = Image.new("RGB", im.size, BACKGROUND)
+            bg.paste(im, mask=im.getchannel("A"))
+            im = bg
+        else:
+            im = im.convert("RGB")
+        if max(im.size) > max_side:
+            im.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = {}
+        for name, v in VARIANTS.items():
+            buf = io.BytesIO()
+            im.save(buf, v["format"], **v["opts"])
+            out[name] = (buf.getvalue(), im.width, im.height)
+    out["photo"] = min((out[n] for n in PHOTO_FROM), key=lambda v: len(v[0]))
+    return out
+
+def _ext(data: bytes) -> str:
+    return "png" if data[:8] == b"\x89PNG\r\n\x1a\n" else "jpg"
+
+def sources(src_dir: str, codes, extra: dict) -> dict:
+    """key -> путь к исходнику: коды несчастий по тем же правилам, что и у бота, плюс extra."""
+    names = [n for n in os.listdir(src_dir) if os.path.splitext(n)[1].lstrip(".").lower() in IMAGE_EXTS]
+    found = {}
+    for code in codes:
+        p = match_asset(code, src_dir, names)
+        if p:
+            found[code] = p
+    for key, p in extra.items():
+        if os.path.exists(p):
+            found[key] = p
+    return found
+
+def build(found: dict, out_dir: str = BUILD_DIR, max_side: int = 1280) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    by_source = {}   # sha1 исходника -> variants (дубликаты кодируем один раз)
+    written = set()
+    manifest = {"version": 1, "max_side": max_side, "assets": {}}
+    for key, src in sorted(found.items()):
+        src_sha = file_sha1(src)
+        variants = by_source.get(src_sha)
+        if variants is None:
+            variants = {}
+            for name, (data, w, h) in _encode(src, max_side).items():
+                sha = hashlib.sha1(data).hexdigest()
+                fname = f"{sha[:16]}.{EXTS[name] if name in EXTS else _ext(data)}"
+                if fname not in written:
+                    with open(os.path.join(out_dir, fname), "wb") as f:
+                        f.write(data)
+                    written.add(fname)
+                variants[name] = {"file": fname, "bytes": len(data), "sha1": sha, "width": w, "height": h}
+            by_source[src_sha] = variants
+        manifest["assets"][key] = {"source": src.replace(os.sep, "/"), "bytes": os.path.getsize(src),
+                                   "sha1": src_sha, "variants": variants}
+    # старые файлы прошлых сборок больше никто не упоминает
+    for n in os.listdir(out_dir):
+        if n not in ("manifest.json", PACK_FILE) and n not in written:
+            os.remove(os.path.join(out_dir, n))
+    tmp = os.path.join(out_dir, "manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(out_dir, "manifest.json"))
+    return manifest
+
+def write_pack(manifest: dict, out_dir: str = BUILD_DIR, variant: str = "photo", extra: dict | None = None) -> dict:
+    """Пак: заголовок, JSON-индекс, картинки подряд (одинаковые — один раз). extra — ключ -> файл (иконки)."""
+    files = {}   # ключ -> (имя, путь, исходник, sha1 исходника)
+    for key, a in manifest["assets"].items():
+        v = a["variants"].get(variant)
+        if v:
+            files[key.lower()] = (f"{os.path.basename(out_dir)}/{v['file']}", os.path.join(out_dir, v["file"]),
+                                  a["source"], a["sha1"])
+    for key, p in (extra or {}).items():
+        if os.path.exists(p):
+            files[key.lower()] = (p.replace(os.sep, "/"), p, None, None)  # иконки рисуются из кода, сверять не с чем
+    blobs, at, entries = [], {}, {}
+    for key, (name, p, src, src_sha) in sorted(files.items()):
+        with open(p, "rb") as f:
+            data = f.read()
+        sha = hashlib.sha1(data).hexdigest()
+        if sha not in at:
+            at[sha] = sum(len(b) for b in blobs)
+            blobs.append(data)
+        entries[key] = [name, at[sha], len(data), sha, src, src_sha]
+    # смещения в индексе абсолютные, а длина индекса зависит от них — подгоняем, пока не сойдётся
+    base = 0
+    while True:
+        index = {"version": 1, "variant": variant,
+                 "entries": {k: [n, base + off, *rest] for k, (n, off, *rest) in entries.items()}}
+        raw = json.dumps(index, ensure_ascii=False, sort_keys=True).encode()
+        if PACK_HEAD.size + len(raw) == base:
+            break
+        base = PACK_HEAD.size + len(raw)
+    path = os.path.join(out_dir, PACK_FILE)
+    with open(path + ".tmp", "wb") as f:
+        f.write(PACK_HEAD.pack(PACK_MAGIC, len(raw)) + raw)
+        for b in blobs:
+            f.write(b)
+    os.replace(path + ".tmp", path)
+    return index
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--src", default=os.getenv("ASSETS_DIR", "assets"))
+    ap.add_argument("--out", default=BUILD_DIR)
+    ap.add_argument("--max-side", type=int, default=1280)
+    ap.add_argument("--pack-variant", default="photo", choices=list(VARIANTS) + ["photo"])
+    args = ap.parse_args(argv)
+    from misfortune import MISFORTUNES, BRANCHES, ensure_icons, icon_filename
+    found = sources(args.src, [m["code"] for m in MISFORTUNES], {"welcome": "welcome.png"})
+    manifest = build(found, args.out, args.max_side)
+    ensure_icons()
+    pack = write_pack(manifest, args.out, args.pack_variant, {f"icon:{py}": icon_filename(py) for _, py, _ in BRANCHES})
+    total_src = sum(a["bytes"] for a in manifest["assets"].values())
+    for name in list(VARIANTS) + ["photo"]:
+        total = sum(a["variants"][name]["bytes"] for a in manifest["assets"].values())
+        print(f"{name:5} {total / 1024:8.1f} KB  (исходники {total_src / 1024:.1f} KB)")
+    print(f"pack  {os.path.getsize(os.path.join(args.out, PACK_FILE)) / 1024:8.1f} KB  "
+          f"({len(pack['entries'])} картинок, {args.pack_variant})")
+    missing = [m["code"] for m in MISFORTUNES if m["code"] not in manifest["assets"]]
+    if missing:
+        print("нет картинок для: " + ", ".join(missing), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""Минимальные метрики в формате Prometheus (text exposition 0.0.4) без внешних зависимостей."""
+import time, functools
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{n}="{esc(v)}"' for n, v in zip(names, values)) + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def _key(self, kw) -> tuple:
+        return tuple(kw.get(n, "") for n in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        k = self._key(labels)
+        self._values[k] = self._values.get(k, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        return [f"{self.name}{_labels(self.labels, k)} {v}" for k, v in self._values.items()]
+
+class Gauge(_Metric):
+    """Значение задаётся set() или считается в момент отдачи функцией fn()."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def collect(self):
+        if self.fn is not None:
+            try:
+                v = self.fn()
+            except Exception:
+                return []
+            return [f"{self.name} {v}"]
+        return [f"{self.name}{_labels(self.labels, k)} {v}" for k, v in self._values.items()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds: float, **labels):
+        k = self._key(labels)
+        st = self._values.get(k)
+        if st is None:
+            st = self._values[k] = [[0] * len(self.buckets), 0.0, 0]
+        for i, b in enumerate(self.buckets):
+            if seconds <= b:
+                st[0][i] += 1
+                break
+        st[1] += seconds
+        st[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels) -> int:
+        st = self._values.get(self._key(labels))
+        return st[2] if st else 0
+
+    def collect(self):
+        out = []
+        for k, (counts, total, n) in self._values.items():
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_labels(self.labels + ('le',), k + (repr(float(b)),))} {acc}")
+            out.append(f"{self.name}_bucket{_labels(self.labels + ('le',), k + ('+Inf',))} {n}")
+            out.append(f"{self.name}_sum{_labels(self.labels, k)} {total}")
+            out.append(f"{self.name}_count{_labels(self.labels, k)} {n}")
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, m):
+        return self._metrics.setdefault(m.name, m)
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), fn=None) -> Gauge:
+        return self._add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics.values():
+            lines += m.header() + m.collect()
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# ====== Метрики бота ======
+HANDLER_SECONDS = REGISTRY.histogram("howl_handler_seconds", "Время обработки апдейта хендлером", ["handler"])
+HANDLER_ERRORS  = REGISTRY.counter("howl_handler_errors_total", "Исключения в хендлерах", ["handler"])
+STORAGE_SECONDS = REGISTRY.histogram("howl_storage_seconds", "Время операций с хранилищем", ["op"])
+ASSET_SECONDS   = REGISTRY.histogram("howl_asset_lookup_seconds", "Поиск картинки по коду несчастья",
+                                     buckets=(.00001, .0001, .001, .01, .1))
+TELEGRAM_SECONDS = REGISTRY.histogram("howl_telegram_send_seconds", "Отправка картинки в Telegram", ["mode"])
+UPLOAD_BYTES    = REGISTRY.counter("howl_upload_bytes_total", "Байт картинок, загруженных в Telegram")
+MEDIA_PATH      = REGISTRY.counter("howl_media_path_total", "Чем закончился send_with_media", ["path"])
+UPDATES_DUPLICATE = REGISTRY.counter("howl_updates_duplicate_total", "Повторно доставленные апдейты (отброшены)")
+OUTBOX_WAIT     = REGISTRY.histogram("howl_outbox_wait_seconds", "Ожидание исходящего запроса в очереди лимитов",
+                                     ["kind"])
+OUTBOX_RETRIES  = REGISTRY.counter("howl_outbox_retries_total", "Повторы исходящих запросов", ["reason"])
+OUTBOX_DROPPED  = REGISTRY.counter("howl_outbox_dropped_total", "Исходящие, отброшенные очередью", ["reason"])
+
+STARTUP_SECONDS = REGISTRY.gauge("howl_startup_seconds", "Фазы холодного старта", ["phase"])
+
+class StartupTimer:
+    """Фазы запуска по порядку: импорт, подготовка, сборка приложения... и первый ответ."""
+
+    def __init__(self, t0: float | None = None):
+        self.t0 = t0 if t0 is not None else time.perf_counter()
+        self.phases = {}
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = seconds
+        STARTUP_SECONDS.set(seconds, phase=name)
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def since_start(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def report(self) -> str:
+        return ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in self.phases.items())
+
+def instrument(name: str, label=None):
+    """Обёртка для PTB-коллбэков: латентность и ошибки в HANDLER_*; label(update) уточняет имя."""
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(update, context):
+            h = name
+            if label is not None:
+                try:
+                    h = f"{name}:{label(update)}"
+                except Exception:
+                    pass
+            t0 = time.perf_counter()
+            try:
+                return await fn(update, context)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=h)
+                raise
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - t0, handler=h)
+        return wrapper
+    return deco
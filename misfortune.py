@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Tuple, Dict, List
-import os
+from datetime import date, datetime, timedelta
+from typing import Tuple, Dict, List, Optional, Iterable, Iterator, Union, Any
+from array import array
+from functools import lru_cache
+import html as _html
+import os, struct, logging
 
 # 10 небесных стволов / 12 земных ветвей
 STEMS      = ["甲","乙","丙","丁","戊","己","庚","辛","壬","癸"]
@@ -75,6 +78,30 @@ MISFORTUNES: List[Dict[str, str]] = [
     {"emoji":"🪦","code":"grim","name":"Мрачный знак","desc":"Доллар по сотке"},
 ]
 
+# ——— мягкие, норм советы (китайская медицина/дао-практики) — можно править под себя
+TIPS: List[str] = [
+    "Дыхание животом 5 минут: выдох длиннее вдоха.",
+    "Шесть звуков: xu/печень, he/сердце, hu/селезёнка, si/лёгкие, chui/почки, xi/тройной обогреватель.",
+    "Растирание ладоней до тепла и прикладывание к глазам 30–60 сек.",
+    "Постукивание грудной клетки 36 раз ладонями.",
+    "Прокатка стопы мячом 1–2 минуты.",
+    "Согреть нижний даньтянь тёплой грелкой 10 минут.",
+    "Имбирный чай с красным фиником и ягодами годжи.",
+    "Тёплая ножная ванна 10–15 минут перед сном.",
+    "HeGu (LI4) и ZuSanLi (ST36) — самомассаж по 1–2 мин.",
+    "NeiGuan (PC6) 1–2 мин; мягкие круги.",
+    "FengChi (GB20) у основания черепа — мягкие круги.",
+    "Круги плечами и шеи по 6 раз в каждую сторону.",
+    "Лёгкая встряска тела 1–2 минуты.",
+    "5–10 минут растяжки/бадуаньцзин — выбери 3–4 движения.",
+    "Проветривание 3 минуты; по желанию лёгкое благовоние.",
+    "Меньше холодного в холодный день; выбирай тёплую пищу.",
+    "Тёплая вода маленькими глотками в течение дня.",
+    "Растирание поясницы (почки) 1–2 минуты до тепла.",
+    "Пауза без экрана 5 минут: взгляд вдаль, плечи вниз.",
+    "Массаж живота по часовой 1–2 минуты.",
+]
+
 # ——— Алгоритм циклов
 EPOCH = datetime(1970,1,1,0,0,0)
 def _idx60(dt: datetime) -> int:      return ((dt - EPOCH).days) % 60
@@ -82,6 +109,11 @@ def _stem(dt: datetime) -> int:        return _idx60(dt) % 10
 def _branch(dt: datetime) -> int:      return _idx60(dt) % 12
 def _hour_branch(dt: datetime) -> int: return ((dt.hour + 1) // 2) % 12  # двухчасовые ветви
 
+def _doom_index(s: int, b: int, hb: int, salt: int) -> int: return (s*12 + b*3 + hb + salt) % len(MISFORTUNES)
+def _doom_level(s: int, b: int, hb: int) -> int:            return ((s + hb + b) % 5) + 1  # 1..5
+def _taboo_index(s: int, b: int, hb: int, salt: int) -> int: return (s*13 + b*7 + hb*3 + salt) % len(TABOOS)
+def _tip_index(s: int, b: int, hb: int) -> int:             return (s + b + hb) % len(TIPS)
+
 # ——— Пиктограммы ветвей (ASCII, чтобы не было «квадратов»)
 ICON_DIR = "icons"
 def icon_filename(py: str) -> str: return os.path.join(ICON_DIR, f"{py}.png")
@@ -112,7 +144,7 @@ def ensure_icons():
         d.text((256, 360), ru, anchor="mm", font=font_ru, fill=(200, 200, 200))
         img.save(p, "PNG")
 
-@dataclass
+@dataclass(slots=True)  # без __dict__: чтений создаётся много, а лишних полей у них не бывает
 class HowlReading:
     dt: datetime
     stem: int
@@ -128,6 +160,8 @@ class HowlReading:
     taboo: str
 
 def read_howl(dt: datetime, salt: int = 0) -> HowlReading:
+    if _TABLE is not None and 0 <= salt < SALTS:
+        return _TABLE.read(dt, salt)
     s  = _stem(dt)
     b  = _branch(dt)
     hb = _hour_branch(dt)
@@ -137,47 +171,24 @@ def read_howl(dt: datetime, salt: int = 0) -> HowlReading:
     hour_branch_tuple = BRANCHES[hb]
 
     # несчастье и степень
-    doom_index = (s*12 + b*3 + hb + salt) % len(MISFORTUNES)
-    doom_level = ((s + hb + b) % 5) + 1  # 1..5
+    doom_index = _doom_index(s, b, hb, salt)
+    doom_level = _doom_level(s, b, hb)
 
     # ВАЖНО: табу еды — детерминированно по дате/часу/чату (не застрянет на «мёд+лук»)
-    taboo_idx = (s*13 + b*7 + hb*3 + salt) % len(TABOOS)
-    taboo = TABOOS[taboo_idx]
+    taboo = TABOOS[_taboo_index(s, b, hb, salt)]
 
     doom = MISFORTUNES[doom_index]
     return HowlReading(dt, s, b, hb, element, yin_yang, branch_tuple, hour_branch_tuple,
                        doom_index, doom_level, doom, taboo)
 
 def render_reading(r: HowlReading) -> str:
-    import html as _html
+    if _TABLE is not None:
+        return _TABLE.render(r)
     han, py, ru    = r.branch_tuple
     hhan, hpy, hru = r.hour_branch_tuple
     stars = "☠️" * r.doom_level
 
-    # мягкие, норм советы (китайская медицина/дао-практики) — можно править под себя
-    tips = [
-        "Дыхание животом 5 минут: выдох длиннее вдоха.",
-        "Шесть звуков: xu/печень, he/сердце, hu/селезёнка, si/лёгкие, chui/почки, xi/тройной обогреватель.",
-        "Растирание ладоней до тепла и прикладывание к глазам 30–60 сек.",
-        "Постукивание грудной клетки 36 раз ладонями.",
-        "Прокатка стопы мячом 1–2 минуты.",
-        "Согреть нижний даньтянь тёплой грелкой 10 минут.",
-        "Имбирный чай с красным фиником и ягодами годжи.",
-        "Тёплая ножная ванна 10–15 минут перед сном.",
-        "HeGu (LI4) и ZuSanLi (ST36) — самомассаж по 1–2 мин.",
-        "NeiGuan (PC6) 1–2 мин; мягкие круги.",
-        "FengChi (GB20) у основания черепа — мягкие круги.",
-        "Круги плечами и шеи по 6 раз в каждую сторону.",
-        "Лёгкая встряска тела 1–2 минуты.",
-        "5–10 минут растяжки/бадуаньцзин — выбери 3–4 движения.",
-        "Проветривание 3 минуты; по желанию лёгкое благовоние.",
-        "Меньше холодного в холодный день; выбирай тёплую пищу.",
-        "Тёплая вода маленькими глотками в течение дня.",
-        "Растирание поясницы (почки) 1–2 минуты до тепла.",
-        "Пауза без экрана 5 минут: взгляд вдаль, плечи вниз.",
-        "Массаж живота по часовой 1–2 минуты.",
-    ]
-    tip = tips[(r.stem + r.branch + r.hour_branch) % len(tips)]
+    tip = TIPS[_tip_index(r.stem, r.branch, r.hour_branch)]
 
     name = _html.escape(r.doom["name"]); desc = _html.escape(r.doom["desc"])
     tip = _html.escape(tip); taboo = _html.escape(r.taboo)
@@ -193,25 +204,286 @@ def render_reading(r: HowlReading) -> str:
     ]
     return "\n".join(lines)
 
-# ——— (опционально) iCalendar на год
-def ics_for_year(year: int) -> str:
-    lines = ["BEGIN:VCALENDAR","VERSION:2.0","PRODID:-//HOWL//ru"]
-    cur = datetime(year, 1, 1)
-    while cur.year == year:
-        r = read_howl(cur)
-        uid  = f"{cur.strftime('%Y%m%d')}-{r.doom['code']}@howl"
-        title = r.doom["name"]
-        desc  = f"{r.doom['emoji']} {r.doom['name']} — {r.doom['desc']} / Табу: {r.taboo}"
-        desc  = desc.replace(",", r"\,").replace(";", r"\;").replace("\n", r"\n")
-        lines += [
-            "BEGIN:VEVENT",
-            f"UID:{uid}",
-            f"DTSTAMP:{cur.strftime('%Y%m%d')}T000000Z",
-            f"DTSTART;VALUE=DATE:{cur.strftime('%Y%m%d')}",
-            f"SUMMARY:{title}",
-            f"DESCRIPTION:{desc}",
-            "END:VEVENT",
-        ]
-        cur += timedelta(days=1)
-    lines.append("END:VCALENDAR")
+# ——— (опционально) таблица всех чтений: 60 дней × 12 часов × SALTS солей
+SALTS = 97  # столько солей даёт bot._salt (abs(chat_id) % 97)
+_TABLE: Optional["ReadingTable"] = None
+
+class ReadingTable:
+    """Индексы несчастья/уровня/табу в array('B') + заранее экранированные куски HTML."""
+    MAGIC = b"HOWLTAB1"
+
+    def __init__(self, cols: Optional[List[array]] = None):
+        if cols is None:
+            cols = self._build()
+        self.doom, self.level, self.taboo = cols
+        self._frag()
+
+    @staticmethod
+    def _shape() -> Tuple[int, ...]:
+        return (SALTS, len(MISFORTUNES), len(TABOOS), len(TIPS))
+
+    @staticmethod
+    def _build() -> List[array]:
+        n = 60 * 12 * SALTS
+        doom, level, taboo = array("B", bytes(n)), array("B", bytes(n)), array("B", bytes(n))
+        for i60 in range(60):
+            s, b = i60 % 10, i60 % 12
+            for hb in range(12):
+                base = (i60 * 12 + hb) * SALTS
+                lvl = _doom_level(s, b, hb)
+                for salt in range(SALTS):
+                    doom[base + salt]  = _doom_index(s, b, hb, salt)
+                    level[base + salt] = lvl
+                    taboo[base + salt] = _taboo_index(s, b, hb, salt)
+        return [doom, level, taboo]
+
+    def _frag(self):
+        # всё, кроме строки со временем, собирается из готовых экранированных строк
+        self.f_head = [f"{m['emoji']} {'☠️' * lvl}  <b>{_html.escape(m['name'])}</b>"
+                       for m in MISFORTUNES for lvl in range(1, 6)]
+        self.f_sign = []
+        for han, py, ru in BRANCHES:
+            for hhan, hpy, hru in BRANCHES:
+                self.f_sign.append(f"🐉 <b>Знак:</b> {ANIMALS.get(py,'?')} {han} {py} / {ru}; "
+                                   f"<i>час</i> {ANIMALS.get(hpy,'?')} {hhan} {hpy}")
+        self.f_desc  = [f"📜 <b>Описание:</b> {_html.escape(m['desc'])}" for m in MISFORTUNES]
+        self.f_elem  = [f"⚖️ <b>Элемент дня:</b> {ELEMENTS[s // 2]} ({YIN_YANG[s % 2]})" for s in range(10)]
+        self.f_taboo = {t: f"🚫 <b>Табу еды:</b> {_html.escape(t)}" for t in TABOOS}
+        self.f_tip   = [f"👻 <b>Совет духов:</b> {_html.escape(t)}" for t in TIPS]
+
+    def read(self, dt: datetime, salt: int = 0) -> HowlReading:
+        i60 = _idx60(dt); hb = _hour_branch(dt)
+        s, b = i60 % 10, i60 % 12
+        k = (i60 * 12 + hb) * SALTS + salt
+        di = self.doom[k]
+        return HowlReading(dt, s, b, hb, ELEMENTS[s // 2], YIN_YANG[s % 2], BRANCHES[b], BRANCHES[hb],
+                           di, self.level[k], MISFORTUNES[di], TABOOS[self.taboo[k]])
+
+    def render(self, r: HowlReading) -> str:
+        return "\n".join((
+            self.f_head[r.doom_index * 5 + r.doom_level - 1],
+            f"🕒 <b>Время:</b> {r.dt.isoformat(sep=' ', timespec='minutes')}",
+            self.f_sign[r.branch * 12 + r.hour_branch],
+            self.f_desc[r.doom_index],
+            self.f_elem[r.stem],
+            self.f_taboo[r.taboo],
+            self.f_tip[_tip_index(r.stem, r.branch, r.hour_branch)],
+        ))
+
+    def dumps(self) -> bytes:
+        return (self.MAGIC + struct.pack("<4H", *self._shape())
+                + b"".join(col.tobytes() for col in (self.doom, self.level, self.taboo)))
+
+    @classmethod
+    def loads(cls, data: bytes) -> Optional["ReadingTable"]:
+        """None, если это не таблица или она собрана под другие списки несчастий/табу."""
+        n, h = 60 * 12 * SALTS, len(cls.MAGIC) + 8
+        if len(data) != h + 3 * n or data[:len(cls.MAGIC)] != cls.MAGIC:
+            return None
+        if struct.unpack("<4H", data[len(cls.MAGIC):h]) != cls._shape():
+            return None
+        return cls([array("B", data[h + i * n:h + (i + 1) * n]) for i in range(3)])
+
+    def save(self, path: str):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.dumps())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["ReadingTable"]:
+        """None, если снапшота нет или он собран под другие списки несчастий/табу."""
+        try:
+            with open(path, "rb") as f:
+                return cls.loads(f.read())
+        except OSError:
+            return None
+
+def enable_reading_table(snapshot: Optional[str] = None, table: Optional[ReadingTable] = None) -> ReadingTable:
+    """Включает таблицу для read_howl/render_reading; со снапшотом — грузит или собирает и сохраняет.
+    table — уже загруженная (например, из общего снапшота кэшей бота)."""
+    global _TABLE
+    if table is None and snapshot:
+        table = ReadingTable.load(snapshot)
+    if table is None:
+        table = ReadingTable()
+        if snapshot:
+            try: table.save(snapshot)
+            except OSError as e: logging.warning("reading table snapshot not saved: %s", e)
+    _TABLE = table
+    return table
+
+def disable_reading_table():
+    global _TABLE
+    _TABLE = None
+
+# ——— Пачка чтений столбцами (календарь, прогнозы, аналитика)
+DateRange = Tuple[datetime, datetime, timedelta]  # [start, stop) с шагом
+
+@dataclass
+class HowlBatch:
+    """Чтения столбцами: в i-й позиции каждого массива — то же, что дал бы read_howl(dt[i], salt)."""
+    dt: Any            # list[datetime] или numpy datetime64[m]
+    stem: Any          # array('B') или numpy.ndarray
+    branch: Any
+    hour_branch: Any
+    doom_index: Any
+    doom_level: Any
+    taboo_index: Any
+    salt: Any = 0
+
+    def __len__(self) -> int:
+        return len(self.stem)
+
+    def doom(self, i: int) -> Dict[str, str]:
+        return MISFORTUNES[int(self.doom_index[i])]
+
+    def reading(self, i: int) -> HowlReading:
+        dt = self.dt[i]
+        if not isinstance(dt, datetime):
+            dt = dt.astype("datetime64[m]").astype(datetime)
+        s, b, hb = int(self.stem[i]), int(self.branch[i]), int(self.hour_branch[i])
+        di = int(self.doom_index[i])
+        return HowlReading(dt, s, b, hb, ELEMENTS[s // 2], YIN_YANG[s % 2], BRANCHES[b], BRANCHES[hb],
+                           di, int(self.doom_level[i]), MISFORTUNES[di], TABOOS[int(self.taboo_index[i])])
+
+def _expand(datetimes_or_range: Union[Iterable[datetime], DateRange]) -> List[datetime]:
+    if isinstance(datetimes_or_range, tuple) and len(datetimes_or_range) == 3 \
+            and isinstance(datetimes_or_range[2], timedelta):
+        start, stop, step = datetimes_or_range
+        out, cur = [], start
+        while cur < stop:
+            out.append(cur); cur += step
+        return out
+    return list(datetimes_or_range)
+
+def read_howl_batch(datetimes_or_range: Union[Iterable[datetime], DateRange], salt: int = 0) -> HowlBatch:
+    """Как read_howl, но для списка моментов или диапазона (start, stop, step); без numpy."""
+    dts = _expand(datetimes_or_range)
+    epoch = EPOCH.toordinal()
+    i60 = [(dt.toordinal() - epoch) % 60 for dt in dts]
+    s  = array("B", [i % 10 for i in i60])
+    b  = array("B", [i % 12 for i in i60])
+    hb = array("B", [((dt.hour + 1) // 2) % 12 for dt in dts])
+    return HowlBatch(
+        dts, s, b, hb,
+        array("B", [_doom_index(*x, salt) for x in zip(s, b, hb)]),
+        array("B", [_doom_level(*x) for x in zip(s, b, hb)]),
+        array("B", [_taboo_index(*x, salt) for x in zip(s, b, hb)]),
+        salt,
+    )
+
+def read_howl_batch_np(datetimes_or_range: Union[Iterable[datetime], DateRange, Any], salt: Any = 0) -> HowlBatch:
+    """numpy-вариант read_howl_batch: те же формулы над массивами. salt — число или массив той же длины."""
+    import numpy as np
+    if isinstance(datetimes_or_range, tuple) and len(datetimes_or_range) == 3 \
+            and isinstance(datetimes_or_range[2], timedelta):
+        start, stop, step = datetimes_or_range
+        dts = np.arange(np.datetime64(start, "m"), np.datetime64(stop, "m"), np.timedelta64(step, "m"))
+    else:
+        dts = np.asarray(datetimes_or_range, dtype="datetime64[m]")
+    days = dts.astype("datetime64[D]")
+    i60 = (days - np.datetime64(EPOCH, "D")).astype(np.int64) % 60
+    hour = ((dts - days).astype("timedelta64[h]")).astype(np.int64)
+    s, b, hb = i60 % 10, i60 % 12, ((hour + 1) // 2) % 12
+    salt = np.asarray(salt, dtype=np.int64)
+    u8 = lambda a: a.astype(np.uint8)
+    return HowlBatch(dts, u8(s), u8(b), u8(hb),
+                     u8(_doom_index(s, b, hb, salt)), u8(_doom_level(s, b, hb)),
+                     u8(_taboo_index(s, b, hb, salt)), salt)
+
+# ——— Прогнозы: неделя/N дней и ближайшие сутки по двухчасовым ветвям
+# Чтение зависит только от позиции дня в 60-дневном цикле, часа и соли — строки кэшируем по ним,
+# а даты подставляем при выводе.
+_WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+_SLOT_HOURS = [23] + list(range(1, 23, 2))  # начало ветви hb: 子 23–01, 丑 01–03, …
+
+def _slot_label(hb: int) -> str:
+    h = _SLOT_HOURS[hb]
+    return f"{h:02d}–{(h + 2) % 24:02d}"
+
+@lru_cache(maxsize=4096)
+def _day_rows(i60: int, days: int, salt: int) -> Tuple[Tuple[int, int, int, int, Tuple[int, ...]], ...]:
+    """На каждый день: (ствол, ветвь, несчастье дня, уровень, ветви часа с уровнем 5).
+    Несчастье дня — как в календаре: ветвь часа 子 (полночь)."""
+    start = EPOCH + timedelta(days=i60)
+    dts = [start + timedelta(days=d, hours=h) for d in range(days) for h in range(1, 24, 2)]
+    batch = read_howl_batch(dts, salt)
+    rows = []
+    for d in range(days):
+        k = d * 12 + 11  # 23:00 — та же ветвь 子, что и в полночь этого дня
+        worst = tuple(sorted(batch.hour_branch[i] for i in range(d * 12, d * 12 + 12) if batch.doom_level[i] == 5))
+        rows.append((batch.stem[k], batch.branch[k], batch.doom_index[k], batch.doom_level[k], worst))
+    return tuple(rows)
+
+@lru_cache(maxsize=4096)
+def _hour_rows(i60: int, hour: int, salt: int) -> Tuple[Tuple[int, int, int], ...]:
+    """12 ветвей часа подряд, начиная с той, что идёт в hour: (ветвь часа, несчастье, уровень)."""
+    start = EPOCH + timedelta(days=i60, hours=hour)
+    batch = read_howl_batch((start, start + timedelta(hours=24), timedelta(hours=2)), salt)
+    return tuple(zip(batch.hour_branch, batch.doom_index, batch.doom_level))
+
+def _slot_start(dt: datetime) -> datetime:
+    """Начало двухчасовой ветви, в которую попадает dt (ветви начинаются в нечётный час)."""
+    dt = dt.replace(minute=0, second=0, microsecond=0)
+    return dt if dt.hour % 2 else dt - timedelta(hours=1)
+
+def _doom_short(di: int, lvl: int) -> str:
+    m = MISFORTUNES[di]
+    return f"{m['emoji']} {'☠' * lvl} {_html.escape(m['name'])}"
+
+def render_forecast_days(start: date, days: int, salt: int = 0) -> str:
+    """Прогноз на days дней с start: строка на день — знак, несчастье дня и часы с ☠×5."""
+    i60 = (start.toordinal() - EPOCH.toordinal()) % 60
+    lines = [f"<b>Несчастья на {days} дн.</b> (⚠️ — часы с ☠☠☠☠☠)"]
+    for d, (s, b, di, lvl, worst) in enumerate(_day_rows(i60, days, salt)):
+        day = start + timedelta(days=d)
+        han, py, _ = BRANCHES[b]
+        line = (f"<b>{_WEEKDAYS[day.weekday()]} {day:%d.%m}</b> {ANIMALS.get(py, '?')} {han} "
+                f"{ELEMENTS[s // 2]} · {_doom_short(di, lvl)}")
+        if worst:
+            line += f" · ⚠️ {', '.join(_slot_label(hb) for hb in worst)}"
+        lines.append(line)
     return "\n".join(lines)
+
+def render_forecast_hours(now: datetime, salt: int = 0) -> str:
+    """Ближайшие сутки: строка на каждую двухчасовую ветвь, начиная с текущей."""
+    start = _slot_start(now)
+    i60 = (start.toordinal() - EPOCH.toordinal()) % 60
+    lines = [f"<b>Ближайшие сутки</b> с {start:%d.%m %H:%M}"]
+    for hb, di, lvl in _hour_rows(i60, start.hour, salt):
+        han, py, _ = BRANCHES[hb]
+        lines.append(f"<code>{_slot_label(hb)}</code> {ANIMALS.get(py, '?')} {han} {_doom_short(di, lvl)}")
+    return "\n".join(lines)
+
+# ——— (опционально) iCalendar: поток строк на любой диапазон дней
+def _ics_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace(",", r"\,").replace(";", r"\;").replace("\n", r"\n")
+
+def iter_ics(start: date, stop: date, salt: int = 0, tzid: Optional[str] = None) -> Iterator[str]:
+    """Строки VCALENDAR с событием на каждый день [start, stop); считаем пачками по году, ничего не копим."""
+    yield from ("BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//HOWL//ru")
+    if tzid:
+        yield f"X-WR-TIMEZONE:{tzid}"
+    cur, end = datetime(start.year, start.month, start.day), datetime(stop.year, stop.month, stop.day)
+    while cur < end:
+        chunk_end = min(cur + timedelta(days=366), end)
+        batch = read_howl_batch((cur, chunk_end, timedelta(days=1)), salt)
+        for i, day in enumerate(batch.dt):
+            doom = batch.doom(i)
+            ymd = day.strftime('%Y%m%d')
+            desc = f"{doom['emoji']} {doom['name']} — {doom['desc']} / Табу: {TABOOS[batch.taboo_index[i]]}"
+            yield from (
+                "BEGIN:VEVENT",
+                f"UID:{ymd}-{doom['code']}@howl",
+                f"DTSTAMP:{ymd}T000000Z",
+                f"DTSTART;VALUE=DATE:{ymd}",
+                f"SUMMARY:{_ics_escape(doom['name'])}",
+                f"DESCRIPTION:{_ics_escape(desc)}",
+                "END:VEVENT",
+            )
+        cur = chunk_end
+    yield "END:VCALENDAR"
+
+def ics_for_year(year: int, salt: int = 0) -> str:
+    return "\n".join(iter_ics(date(year, 1, 1), date(year + 1, 1, 1), salt))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Разбор момента воя из текста одним заранее скомпилированным выражением.
+
+    2025-10-01 14:30 · 2025-10-01T14:30 · 2025-10-01 · 01.10.2025 14:30 · 01.10.25 · 01.10
+    14:30 (сегодня) · сейчас · сегодня/завтра/вчера [в 14:30] · через 2 часа · 15 минут назад
+"""
+import re
+from datetime import datetime, timedelta
+
+_MOMENT = re.compile(r"""
+    (?:
+        (?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})
+      | (?P<d2>\d{1,2})\.(?P<m2>\d{1,2})(?:\.(?P<y2>\d{4}|\d{2}))?
+      | (?P<word>сейчас|позавчера|вчера|сегодня|послезавтра|завтра)
+      | через\s+(?P<in_n>\d{1,4})\s*(?P<in_u>мин|ч|д)[а-я]*
+      | (?P<ago_n>\d{1,4})\s*(?P<ago_u>мин|ч|д)[а-я]*\s+назад
+    )?
+    (?:(?:^|\s+|T|\s*,\s*)(?:в\s+)?(?P<H>\d{1,2}):(?P<M>\d{2}))?
+    """, re.X | re.I)
+
+_DAYS = {"позавчера": -2, "вчера": -1, "сегодня": 0, "сейчас": 0, "завтра": 1, "послезавтра": 2}
+_UNITS = {"мин": timedelta(minutes=1), "ч": timedelta(hours=1), "д": timedelta(days=1)}
+
+def parse_moment(text: str, now: datetime) -> datetime | None:
+    """Момент без tzinfo (местное время, как и now) или None, если текст не похож на момент."""
+    m = _MOMENT.fullmatch(text.strip())
+    if not m or not text.strip():
+        return None
+    g = m.groupdict()
+    hm = (int(g["H"]), int(g["M"])) if g["H"] else None
+    try:
+        if g["in_n"] or g["ago_n"]:
+            if hm:
+                return None
+            now = now.replace(second=0, microsecond=0)
+            if g["in_n"]:
+                return now + int(g["in_n"]) * _UNITS[g["in_u"].lower()]
+            return now - int(g["ago_n"]) * _UNITS[g["ago_u"].lower()]
+        if g["y"]:
+            day = datetime(int(g["y"]), int(g["m"]), int(g["d"]))
+        elif g["d2"]:
+            y = g["y2"]
+            year = now.year if y is None else int(y) + (2000 if len(y) == 2 else 0)
+            day = datetime(year, int(g["m2"]), int(g["d2"]))
+        elif g["word"]:
+            word = g["word"].lower()
+            if word == "сейчас":
+                return None if hm else now.replace(second=0, microsecond=0)
+            day = datetime(now.year, now.month, now.day) + timedelta(days=_DAYS[word])
+        else:
+            day = datetime(now.year, now.month, now.day)  # только время — сегодня
+        if hm:
+            day = day.replace(hour=hm[0], minute=hm[1])
+        return day
+    except ValueError:
+        return None
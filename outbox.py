@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""Исходящие сообщения с оглядкой на лимиты Telegram: общий и на чат, повтор по RetryAfter."""
+import time, asyncio, logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from telegram.error import RetryAfter, NetworkError, Forbidden, BadRequest, TimedOut
+from telegram.ext import BaseRateLimiter
+
+from metrics import OUTBOX_WAIT, OUTBOX_RETRIES, OUTBOX_DROPPED
+
+# лимиты Bot API: ~30 сообщений/с всего, ~1/с в личку, ~20/мин в группу
+GLOBAL_RATE = 25.0
+PRIVATE_INTERVAL = 1.0
+GROUP_INTERVAL = 3.0
+
+def retry_after_seconds(e: RetryAfter) -> float:
+    ra = e.retry_after
+    return ra.total_seconds() if hasattr(ra, "total_seconds") else float(ra)
+
+# ====== Ведро токенов ======
+class TokenBucket:
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def idle(self) -> bool:
+        """Ведро полное и никто его не ждёт — можно выбросить и создать заново."""
+        now = time.monotonic()
+        return (not self._lock.locked() and now >= self.paused_until
+                and self.tokens + (now - self.stamp) * self.rate >= self.burst)
+
+    def pause(self, seconds: float):
+        """Flood control: Telegram сказал подождать — не шлём ничего до конца паузы."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def take(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# ====== Рассылка пачкой ======
+class FanOut:
+    """Шлёт много сообщений параллельно (не больше concurrency), держит общий темп и интервал на чат.
+    RetryAfter и сетевые ошибки — повтор; Forbidden (бот заблокирован) — on_forbidden(chat_id)."""
+
+    def __init__(self, global_rate: float | None = GLOBAL_RATE, concurrency: int = 16, retries: int = 3,
+                 on_forbidden=None):
+        # global_rate=None — темп держит OutboundLimiter бота, здесь только параллельность и повторы
+        self.bucket = TokenBucket(global_rate) if global_rate else None
+        self.concurrency = concurrency
+        self.retries = retries
+        self.on_forbidden = on_forbidden
+        self._chat_next = {}   # chat_id -> monotonic, раньше которого в чат не пишем
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def _chat_slot(self, chat_id: int):
+        if self.bucket is None:
+            return
+        now = time.monotonic()
+        at = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, at) + (GROUP_INTERVAL if chat_id < 0 else PRIVATE_INTERVAL)
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def _gc(self):
+        now = time.monotonic()
+        if len(self._chat_next) > 10000:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+
+    async def send(self, chat_id: int, make_coro) -> bool:
+        """make_coro() — фабрика корутины отправки (на каждую попытку новая)."""
+        delay = 1.0
+        for attempt in range(self.retries + 1):
+            await self._chat_slot(chat_id)
+            if self.bucket is not None:
+                await self.bucket.take()
+            try:
+                await make_coro()
+                self.sent += 1
+                return True
+            except RetryAfter as e:
+                secs = retry_after_seconds(e)
+                logging.warning("flood control for chat %s: retry in %.1fs", chat_id, secs)
+                if self.bucket is not None:
+                    self.bucket.pause(secs)
+                    self._chat_next[chat_id] = time.monotonic() + secs
+                elif attempt < self.retries:
+                    await asyncio.sleep(secs)  # без своего темпа ждать паузу некому, кроме нас
+            except Forbidden as e:
+                logging.info("chat %s is not reachable: %s", chat_id, e)
+                if self.on_forbidden:
+                    self.on_forbidden(chat_id)
+                break
+            except BadRequest as e:
+                logging.warning("send to chat %s rejected: %s", chat_id, e)
+                break
+            except NetworkError as e:
+                logging.warning("network error for chat %s (attempt %d): %s", chat_id, attempt + 1, e)
+                await asyncio.sleep(delay)
+                delay *= 2
+            if attempt < self.retries:
+                self.retried += 1
+        self.failed += 1
+        return False
+
+    async def send_all(self, jobs):
+        """jobs: [(chat_id, make_coro), ...]; не больше concurrency отправок одновременно."""
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(chat_id, make_coro):
+            async with sem:
+                return await self.send(chat_id, make_coro)
+
+        results = await asyncio.gather(*(one(c, f) for c, f in jobs))
+        self._gc()
+        return sum(results)
+
+# ====== Все исходящие запросы бота ======
+# политика для запросов текущей задачи (хендлера): with send_policy(coalesce=("howl_now", chat_id)): ...
+SEND_POLICY: ContextVar[dict | None] = ContextVar("howl_send_policy", default=None)
+MESSAGE_ENDPOINTS = ("send", "copyMessage", "forwardMessage")  # на них — лимиты Telegram на сообщения
+
+@contextmanager
+def send_policy(coalesce=None, stale: float = 0.0):
+    """coalesce — ключ: из ждущих в очереди запросов с одним ключом уйдёт только последний;
+    stale — секунд ожидания, после которых запрос уже не нужен. Отброшенный — OutboxDropped."""
+    token = SEND_POLICY.set({"coalesce": coalesce, "stale": stale})
+    try:
+        yield
+    finally:
+        SEND_POLICY.reset(token)
+
+class OutboxDropped(Exception):
+    def __init__(self, reason: str):
+        super().__init__(f"send dropped: {reason}")
+        self.reason = reason
+
+class OutboxFull(RetryAfter):
+    """Очередь переполнена — как flood control: рассылка подождёт и повторит, хендлер получит ошибку."""
+
+class OutboundLimiter(BaseRateLimiter):
+    """Rate limiter для Application: через него идёт каждый запрос к Bot API.
+
+    Сообщения (send*/copy/forward) ждут общее ведро и ведро чата; RetryAfter ставит на паузу оба
+    и повторяется, сетевые ошибки — повтор с нарастающей паузой (кроме TimedOut: сообщение могло
+    и дойти). Остальные методы (answer*, getMe, setWebhook…) идут сразу. Ждущих не больше
+    max_pending — дальше OutboxFull."""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, retries: int = 3, max_pending: int = 1000,
+                 private_burst: float = 3, group_burst: float = 3):
+        self.bucket = TokenBucket(global_rate)
+        self.retries = retries
+        self.max_pending = max_pending
+        self.private_burst = private_burst
+        self.group_burst = group_burst
+        self.depth = 0              # запросов ждут своей очереди или повтора
+        self._chats = {}            # chat_id -> TokenBucket
+        self._latest = {}           # ключ coalesce -> номер последнего запроса с ним
+        self._seq = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        b = self._chats.get(chat_id)
+        if b is None:
+            if len(self._chats) > 10000:
+                self._chats = {c: x for c, x in self._chats.items() if not x.idle()}
+            group = isinstance(chat_id, str) or chat_id < 0
+            b = self._chats[chat_id] = (TokenBucket(1 / GROUP_INTERVAL, self.group_burst) if group
+                                        else TokenBucket(1 / PRIVATE_INTERVAL, self.private_burst))
+        return b
+
+    def _drop(self, reason: str, *buckets):
+        for b in buckets:
+            b.refund()
+        OUTBOX_DROPPED.inc(reason=reason)
+        raise OutboxDropped(reason)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None or not endpoint.startswith(MESSAGE_ENDPOINTS):
+            return await callback(*args, **kwargs)
+        if self.depth >= self.max_pending:
+            OUTBOX_DROPPED.inc(reason="full")
+            raise OutboxFull(1)
+        policy = rate_limit_args or SEND_POLICY.get() or {}
+        key, stale = policy.get("coalesce"), policy.get("stale") or 0.0
+        if key is not None:
+            self._seq += 1
+            seq = self._latest[key] = self._seq
+        chat = self._chat_bucket(chat_id)
+        kind = "group" if isinstance(chat_id, str) or chat_id < 0 else "private"
+        t0 = time.monotonic()
+        self.depth += 1
+        delay = 1.0
+        try:
+            for attempt in range(self.retries + 1):
+                await chat.take()
+                await self.bucket.take()
+                if key is not None and self._latest.get(key) != seq:
+                    self._drop("coalesced", chat, self.bucket)
+                if stale and time.monotonic() - t0 > stale:
+                    self._drop("stale", chat, self.bucket)
+                if attempt == 0:
+                    OUTBOX_WAIT.observe(time.monotonic() - t0, kind=kind)
+                try:
+                    return await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    if attempt == self.retries:
+                        raise
+                    secs = retry_after_seconds(e)
+                    logging.warning("flood control on %s to %s: retry in %.1fs", endpoint, chat_id, secs)
+                    OUTBOX_RETRIES.inc(reason="retry_after")
+                    self.bucket.pause(secs)
+                    chat.pause(secs)
+                except (Forbidden, BadRequest, TimedOut):
+                    raise
+                except NetworkError as e:
+                    if attempt == self.retries:
+                        raise
+                    logging.warning("network error on %s to %s (attempt %d): %s", endpoint, chat_id, attempt + 1, e)
+                    OUTBOX_RETRIES.inc(reason="network")
+                    await asyncio.sleep(delay)
+                    delay *= 2
+        finally:
+            self.depth -= 1
+            if key is not None and self._latest.get(key) == seq:
+                del self._latest[key]
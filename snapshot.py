@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Снапшот прогретых кэшей для холодного старта: один файл, грузится за миллисекунды.
+
+Каждая часть при загрузке сверяется с диском (mtime каталога, размеры/mtime файлов, форма таблицы),
+устаревшая просто пропускается. Формат — pickle: файл пишет и читает только сам бот,
+чужой файл сюда не подкладывать.
+"""
+import os, pickle, logging
+
+MAGIC = b"HOWLSNAP1\n"
+
+def save(path: str, parts: dict):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        pickle.dump(parts, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+def load(path: str) -> dict:
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                logging.warning("snapshot %s: unknown format, ignored", path)
+                return {}
+            parts = pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.warning("snapshot %s unreadable, ignored: %s", path, e)
+        return {}
+    return parts if isinstance(parts, dict) else {}
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Счётчики воев для /stats: каждое чтение добавляется в _record за O(1), ответ /stats не смотрит историю.
+
+На чат — один array("I"): всего, по кодам несчастий, по уровням, по часам момента; плюс счёт по дням
+(UTC, последние DAYS_KEEP). Общие счётчики — такие же, по всем чатам. Переживают рестарт через снапшот.
+При нескольких воркерах счётчики живут в общей базе по именам ячеек (slot_keys) и собираются в Tally на /stats.
+"""
+import html
+from array import array
+from datetime import date, timedelta
+
+from misfortune import MISFORTUNES
+
+CODES = [m["code"] for m in MISFORTUNES]
+_CODE_INDEX = {c: i for i, c in enumerate(CODES)}
+LEVELS = 6                      # уровни 0..5
+_DOOM0 = 1                      # [0] — всего
+_LVL0 = _DOOM0 + len(CODES)
+_HOUR0 = _LVL0 + LEVELS
+WIDTH = _HOUR0 + 24
+DAYS_KEEP = 30
+
+class Tally:
+    __slots__ = ("counts", "days")
+
+    def __init__(self, counts: array | None = None, days: dict | None = None):
+        self.counts = counts if counts is not None else array("I", bytes(4 * WIDTH))
+        self.days = days if days is not None else {}   # date.toordinal() -> сколько
+
+    @property
+    def total(self) -> int:
+        return self.counts[0]
+
+    def add(self, doom: int | None, level: int, hour: int, day: int):
+        c = self.counts
+        c[0] += 1
+        if doom is not None:
+            c[_DOOM0 + doom] += 1
+        if 0 <= level < LEVELS:
+            c[_LVL0 + level] += 1
+        c[_HOUR0 + hour % 24] += 1
+        self.days[day] = self.days.get(day, 0) + 1
+        if len(self.days) > DAYS_KEEP:
+            for d in [d for d in self.days if d <= day - DAYS_KEEP]:
+                del self.days[d]
+
+    def doom(self) -> dict:
+        return {code: self.counts[_DOOM0 + i] for i, code in enumerate(CODES) if self.counts[_DOOM0 + i]}
+
+    def levels(self) -> dict:
+        return {lvl: self.counts[_LVL0 + lvl] for lvl in range(LEVELS) if self.counts[_LVL0 + lvl]}
+
+    def hours(self) -> dict:
+        return {h: self.counts[_HOUR0 + h] for h in range(24) if self.counts[_HOUR0 + h]}
+
+class HowlStats:
+    def __init__(self):
+        self.all = Tally()
+        self._chats = {}    # chat_id -> Tally
+        self.changed = False
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def record(self, chat_id: int, doom_code: str, level: int, hour: int, day: date):
+        doom, d = _CODE_INDEX.get(doom_code), day.toordinal()
+        t = self._chats.get(chat_id)
+        if t is None:
+            t = self._chats[chat_id] = Tally()
+        t.add(doom, level, hour, d)
+        self.all.add(doom, level, hour, d)
+        self.changed = True
+
+    def chat(self, chat_id: int) -> Tally | None:
+        return self._chats.get(chat_id)
+
+    # ——— снапшот: массивы одним куском байт, дни — списком словарей
+    def dumps(self) -> dict:
+        ids = array("q", self._chats)
+        counts = array("I")
+        for t in self._chats.values():
+            counts += t.counts
+        return {"codes": CODES, "levels": LEVELS, "ids": ids.tobytes(), "counts": counts.tobytes(),
+                "days": [dict(t.days) for t in self._chats.values()],
+                "all": (self.all.counts.tobytes(), dict(self.all.days))}
+
+    @classmethod
+    def loads(cls, d: dict) -> "HowlStats":
+        st = cls()
+        codes, levels = d["codes"], d["levels"]
+        width = 1 + len(codes) + levels + 24
+        def tally(raw: bytes, days: dict) -> Tally:
+            old = array("I")
+            old.frombytes(raw)
+            if codes == CODES and levels == LEVELS:
+                return Tally(old, days)
+            # список несчастий поменялся — переносим по кодам, пропавшие коды остаются только во «всего»
+            t = Tally(days=days)
+            t.counts[0] = old[0]
+            for i, code in enumerate(codes):
+                if code in _CODE_INDEX:
+                    t.counts[_DOOM0 + _CODE_INDEX[code]] = old[1 + i]
+            for j in range(min(levels, LEVELS)):
+                t.counts[_LVL0 + j] = old[1 + len(codes) + j]
+            t.counts[_HOUR0:] = old[1 + len(codes) + levels:]
+            return t
+        ids = array("q")
+        ids.frombytes(d["ids"])
+        raw = d["counts"]
+        for i, (chat_id, days) in enumerate(zip(ids, d["days"])):
+            st._chats[chat_id] = tally(raw[i * width * 4:(i + 1) * width * 4], days)
+        st.all = tally(*d["all"])
+        return st
+
+# ——— ячейки по именам: так их хранит общая база (storage.add_stats), список несчастий может меняться
+def slot_keys(doom_code: str, level: int, hour: int) -> list:
+    keys = ["total", f"doom:{doom_code}", f"hour:{hour % 24}"]
+    if 0 <= level < LEVELS:
+        keys.append(f"lvl:{level}")
+    return keys
+
+def tally_from_slots(counts: dict, days: dict) -> Tally:
+    """Tally из {ячейка: n}; пропавшие коды несчастий остаются только во «всего»."""
+    t = Tally(days=dict(days))
+    for key, n in counts.items():
+        kind, _, arg = key.partition(":")
+        if kind == "total":
+            t.counts[0] = n
+        elif kind == "doom" and arg in _CODE_INDEX:
+            t.counts[_DOOM0 + _CODE_INDEX[arg]] = n
+        elif kind == "lvl" and arg.isdigit() and int(arg) < LEVELS:
+            t.counts[_LVL0 + int(arg)] = n
+        elif kind == "hour" and arg.isdigit() and int(arg) < 24:
+            t.counts[_HOUR0 + int(arg)] = n
+    return t
+
+# ——— текст для /stats
+def _bar(n: int, top: int, width: int = 10) -> str:
+    return "▇" * max(1, round(width * n / top)) if n else "·"
+
+def format_tally(t: Tally, title: str, today: date, top: int = 5) -> str:
+    if not t.total:
+        return f"<b>{title}</b>\nПока пусто."
+    names = {m["code"]: html.escape(f"{m.get('emoji', '')} {m.get('name', m['code'])}".strip()) for m in MISFORTUNES}
+    lines = [f"<b>{title}</b> — всего воев: <b>{t.total}</b>", "", "<b>Несчастья</b>"]
+    doom = sorted(t.doom().items(), key=lambda kv: -kv[1])
+    for code, n in doom[:top]:
+        lines.append(f"{names.get(code, code)} — {n} ({100 * n / t.total:.0f}%)")
+    if len(doom) > top:
+        lines.append(f"…и ещё {len(doom) - top}")
+    levels = t.levels()
+    lines += ["", "<b>Уровни</b>"]
+    peak = max(levels.values(), default=1)
+    lines += [f"{'☠' * lvl:<5} {_bar(levels.get(lvl, 0), peak)} {levels.get(lvl, 0)}" for lvl in range(1, LEVELS)]
+    hours = sorted(t.hours().items(), key=lambda kv: (-kv[1], kv[0]))[:3]
+    lines += ["", "<b>Частые часы</b>: " + ", ".join(f"{h:02d}:00 ({n})" for h, n in hours)]
+    days = [(today - timedelta(days=i)) for i in range(6, -1, -1)]
+    per_day = [t.days.get(d.toordinal(), 0) for d in days]
+    lines += ["", "<b>По дням</b> (UTC, 7 дней): " + " · ".join(f"{d:%d.%m} {n}" for d, n in zip(days, per_day)),
+              f"в среднем {sum(per_day) / 7:.1f} в день"]
+    return "\n".join(lines)
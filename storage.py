@@ -0,0 +1,639 @@
+# -*- coding: utf-8 -*-
+"""Хранилище истории воев, тайм-зон и подписок: JSON-файлы (как раньше), бинарное кольцо или SQLite в режиме WAL."""
+import os, json, time, asyncio, logging, sqlite3, threading
+
+from metrics import STORAGE_SECONDS
+from history import HistoryRing
+
+HISTORY_KEEP = 5  # сколько последних воев держим на чат
+
+# ====== Общий интерфейс ======
+class Storage:
+    def history(self, chat_id: int) -> list:
+        """Последние воя чата, от старых к новым: [{"ts", "doom", "lvl"}, ...]."""
+        raise NotImplementedError
+
+    def append_history(self, chat_id: int, entry: dict, keep: int = HISTORY_KEEP):
+        raise NotImplementedError
+
+    def get_tz(self, chat_id: int) -> str | None:
+        raise NotImplementedError
+
+    def set_tz(self, chat_id: int, tz: str):
+        raise NotImplementedError
+
+    def subscriptions(self) -> dict:
+        """chat_id -> местный час ежедневной рассылки."""
+        raise NotImplementedError
+
+    def set_subscription(self, chat_id: int, hour: int | None):
+        """hour=None — отписка."""
+        raise NotImplementedError
+
+    def subscribers(self) -> dict:
+        """chat_id -> (час рассылки, строка тайм-зоны или None) — все подписчики одним чтением."""
+        return {chat_id: (hour, self.get_tz(chat_id)) for chat_id, hour in self.subscriptions().items()}
+
+    def load_all(self):
+        """(история, тайм-зоны) целиком, если бэкенду дешевле отдать всё сразу; иначе None."""
+        return None
+
+    def write_batch(self, histories: dict, tzs: dict):
+        """Записать пачку: chat_id -> полный список истории, chat_id -> строка тайм-зоны."""
+        raise NotImplementedError
+
+    # несколько воркеров на одном хранилище; в одном процессе всё это no-op
+    def claim_update(self, update_id: int) -> bool:
+        """True, если апдейт с таким update_id ещё никто не взял."""
+        return True
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Взять или продлить аренду name на ttl секунд; True — owner сейчас лидер."""
+        return True
+
+    def subs_version(self):
+        """Меняется с каждой правкой подписок или тайм-зон, в том числе из другого процесса;
+        None — не отслеживается."""
+        return None
+
+    # счётчики /stats в общей базе — только при нескольких воркерах, иначе они в памяти (stats.py)
+    def add_stats(self, chat_id: int, slots: list, day: int, keep_days: int):
+        """+1 к ячейкам slots и к дню day (ordinal) — у чата и у всего бота (chat_id 0)."""
+        raise NotImplementedError
+
+    def stats(self, chat_id: int):
+        """(ячейка -> n, день -> n) или None, если у чата ничего нет."""
+        raise NotImplementedError
+
+    def stats_chats(self) -> int:
+        raise NotImplementedError
+
+    # file_id картинок при нескольких воркерах (иначе — media_cache.json)
+    def media_get(self, key: str):
+        """(sha1, file_id) или None."""
+        raise NotImplementedError
+
+    def media_put(self, key: str, sha1: str, file_id: str):
+        raise NotImplementedError
+
+    def media_forget(self, key: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+# ====== JSON: весь файл на каждую запись ======
+def _read_json(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _write_json(path: str, db: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(db, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+class JsonStorage(Storage):
+    def __init__(self, data_file: str = "howls.json", tz_file: str = "tz.json", subs_file: str = "subs.json"):
+        self.data_file = data_file
+        self.tz_file = tz_file
+        self.subs_file = subs_file
+
+    def load_history(self) -> dict:
+        return _read_json(self.data_file)
+
+    def load_tz(self) -> dict:
+        return _read_json(self.tz_file)
+
+    def history(self, chat_id: int) -> list:
+        return self.load_history().get(str(chat_id), [])
+
+    def append_history(self, chat_id: int, entry: dict, keep: int = HISTORY_KEEP):
+        db = self.load_history()
+        key = str(chat_id)
+        db.setdefault(key, []).append(entry)
+        db[key] = db[key][-keep:]
+        _write_json(self.data_file, db)
+
+    def get_tz(self, chat_id: int) -> str | None:
+        return self.load_tz().get(str(chat_id))
+
+    def set_tz(self, chat_id: int, tz: str):
+        db = self.load_tz()
+        db[str(chat_id)] = tz
+        _write_json(self.tz_file, db)
+
+    def subscriptions(self) -> dict:
+        return {int(k): v for k, v in _read_json(self.subs_file).items()}
+
+    def set_subscription(self, chat_id: int, hour: int | None):
+        db = _read_json(self.subs_file)
+        if hour is None:
+            db.pop(str(chat_id), None)
+        else:
+            db[str(chat_id)] = hour
+        _write_json(self.subs_file, db)
+
+    def subscribers(self) -> dict:
+        tzs = self.load_tz()
+        return {chat_id: (hour, tzs.get(str(chat_id))) for chat_id, hour in self.subscriptions().items()}
+
+    def load_all(self):
+        return ({int(k): v for k, v in self.load_history().items()},
+                {int(k): v for k, v in self.load_tz().items()})
+
+    def write_batch(self, histories: dict, tzs: dict):
+        if histories:
+            db = self.load_history()
+            db.update({str(k): v for k, v in histories.items()})
+            _write_json(self.data_file, db)
+        if tzs:
+            db = self.load_tz()
+            db.update({str(k): v for k, v in tzs.items()})
+            _write_json(self.tz_file, db)
+
+# ====== Бинарное кольцо: история одним файлом по 6 байт на запись ======
+class RingStorage(JsonStorage):
+    """История — HistoryRing (history.py) в памяти и в файле; тайм-зоны и подписки — JSON, как у JsonStorage.
+    Файл по-прежнему переписывается целиком, но это dumps() кольца, а не JSON: на 200 тыс. чатов
+    ~0.1 с и 7.6 МБ против ~7 с и 84 МБ. Старый howls.json переносится при первом запуске."""
+
+    def __init__(self, ring_file: str = "howls.ring", data_file: str = "howls.json", tz_file: str = "tz.json",
+                 subs_file: str = "subs.json"):
+        super().__init__(data_file, tz_file, subs_file)
+        self.ring_file = ring_file
+        self._lock = threading.Lock()  # write_batch идёт из потока write-behind
+        if os.path.exists(ring_file):
+            with open(ring_file, "rb") as f:
+                self.ring = HistoryRing.loads(f.read())
+        else:
+            self.ring = HistoryRing.from_json(_read_json(data_file), HISTORY_KEEP)
+            self._save()
+            if len(self.ring):
+                logging.info("migrated %d chats from %s into %s", len(self.ring), data_file, ring_file)
+
+    def _save(self):
+        data = self.ring.dumps()
+        tmp = self.ring_file + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.ring_file)
+
+    def load_history(self) -> dict:
+        with self._lock:
+            return self.ring.to_json()
+
+    def history(self, chat_id: int) -> list:
+        with self._lock:
+            return self.ring.history(chat_id)
+
+    def append_history(self, chat_id: int, entry: dict, keep: int = HISTORY_KEEP):
+        with self._lock:
+            self.ring.append(chat_id, entry)  # keep у кольца свой, HISTORY_KEEP
+            self._save()
+
+    def load_all(self):
+        # копия кольца: своё write-behind меняет в event loop, а наше — в потоке сброса
+        with self._lock:
+            ring = HistoryRing.loads(self.ring.dumps())
+        return ring, {int(k): v for k, v in self.load_tz().items()}
+
+    def write_batch(self, histories: dict, tzs: dict):
+        if histories:
+            with self._lock:
+                for chat_id, items in histories.items():
+                    self.ring.set(chat_id, items)
+                self._save()
+        super().write_batch({}, tzs)
+
+# ====== SQLite (WAL): строка на вой, индекс по чату ======
+class SqliteStorage(Storage):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS history (
+        id      INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        ts      TEXT    NOT NULL,
+        doom    TEXT    NOT NULL,
+        lvl     INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS history_chat ON history (chat_id, id);
+    CREATE TABLE IF NOT EXISTS tz (
+        chat_id INTEGER PRIMARY KEY,
+        tz      TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS subs (
+        chat_id INTEGER PRIMARY KEY,
+        hour    INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key   TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS updates (
+        update_id INTEGER PRIMARY KEY,
+        ts        REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS leases (
+        name    TEXT PRIMARY KEY,
+        owner   TEXT NOT NULL,
+        expires REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS stats (
+        chat_id INTEGER NOT NULL,
+        slot    TEXT    NOT NULL,
+        n       INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, slot)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS stats_days (
+        chat_id INTEGER NOT NULL,
+        day     INTEGER NOT NULL,
+        n       INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, day)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS media (
+        key     TEXT PRIMARY KEY,
+        sha1    TEXT NOT NULL,
+        file_id TEXT NOT NULL
+    );
+    """
+    UPDATES_KEEP = 3600.0   # сколько секунд помним update_id (Telegram повторяет доставку куда быстрее)
+
+    def __init__(self, path: str = "howls.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA busy_timeout=5000")
+        self.db.executescript(self.SCHEMA)
+        self._claims = 0
+
+    def history(self, chat_id: int) -> list:
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT ts, doom, lvl FROM history WHERE chat_id = ? ORDER BY id", (chat_id,)
+            ).fetchall()
+        return [{"ts": ts, "doom": doom, "lvl": lvl} for ts, doom, lvl in rows]
+
+    def append_history(self, chat_id: int, entry: dict, keep: int = HISTORY_KEEP):
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self._append(chat_id, entry, keep)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def _append(self, chat_id: int, entry: dict, keep: int):
+        self.db.execute(
+            "INSERT INTO history (chat_id, ts, doom, lvl) VALUES (?, ?, ?, ?)",
+            (chat_id, entry["ts"], entry["doom"], entry["lvl"]),
+        )
+        self.db.execute(
+            "DELETE FROM history WHERE chat_id = ? AND id NOT IN "
+            "(SELECT id FROM history WHERE chat_id = ? ORDER BY id DESC LIMIT ?)",
+            (chat_id, chat_id, keep),
+        )
+
+    def write_batch(self, histories: dict, tzs: dict):
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for chat_id, items in histories.items():
+                    self.db.execute("DELETE FROM history WHERE chat_id = ?", (chat_id,))
+                    self.db.executemany(
+                        "INSERT INTO history (chat_id, ts, doom, lvl) VALUES (?, ?, ?, ?)",
+                        [(chat_id, it["ts"], it["doom"], it["lvl"]) for it in items],
+                    )
+                self.db.executemany(
+                    "INSERT INTO tz (chat_id, tz) VALUES (?, ?) ON CONFLICT(chat_id) DO UPDATE SET tz = excluded.tz",
+                    list(tzs.items()),
+                )
+                if tzs:
+                    self._bump_subs()
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def get_tz(self, chat_id: int) -> str | None:
+        with self._lock:
+            row = self.db.execute("SELECT tz FROM tz WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_tz(self, chat_id: int, tz: str):
+        with self._lock:
+            self.db.execute(
+                "INSERT INTO tz (chat_id, tz) VALUES (?, ?) ON CONFLICT(chat_id) DO UPDATE SET tz = excluded.tz",
+                (chat_id, tz),
+            )
+            self._bump_subs()
+
+    def subscriptions(self) -> dict:
+        with self._lock:
+            return dict(self.db.execute("SELECT chat_id, hour FROM subs").fetchall())
+
+    def set_subscription(self, chat_id: int, hour: int | None):
+        with self._lock:
+            if hour is None:
+                self.db.execute("DELETE FROM subs WHERE chat_id = ?", (chat_id,))
+            else:
+                self.db.execute(
+                    "INSERT INTO subs (chat_id, hour) VALUES (?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET hour = excluded.hour",
+                    (chat_id, hour),
+                )
+            self._bump_subs()
+
+    def _bump_subs(self):
+        # счётчик в meta, а не PRAGMA data_version: тот меняет каждый вой из соседнего воркера
+        self.db.execute("INSERT INTO meta (key, value) VALUES ('subs_version', 1) "
+                        "ON CONFLICT(key) DO UPDATE SET value = meta.value + 1")
+
+    def subscribers(self) -> dict:
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT subs.chat_id, subs.hour, tz.tz FROM subs LEFT JOIN tz ON tz.chat_id = subs.chat_id"
+            ).fetchall()
+        return {chat_id: (hour, tz) for chat_id, hour, tz in rows}
+
+    def claim_update(self, update_id: int) -> bool:
+        now = time.time()
+        with self._lock:
+            cur = self.db.execute("INSERT OR IGNORE INTO updates (update_id, ts) VALUES (?, ?)", (update_id, now))
+            self._claims += 1
+            if self._claims % 1000 == 0:
+                self.db.execute("DELETE FROM updates WHERE ts < ?", (now - self.UPDATES_KEEP,))
+        return cur.rowcount == 1
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cur = self.db.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.owner = excluded.owner OR leases.expires < ?",
+                (name, owner, now + ttl, now),
+            )
+        return cur.rowcount == 1
+
+    def subs_version(self):
+        with self._lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'subs_version'").fetchone()
+        return row[0] if row else None
+
+    def add_stats(self, chat_id: int, slots: list, day: int, keep_days: int):
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for c in (chat_id, 0):
+                    self.db.executemany(
+                        "INSERT INTO stats (chat_id, slot, n) VALUES (?, ?, 1) "
+                        "ON CONFLICT(chat_id, slot) DO UPDATE SET n = n + 1",
+                        [(c, slot) for slot in slots],
+                    )
+                    self.db.execute(
+                        "INSERT INTO stats_days (chat_id, day, n) VALUES (?, ?, 1) "
+                        "ON CONFLICT(chat_id, day) DO UPDATE SET n = n + 1",
+                        (c, day),
+                    )
+                    self.db.execute("DELETE FROM stats_days WHERE chat_id = ? AND day <= ?", (c, day - keep_days))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def stats(self, chat_id: int):
+        with self._lock:
+            counts = dict(self.db.execute("SELECT slot, n FROM stats WHERE chat_id = ?", (chat_id,)).fetchall())
+            days = dict(self.db.execute("SELECT day, n FROM stats_days WHERE chat_id = ?", (chat_id,)).fetchall())
+        return (counts, days) if counts else None
+
+    def stats_chats(self) -> int:
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM stats WHERE chat_id != 0 AND slot = 'total'").fetchone()[0]
+
+    def media_get(self, key: str):
+        with self._lock:
+            return self.db.execute("SELECT sha1, file_id FROM media WHERE key = ?", (key,)).fetchone()
+
+    def media_put(self, key: str, sha1: str, file_id: str):
+        with self._lock:
+            self.db.execute(
+                "INSERT INTO media (key, sha1, file_id) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET sha1 = excluded.sha1, file_id = excluded.file_id",
+                (key, sha1, file_id),
+            )
+
+    def media_forget(self, key: str):
+        with self._lock:
+            self.db.execute("DELETE FROM media WHERE key = ?", (key,))
+
+    def migrate_from_json(self, data_file: str, tz_file: str) -> bool:
+        """Одноразовый перенос howls.json/tz.json. Повторно не запускается (метка в meta)."""
+        with self._lock:
+            if self.db.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return False
+            history, tzs = _read_json(data_file), _read_json(tz_file)
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for key, items in history.items():
+                    for it in items[-HISTORY_KEEP:]:
+                        self._append(int(key), it, HISTORY_KEEP)
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO tz (chat_id, tz) VALUES (?, ?)",
+                    [(int(k), v) for k, v in tzs.items()],
+                )
+                self.db.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                                (f"{len(history)} chats, {len(tzs)} tz",))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        logging.info("migrated %d chats and %d time zones from JSON into %s", len(history), len(tzs), self.path)
+        return True
+
+    def close(self):
+        self.db.close()
+
+# ====== Кэш в памяти с отложенной записью ======
+class WriteBehindStorage(Storage):
+    """Читает и пишет в память, изменённые чаты помечает грязными; фоновая задача сбрасывает их
+    в бэкенд пачкой — раз в interval секунд или сразу, как грязных стало max_dirty."""
+
+    def __init__(self, backend: Storage, interval: float = 5.0, max_dirty: int = 200):
+        self.backend = backend
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self._hist, self._tz = HistoryRing(HISTORY_KEEP), {}
+        self._complete = False      # True — в памяти всё, что есть в бэкенде
+        self._dirty_hist, self._dirty_tz = set(), set()
+        self._wake = asyncio.Event()
+        self._flushing = asyncio.Lock()  # пачки пишутся по одной: у JsonStorage общий .tmp и чтение-правка-запись
+        self._stopping = False
+        self._task = None
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        loaded = backend.load_all()
+        if loaded is not None:
+            hist, self._tz = loaded
+            self._hist = hist if isinstance(hist, HistoryRing) else HistoryRing.from_json(hist, HISTORY_KEEP)
+            self._complete = True
+
+    @property
+    def dirty(self) -> int:
+        return len(self._dirty_hist) + len(self._dirty_tz)
+
+    def _mark(self, dirty: set, chat_id: int):
+        dirty.add(chat_id)
+        if self.dirty >= self.max_dirty:
+            self._wake.set()
+
+    def history(self, chat_id: int) -> list:
+        if chat_id not in self._hist and not self._complete:
+            self._hist.set(chat_id, self.backend.history(chat_id))
+        return self._hist.history(chat_id)
+
+    def append_history(self, chat_id: int, entry: dict, keep: int = HISTORY_KEEP):
+        # в памяти кольцо на HISTORY_KEEP записей; keep меньше — просто обрезаем
+        if chat_id not in self._hist and not self._complete:
+            self._hist.set(chat_id, self.backend.history(chat_id))
+        if keep < self._hist.keep:
+            self._hist.set(chat_id, (self._hist.history(chat_id) + [entry])[-keep:])
+        else:
+            self._hist.append(chat_id, entry)
+        self._mark(self._dirty_hist, chat_id)
+
+    def get_tz(self, chat_id: int) -> str | None:
+        if chat_id not in self._tz:
+            if self._complete:
+                return None
+            self._tz[chat_id] = self.backend.get_tz(chat_id)
+        return self._tz[chat_id]
+
+    def set_tz(self, chat_id: int, tz: str):
+        self._tz[chat_id] = tz
+        self._mark(self._dirty_tz, chat_id)
+
+    # подписки меняются редко — пишем сразу в бэкенд
+    def subscriptions(self) -> dict:
+        return self.backend.subscriptions()
+
+    def set_subscription(self, chat_id: int, hour: int | None):
+        self.backend.set_subscription(chat_id, hour)
+
+    def subscribers(self) -> dict:
+        # зовут из потока: только чтение, поверх бэкенда — ещё не сброшенные тайм-зоны
+        subs = self.backend.subscribers()
+        for chat_id, (hour, tz) in subs.items():
+            if chat_id in self._dirty_tz:
+                subs[chat_id] = (hour, self._tz.get(chat_id, tz))
+        return subs
+
+    def claim_update(self, update_id: int) -> bool:
+        return self.backend.claim_update(update_id)
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        return self.backend.acquire_lease(name, owner, ttl)
+
+    def subs_version(self):
+        return self.backend.subs_version()
+
+    def add_stats(self, chat_id: int, slots: list, day: int, keep_days: int):
+        self.backend.add_stats(chat_id, slots, day, keep_days)
+
+    def stats(self, chat_id: int):
+        return self.backend.stats(chat_id)
+
+    def stats_chats(self) -> int:
+        return self.backend.stats_chats()
+
+    def media_get(self, key: str):
+        return self.backend.media_get(key)
+
+    def media_put(self, key: str, sha1: str, file_id: str):
+        self.backend.media_put(key, sha1, file_id)
+
+    def media_forget(self, key: str):
+        self.backend.media_forget(key)
+
+    def _take(self):
+        hist = {c: self._hist.history(c) for c in self._dirty_hist}
+        tzs = {c: self._tz[c] for c in self._dirty_tz}
+        self._dirty_hist, self._dirty_tz = set(), set()
+        return hist, tzs
+
+    def _restore(self, hist: dict, tzs: dict):
+        self._dirty_hist |= hist.keys()
+        self._dirty_tz |= tzs.keys()
+
+    async def flush(self):
+        async with self._flushing:
+            await self._flush()
+
+    async def _flush(self):
+        if not self.dirty:
+            return
+        hist, tzs = self._take()
+        t0 = time.perf_counter()
+        try:
+            await asyncio.to_thread(self.backend.write_batch, hist, tzs)
+        except asyncio.CancelledError:
+            # поток мог и дописать — пачка идемпотентна, лучше записать её ещё раз, чем потерять
+            self._restore(hist, tzs)
+            raise
+        except Exception as e:
+            logging.warning("state flush failed (%d chats), will retry: %s", len(hist) + len(tzs), e)
+            self._restore(hist, tzs)
+            return
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - t0) * 1000
+        STORAGE_SECONDS.observe(self.last_flush_ms / 1000, op="flush")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Не отменяем идущую запись (поток отмене не подчиняется), а дожидаемся её и сбрасываем остаток."""
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def close(self):
+        if self.dirty:
+            self.backend.write_batch(*self._take())
+        self.backend.close()
+
+# ====== Выбор бэкенда ======
+def open_storage(spec: str, data_file: str = "howls.json", tz_file: str = "tz.json",
+                 subs_file: str = "subs.json") -> Storage:
+    """spec: "json" (по умолчанию), "ring[:путь]" или "sqlite[:путь]" — тогда старый howls.json переносится один раз."""
+    kind, _, arg = (spec or "json").partition(":")
+    if kind == "json":
+        return JsonStorage(data_file, tz_file, subs_file)
+    if kind == "ring":
+        return RingStorage(arg or "howls.ring", data_file, tz_file, subs_file)
+    if kind == "sqlite":
+        st = SqliteStorage(arg or "howls.db")
+        st.migrate_from_json(data_file, tz_file)
+        return st
+    raise ValueError(f"unknown storage: {spec}")
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+# модули бота лежат в корне репозитория, плоско — даём тестам их импортировать
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+from broadcast import DailyBroadcast
+from misfortune import read_howl, render_reading
+from outbox import FanOut
+from storage import SqliteStorage
+
+UTC = timezone.utc
+PLUS3 = timezone(timedelta(hours=3))
+
+def zone(raw):
+    return PLUS3 if raw == "+3" else UTC
+
+def test_chats_with_different_salts_in_one_tick_get_their_own_reading(tmp_path):
+    store = SqliteStorage(str(tmp_path / "howls.db"))
+    for chat_id, hour in {1: 9, 2: 9, 3: 9, 4: 10}.items():
+        store.set_subscription(chat_id, hour)
+    salts = {1: 1, 2: 2, 3: 2, 4: 3}
+    sent = {}
+
+    async def send(chat_id, text, code, py, r):
+        sent[chat_id] = (text, code, py)
+
+    async def run():
+        b = DailyBroadcast(store, salts.get, zone, send, FanOut(None))
+        n = b.tick(datetime(2025, 10, 1, 9, 0, tzinfo=UTC))
+        await asyncio.gather(*b._inflight)
+        return n
+
+    assert asyncio.run(run()) == 3
+    moment = datetime(2025, 10, 1, 9, 0)
+    for chat_id in (1, 2, 3):
+        r = read_howl(moment, salt=salts[chat_id])
+        assert sent[chat_id] == (render_reading(r), r.doom["code"], r.branch_tuple[1])
+    assert sent[1] != sent[2] and 4 not in sent
+
+def test_refresh_rebuilds_only_on_subscription_or_tz_changes(tmp_path):
+    path = str(tmp_path / "howls.db")
+    store, other = SqliteStorage(path), SqliteStorage(path)   # other — соседний воркер
+    store.set_subscription(1, 9)
+    builds = []
+
+    class Counting(DailyBroadcast):
+        def _build(self):
+            builds.append(1)
+            return super()._build()
+
+    async def run():
+        b = Counting(store, lambda c: 0, zone, None, FanOut(None))
+        await b.refresh()
+        for i in range(3):
+            other.append_history(1, {"ts": f"2025-10-01T09:0{i}", "doom": "x", "lvl": 1})
+            await b.refresh()
+        assert len(builds) == 1
+        assert b._where[1] == (UTC, 9, 0)
+
+        other.set_tz(1, "+3")
+        await b.refresh()
+        assert len(builds) == 2 and b._where[1] == (PLUS3, 9, 0)
+        other.set_subscription(2, 7)
+        await b.refresh()
+        assert len(builds) == 3 and b._where[2] == (UTC, 7, 0)
+        # в 06:00 UTC в +3 наступает 9 часов
+        return [chats for _, _, chats in b.due(datetime(2025, 10, 1, 6, 0, tzinfo=UTC))]
+
+    assert asyncio.run(run()) == [[1]]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os, asyncio, threading
+from types import SimpleNamespace
+
+import cards
+from cards import CardCache, CARD_VERSION, card_key
+
+def reading(code="rain", level=3, day="子", hour="午"):
+    return SimpleNamespace(doom={"code": code}, doom_level=level,
+                           branch_tuple=("甲", day), hour_branch_tuple=("丙", hour))
+
+def test_card_key_covers_what_is_drawn():
+    assert card_key(reading()) == ("rain", 3, "子", "午")
+    assert card_key(reading(level=4)) != card_key(reading())
+    assert card_key(reading(hour="未")) != card_key(reading())
+
+def test_name_depends_on_art_content_not_path(tmp_path):
+    cache = CardCache(str(tmp_path / "cards"))
+    a, b = tmp_path / "a.png", tmp_path / "b.png"
+    a.write_bytes(b"one")
+    b.write_bytes(b"one")
+    key = card_key(reading())
+    tag = lambda c, art: asyncio.run(c._art_tag(art))
+    name = cache._name(key, tag(cache, str(a)))
+    assert name == cache._name(key, tag(cache, str(b)))
+    assert name.startswith("rain_3_子_午_") and name.endswith(f"v{CARD_VERSION}.jpg")
+    assert cache._name(key, tag(cache, None)) == f"rain_3_子_午_nonev{CARD_VERSION}.jpg"
+    assert tag(cache, str(tmp_path / "missing.png")) == "none"
+
+    other = CardCache(str(tmp_path / "cards"))
+    b.write_bytes(b"two")                    # арт поменялся — старый файл карточки не подходит
+    assert other._name(key, tag(other, str(b))) != name
+
+def test_art_is_hashed_once_and_off_the_loop(tmp_path, monkeypatch):
+    art = tmp_path / "a.png"
+    art.write_bytes(b"one")
+    threads, real = [], cards.art_tag
+
+    def counting(path):
+        threads.append(threading.current_thread())
+        return real(path)
+
+    monkeypatch.setattr(cards, "art_tag", counting)
+    cache = CardCache(str(tmp_path / "cards"))
+
+    async def run():
+        return [await cache._art_tag(str(art)) for _ in range(3)]
+
+    tags = asyncio.run(run())
+    assert len(set(tags)) == 1 and tags[0] != "none"
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
+
+def test_existing_file_is_reused_without_render(tmp_path):
+    d = tmp_path / "cards"
+    cache = CardCache(str(d))
+    r = reading()
+    name = cache._name(card_key(r), "none")
+    (d / name).write_bytes(b"jpg")
+
+    cache = CardCache(str(d))                # перезапуск: файлы подхватываются из каталога
+    path = asyncio.run(cache.get(r, None))
+    assert path == os.path.join(str(d), name)
+    assert cache.stats() == {"files": 1, "hits": 1, "renders": 0}
+    asyncio.run(cache.get(r, None))
+    assert cache.hits == 2 and cache.renders == 0
+
+def test_eviction_removes_oldest_file_and_reports_it(tmp_path):
+    d = tmp_path / "cards"
+    evicted = []
+    cache = CardCache(str(d), max_files=2, on_evict=evicted.append)
+    paths = []
+    for level in range(3):
+        r = reading(level=level)
+        name = cache._name(card_key(r), "none")
+        path = os.path.join(str(d), name)
+        with open(path, "wb") as f:
+            f.write(b"jpg")
+        cache._remember(card_key(r) + (None,), name, path)
+        paths.append(path)
+    assert evicted == [paths[0]]
+    assert not os.path.exists(paths[0]) and os.path.exists(paths[2])
+    assert cache.stats()["files"] == 2
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import history
+from history import HistoryRing, CODES
+
+def entry(i: int, doom: str = CODES[0], lvl: int = 1) -> dict:
+    return {"ts": f"2025-10-01T10:{i:02d}", "doom": doom, "lvl": lvl}
+
+def test_ring_keeps_last_entries_in_order():
+    ring = HistoryRing(keep=3)
+    for i in range(7):
+        ring.append(1, entry(i))
+    assert ring.history(1) == [entry(4), entry(5), entry(6)]
+
+def test_set_then_append_wraps_around():
+    ring = HistoryRing(keep=3)
+    ring.set(1, [entry(0), entry(1), entry(2), entry(3)])
+    assert ring.history(1) == [entry(1), entry(2), entry(3)]
+    ring.append(1, entry(4))
+    assert ring.history(1) == [entry(2), entry(3), entry(4)]
+
+def test_chats_do_not_share_slots():
+    ring = HistoryRing(keep=2)
+    ring.append(1, entry(1))
+    ring.append(2, entry(2, lvl=4))
+    ring.append(1, entry(3))
+    assert ring.history(1) == [entry(1), entry(3)]
+    assert ring.history(2) == [entry(2, lvl=4)]
+    assert ring.history(3) == [] and 3 not in ring
+
+def test_unencodable_entry_goes_loose_and_slot_is_reused():
+    ring = HistoryRing(keep=3)
+    ring.append(1, entry(1))
+    size = len(ring._buf)
+    ring.append(1, {"ts": "2025-10-01T10:02:30", "doom": CODES[0], "lvl": 1})
+    assert ring.history(1)[0] == entry(1) and len(ring.history(1)) == 2
+    ring.append(2, entry(5))
+    assert len(ring._buf) == size            # новый чат занял освобождённый слот
+    assert ring.history(2) == [entry(5)]
+
+def test_dumps_loads_roundtrip():
+    ring = HistoryRing(keep=3)
+    for i in range(5):
+        ring.append(1, entry(i))
+    ring.append(-100, entry(9, doom=CODES[-1], lvl=7))
+    ring.set(2, [{"ts": "bad", "doom": "???", "lvl": 1}])
+    back = HistoryRing.loads(ring.dumps())
+    assert back.keep == 3
+    assert back.to_json() == ring.to_json()
+
+def test_loads_remaps_when_codes_changed(monkeypatch):
+    ring = HistoryRing(keep=3)
+    ring.append(1, entry(1, doom=CODES[0]))
+    ring.append(1, entry(2, doom=CODES[1]))
+    data = ring.dumps()
+    # в новой версии список несчастий переставлен: индексы в файле уже не те
+    shuffled = list(reversed(CODES))
+    monkeypatch.setattr(history, "CODES", shuffled)
+    monkeypatch.setattr(history, "_CODE_INDEX", {c: i for i, c in enumerate(shuffled)})
+    back = HistoryRing.loads(data)
+    assert back.history(1) == [entry(1, doom=CODES[0]), entry(2, doom=CODES[1])]
+    assert HistoryRing.loads(back.dumps()).to_json() == back.to_json()
+
+def test_loads_rejects_foreign_data():
+    with pytest.raises(ValueError):
+        HistoryRing.loads(b"{}")
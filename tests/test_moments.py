@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+import pytest
+
+from moments import parse_moment
+
+NOW = datetime(2025, 10, 15, 13, 47, 21, 500)
+
+@pytest.mark.parametrize("text, expected", [
+    ("2025-10-01 14:30", datetime(2025, 10, 1, 14, 30)),
+    ("2025-10-01T14:30", datetime(2025, 10, 1, 14, 30)),
+    ("2025-10-01", datetime(2025, 10, 1)),
+    ("01.10.2025 14:30", datetime(2025, 10, 1, 14, 30)),
+    ("01.10.25", datetime(2025, 10, 1)),
+    ("1.2", datetime(2025, 2, 1)),                       # без года — текущий
+    ("14:30", datetime(2025, 10, 15, 14, 30)),           # только время — сегодня
+    ("  9:05 ", datetime(2025, 10, 15, 9, 5)),
+])
+def test_absolute_and_partial_dates(text, expected):
+    assert parse_moment(text, NOW) == expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("сейчас", datetime(2025, 10, 15, 13, 47)),
+    ("Сегодня", datetime(2025, 10, 15)),
+    ("вчера в 23:10", datetime(2025, 10, 14, 23, 10)),
+    ("позавчера", datetime(2025, 10, 13)),
+    ("завтра, 08:00", datetime(2025, 10, 16, 8, 0)),
+    ("послезавтра 7:15", datetime(2025, 10, 17, 7, 15)),
+    ("через 2 часа", datetime(2025, 10, 15, 15, 47)),
+    ("через 90 минут", datetime(2025, 10, 15, 15, 17)),
+    ("через 1 день", datetime(2025, 10, 16, 13, 47)),
+    ("15 минут назад", datetime(2025, 10, 15, 13, 32)),
+    ("3 дня назад", datetime(2025, 10, 12, 13, 47)),
+])
+def test_relative_moments(text, expected):
+    assert parse_moment(text, NOW) == expected
+
+def test_relative_crosses_month_and_year():
+    now = datetime(2025, 12, 31, 23, 50)
+    assert parse_moment("завтра в 00:10", now) == datetime(2026, 1, 1, 0, 10)
+    assert parse_moment("через 20 мин", now) == datetime(2026, 1, 1, 0, 10)
+
+@pytest.mark.parametrize("text", [
+    "", "   ", "привет", "31.02", "2025-13-01", "25:00", "14:60",
+    "сейчас 14:30",            # «сейчас» со временем — противоречие
+    "через 2 часа 14:30",      # сдвиг и время сразу — непонятно, что имелось в виду
+    "через часа", "10 минут",
+])
+def test_rejects_non_moments(text):
+    assert parse_moment(text, NOW) is None
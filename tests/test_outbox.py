@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from outbox import OutboundLimiter, OutboxDropped, OutboxFull, send_policy
+
+def limiter(**kw) -> OutboundLimiter:
+    # в личку — одно сообщение сразу, следующее через PRIVATE_INTERVAL: остальные ждут в очереди
+    return OutboundLimiter(global_rate=100, private_burst=1, **kw)
+
+async def send(lim, sent, n, chat_id=1, endpoint="sendMessage"):
+    async def callback():
+        sent.append(n)
+        return n
+    return await lim.process_request(callback, (), {}, endpoint, {"chat_id": chat_id}, None)
+
+async def gather(*coros):
+    return await asyncio.gather(*coros, return_exceptions=True)
+
+def test_coalesce_sends_only_latest_waiting():
+    async def run():
+        lim, sent = limiter(), []
+        with send_policy(coalesce=("howl_now", 1)):
+            tasks = [asyncio.create_task(send(lim, sent, n)) for n in range(4)]
+        return lim, sent, await gather(*tasks)
+
+    lim, sent, results = asyncio.run(run())
+    # первый ушёл сразу; из ждущих 1..3 нужен только последний
+    assert sent == [0, 3]
+    assert results[0] == 0 and results[3] == 3
+    assert [r.reason for r in results[1:3]] == ["coalesced", "coalesced"]
+    assert lim._latest == {} and lim.depth == 0
+
+def test_coalesce_keys_are_independent():
+    async def run():
+        lim, sent = limiter(), []
+        tasks = []
+        for n, chat in enumerate((1, 2, 1, 2)):
+            with send_policy(coalesce=("howl_now", chat)):
+                tasks.append(asyncio.create_task(send(lim, sent, n, chat_id=chat)))
+        return sent, await gather(*tasks)
+
+    sent, results = asyncio.run(run())
+    assert sorted(sent) == [0, 1, 2, 3]
+    assert not any(isinstance(r, Exception) for r in results)
+
+def test_stale_request_is_dropped_and_token_refunded():
+    async def run():
+        lim, sent = limiter(), []
+        first = asyncio.create_task(send(lim, sent, 0))
+        with send_policy(stale=0.2):
+            late = asyncio.create_task(send(lim, sent, 1))
+        results = await gather(first, late)
+        # токен просроченного вернулся в ведро чата: следующее сообщение не ждёт ещё секунду
+        t0 = asyncio.get_running_loop().time()
+        await send(lim, sent, 2)
+        return sent, results, asyncio.get_running_loop().time() - t0
+
+    sent, results, waited = asyncio.run(run())
+    assert sent == [0, 2]
+    assert isinstance(results[1], OutboxDropped) and results[1].reason == "stale"
+    assert waited < 0.5
+
+def test_fresh_request_within_stale_is_sent():
+    async def run():
+        lim, sent = limiter(), []
+        with send_policy(stale=5):
+            return sent, await gather(send(lim, sent, 0), send(lim, sent, 1))
+
+    sent, results = asyncio.run(run())
+    assert sent == [0, 1] and results == [0, 1]
+
+def test_non_message_endpoints_skip_the_queue():
+    async def run():
+        lim, sent = limiter(max_pending=0), []
+        return sent, await send(lim, sent, 7, endpoint="answerCallbackQuery")
+
+    assert asyncio.run(run()) == ([7], 7)
+
+def test_full_queue_raises_outbox_full():
+    async def run():
+        lim, sent = limiter(max_pending=0), []
+        with pytest.raises(OutboxFull):
+            await send(lim, sent, 0)
+        return sent
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Свой HTTP-сервер вместо app.run_webhook: тот же вебхук плюс календарные фиды /ics/<token>.ics."""
+import os, json, hmac, base64, signal, asyncio, hashlib, logging
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import tornado.web
+import tornado.httpserver
+from telegram import Update
+
+import misfortune
+from misfortune import iter_ics, MISFORTUNES, TABOOS
+from metrics import REGISTRY, UPDATES_DUPLICATE
+
+# ====== Вебхук ======
+class WebhookHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ("POST",)
+
+    def initialize(self, app, claim=None):
+        self.app = app
+        self.claim = claim  # update_id -> bool: общий для воркеров учёт уже взятых апдейтов
+
+    async def post(self):
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.app.bot)
+        except Exception as e:
+            logging.error("bad webhook payload: %s", e)
+            raise tornado.web.HTTPError(400)
+        if not update:
+            return
+        if self.claim is not None and not self.claim(update.update_id):
+            UPDATES_DUPLICATE.inc()
+            return  # повторная доставка, уже обработал другой воркер (или мы сами)
+        await self.app.update_queue.put(update)
+
+# ====== Календарные фиды ======
+# содержимое фида зависит только от ключа и от текстов несчастий/табу
+_DATA_HASH = hashlib.sha1(json.dumps([MISFORTUNES, TABOOS], ensure_ascii=False).encode()).hexdigest()[:12]
+_DATA_MTIME = datetime.fromtimestamp(int(os.path.getmtime(misfortune.__file__)), tz=timezone.utc)
+
+class IcsFeeds:
+    """Токены фидов (chat_id + HMAC) и LRU уже закодированных календарей."""
+
+    def __init__(self, secret: bytes, resolve, max_entries: int = 32, years: int = 2):
+        self.secret = secret
+        self.resolve = resolve          # chat_id -> (salt, tzinfo, tzid | None)
+        self.max_entries = max_entries
+        self.years = years
+        self._cache = OrderedDict()     # key -> bytes
+
+    def _sig(self, chat_id: int) -> str:
+        mac = hmac.new(self.secret, str(chat_id).encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(mac[:12]).decode()
+
+    def token(self, chat_id: int) -> str:
+        return f"{chat_id}.{self._sig(chat_id)}"
+
+    def chat_id(self, token: str) -> int | None:
+        raw, _, sig = token.rpartition(".")
+        try:
+            chat_id = int(raw)
+        except ValueError:
+            return None
+        return chat_id if hmac.compare_digest(sig, self._sig(chat_id)) else None
+
+    def key(self, chat_id: int, years: int | None = None):
+        salt, tzinfo, tzid = self.resolve(chat_id)
+        year = datetime.now(tz=tzinfo).year
+        return (salt, tzid, date(year, 1, 1), date(year + (years or self.years), 1, 1))
+
+    @staticmethod
+    def etag(key) -> str:
+        salt, tzid, start, stop = key
+        return '"' + hashlib.sha1(f"{_DATA_HASH}|{salt}|{tzid}|{start}|{stop}".encode()).hexdigest()[:20] + '"'
+
+    @staticmethod
+    def last_modified(key) -> datetime:
+        start = key[2]
+        return max(_DATA_MTIME, datetime(start.year, 1, 1, tzinfo=timezone.utc))
+
+    def get(self, key) -> bytes | None:
+        body = self._cache.get(key)
+        if body is not None:
+            self._cache.move_to_end(key)
+        return body
+
+    def put(self, key, body: bytes):
+        self._cache[key] = body
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def chunks(self, key, lines_per_chunk: int = 700):
+        """Кодированные куски календаря (CRLF, как требует RFC 5545) — для отдачи потоком."""
+        salt, tzid, start, stop = key
+        buf = []
+        for line in iter_ics(start, stop, salt, tzid):
+            buf.append(line)
+            if len(buf) >= lines_per_chunk:
+                yield ("\r\n".join(buf) + "\r\n").encode("utf-8")
+                buf = []
+        if buf:
+            yield ("\r\n".join(buf) + "\r\n").encode("utf-8")
+
+class IcsHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ("GET", "HEAD")
+
+    def initialize(self, feeds: IcsFeeds):
+        self.feeds = feeds
+
+    def _not_modified(self, etag: str, modified: datetime) -> bool:
+        inm = self.request.headers.get("If-None-Match")
+        if inm is not None:
+            return inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]
+        ims = self.request.headers.get("If-Modified-Since")
+        if ims:
+            try:
+                return parsedate_to_datetime(ims) >= modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def get(self, token: str):
+        chat_id = self.feeds.chat_id(token)
+        if chat_id is None:
+            raise tornado.web.HTTPError(404)
+        try:
+            years = min(max(int(self.get_query_argument("years", "0")), 0), 10)
+        except ValueError:
+            years = 0
+        key = self.feeds.key(chat_id, years)
+        etag, modified = self.feeds.etag(key), self.feeds.last_modified(key)
+        self.set_header("ETag", etag)
+        self.set_header("Last-Modified", format_datetime(modified, usegmt=True))
+        # лента личная (токен чата в URL) — общим прокси её не кэшировать
+        self.set_header("Cache-Control", "private, max-age=3600")
+        self.set_header("Content-Type", "text/calendar; charset=utf-8")
+        if self._not_modified(etag, modified):
+            self.set_status(304)
+            return
+        body = self.feeds.get(key)
+        if body is not None:
+            self.set_header("Content-Length", len(body))
+            if self.request.method != "HEAD":
+                self.write(body)
+            return
+        if self.request.method == "HEAD":
+            return
+        parts = []
+        for chunk in self.feeds.chunks(key):
+            parts.append(chunk)
+            self.write(chunk)
+            await self.flush()
+        self.feeds.put(key, b"".join(parts))
+
+    head = get
+
+# ====== Метрики ======
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(REGISTRY.render())
+
+# ====== Запуск ======
+def make_web_app(app, url_path: str, feeds: IcsFeeds | None = None, extra_routes=(),
+                 metrics: bool = True, claim=None) -> tornado.web.Application:
+    routes = [(rf"/{url_path}/?", WebhookHandler, {"app": app, "claim": claim})]
+    if feeds is not None:
+        routes.append((r"/ics/([^/]+)\.ics", IcsHandler, {"feeds": feeds}))
+    if metrics:
+        routes.append((r"/metrics", MetricsHandler))
+    routes += list(extra_routes)
+    return tornado.web.Application(routes)
+
+def run_webhook(app, web: tornado.web.Application, listen: str, port: int, webhook_url: str,
+                sockets=None, set_webhook: bool = True):
+    """Как Application.run_webhook: те же post_init/post_stop/post_shutdown, но на нашем tornado-приложении.
+
+    sockets — заранее открытые (до fork) сокеты, общие для нескольких воркеров;
+    set_webhook=False — вебхук регистрирует другой воркер."""
+    async def _main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        if sockets:
+            server = tornado.httpserver.HTTPServer(web)
+            server.add_sockets(sockets)
+        else:
+            server = web.listen(port, listen)
+        await app.initialize()
+        try:
+            if app.post_init:
+                await app.post_init(app)
+            await app.start()
+            # после start: апдейты, пришедшие на уже настроенный вебхук, обрабатываются сразу
+            if set_webhook:
+                await app.bot.set_webhook(url=webhook_url)
+            await stop.wait()
+        finally:
+            server.stop()
+            if app.running:
+                await app.stop()
+                if app.post_stop:
+                    await app.post_stop(app)
+            await app.shutdown()
+            if app.post_shutdown:
+                await app.post_shutdown(app)
+    asyncio.run(_main())